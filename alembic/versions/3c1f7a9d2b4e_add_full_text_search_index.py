@@ -0,0 +1,91 @@
+"""Add full-text search index
+
+Revision ID: 3c1f7a9d2b4e
+Revises: 9294fad3ea8f
+Create Date: 2026-10-17 09:12:31.402118
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1f7a9d2b4e"
+down_revision: Union[str, Sequence[str], None] = "9294fad3ea8f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        # Trigram FTS5 table kept in sync with snippet by triggers
+        op.execute(
+            """
+            CREATE VIRTUAL TABLE snippet_fts USING fts5(
+                title, code, description, tags,
+                content='snippet', content_rowid='id', tokenize='trigram'
+            )
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER snippet_fts_ai AFTER INSERT ON snippet BEGIN
+                INSERT INTO snippet_fts(rowid, title, code, description, tags)
+                VALUES (new.id, new.title, new.code, new.description, new.tags);
+            END
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER snippet_fts_ad AFTER DELETE ON snippet BEGIN
+                INSERT INTO snippet_fts(snippet_fts, rowid, title, code, description, tags)
+                VALUES ('delete', old.id, old.title, old.code, old.description, old.tags);
+            END
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER snippet_fts_au AFTER UPDATE ON snippet BEGIN
+                INSERT INTO snippet_fts(snippet_fts, rowid, title, code, description, tags)
+                VALUES ('delete', old.id, old.title, old.code, old.description, old.tags);
+                INSERT INTO snippet_fts(rowid, title, code, description, tags)
+                VALUES (new.id, new.title, new.code, new.description, new.tags);
+            END
+            """
+        )
+        # Index the rows that already exist
+        op.execute("INSERT INTO snippet_fts(snippet_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX ix_snippet_title_trgm ON snippet USING gin (title gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX ix_snippet_code_trgm ON snippet USING gin (code gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX ix_snippet_description_trgm "
+            "ON snippet USING gin (description gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX ix_snippet_tags_trgm "
+            "ON snippet USING gin ((CAST(tags AS TEXT)) gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS snippet_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS snippet_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS snippet_fts_ai")
+        op.execute("DROP TABLE IF EXISTS snippet_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_snippet_tags_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_snippet_description_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_snippet_code_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_snippet_title_trgm")
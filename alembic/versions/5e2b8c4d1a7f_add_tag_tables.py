@@ -0,0 +1,81 @@
+"""Add tag tables
+
+Revision ID: 5e2b8c4d1a7f
+Revises: 3c1f7a9d2b4e
+Create Date: 2026-10-17 11:40:08.517930
+
+"""
+
+import json
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2b8c4d1a7f"
+down_revision: Union[str, Sequence[str], None] = "3c1f7a9d2b4e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    tag = op.create_table(
+        "tag",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tag_name", "tag", ["name"], unique=True)
+    snippet_tag = op.create_table(
+        "snippet_tag",
+        sa.Column("snippet_id", sa.Integer(), nullable=False),
+        sa.Column("tag_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["snippet_id"], ["snippet.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tag_id"], ["tag.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("snippet_id", "tag_id"),
+    )
+    op.create_index(
+        "ix_snippet_tag_tag_id_snippet_id", "snippet_tag", ["tag_id", "snippet_id"]
+    )
+
+    # Backfill from the JSON column, normalizing the copy kept there as well
+    bind = op.get_bind()
+    snippet = sa.table("snippet", sa.column("id"), sa.column("tags", sa.JSON()))
+    tag_ids: dict[str, int] = {}
+    links: list[dict[str, int]] = []
+    rows = bind.execute(sa.select(snippet.c.id, snippet.c.tags)).all()
+    for snippet_id, tags in rows:
+        if isinstance(tags, str):
+            tags = json.loads(tags)
+        names = list(dict.fromkeys(t.strip().lower() for t in tags or []))
+        names = [name for name in names if name]
+        if names != (tags or []):
+            bind.execute(
+                snippet.update().where(snippet.c.id == snippet_id).values(tags=names)
+            )
+        for name in names:
+            if name not in tag_ids:
+                tag_ids[name] = len(tag_ids) + 1
+            links.append({"snippet_id": snippet_id, "tag_id": tag_ids[name]})
+
+    names = [{"id": id_, "name": name} for name, id_ in tag_ids.items()]
+    for start in range(0, len(names), BATCH_SIZE):
+        op.bulk_insert(tag, names[start : start + BATCH_SIZE])
+    for start in range(0, len(links), BATCH_SIZE):
+        op.bulk_insert(snippet_tag, links[start : start + BATCH_SIZE])
+    if bind.dialect.name == "postgresql" and tag_ids:
+        # Explicit ids leave the sequence behind
+        op.execute("SELECT setval('tag_id_seq', (SELECT max(id) FROM tag))")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_snippet_tag_tag_id_snippet_id", table_name="snippet_tag")
+    op.drop_table("snippet_tag")
+    op.drop_index("ix_tag_name", table_name="tag")
+    op.drop_table("tag")
@@ -0,0 +1,35 @@
+"""Add snippet version counter
+
+Revision ID: 7a4d2e9c5b13
+Revises: 5e2b8c4d1a7f
+Create Date: 2026-10-17 14:05:52.208716
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7a4d2e9c5b13"
+down_revision: Union[str, Sequence[str], None] = "5e2b8c4d1a7f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    snippet_version = op.create_table(
+        "snippet_version",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.bulk_insert(snippet_version, [{"id": 1, "version": 0}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("snippet_version")
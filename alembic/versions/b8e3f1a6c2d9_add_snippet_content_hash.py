@@ -0,0 +1,71 @@
+"""Add snippet content hash
+
+Revision ID: b8e3f1a6c2d9
+Revises: 7a4d2e9c5b13
+Create Date: 2026-10-17 16:22:41.093518
+
+"""
+
+import hashlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b8e3f1a6c2d9"
+down_revision: Union[str, Sequence[str], None] = "7a4d2e9c5b13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def _content_hash(code: str, language: str) -> str:
+    # A copy of snipster.dedupe.content_hash as of this revision, so later
+    # changes to it don't change what this migration writes
+    content = f"{language.lower()}\0{' '.join(code.split())}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("snippet", sa.Column("content_hash", sa.String(), nullable=True))
+
+    # Backfill before indexing, so the index is built once
+    bind = op.get_bind()
+    snippet = sa.table(
+        "snippet",
+        sa.column("id"),
+        sa.column("code"),
+        sa.column("language"),
+        sa.column("content_hash"),
+    )
+    stmt = (
+        sa.select(snippet.c.id, snippet.c.code, snippet.c.language)
+        .order_by(snippet.c.id)
+        .limit(BATCH_SIZE)
+    )
+    update = (
+        snippet.update()
+        .where(snippet.c.id == sa.bindparam("snippet_id"))
+        .values(content_hash=sa.bindparam("hash"))
+    )
+    last_id = 0
+    while rows := bind.execute(stmt.where(snippet.c.id > last_id)).all():
+        bind.execute(
+            update,
+            [
+                {"snippet_id": id_, "hash": _content_hash(code, language)}
+                for id_, code, language in rows
+            ],
+        )
+        last_id = rows[-1].id
+    op.create_index("ix_snippet_content_hash", "snippet", ["content_hash"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_snippet_content_hash", table_name="snippet")
+    op.drop_column("snippet", "content_hash")
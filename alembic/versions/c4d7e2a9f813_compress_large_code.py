@@ -0,0 +1,113 @@
+"""Compress large code bodies
+
+Revision ID: c4d7e2a9f813
+Revises: b8e3f1a6c2d9
+Create Date: 2026-10-17 18:47:13.552106
+
+"""
+
+import hashlib
+import zlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d7e2a9f813"
+down_revision: Union[str, Sequence[str], None] = "b8e3f1a6c2d9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows converted per round trip; large ones, so fewer than usual
+BATCH_SIZE = 100
+
+# Copies of snipster.code_blobs as of this revision, so later changes to it
+# don't change what this migration writes
+COMPRESS_THRESHOLD = 64 * 1024
+HEAD_LENGTH = 4096
+COMPRESSION_LEVEL = 6
+
+snippet = sa.table(
+    "snippet",
+    sa.column("id", sa.Integer()),
+    sa.column("code", sa.String()),
+    sa.column("code_blob", sa.String()),
+)
+code_blob = sa.table(
+    "code_blob", sa.column("digest", sa.String()), sa.column("data", sa.LargeBinary())
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "code_blob",
+        sa.Column("digest", sa.String(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    op.add_column("snippet", sa.Column("code_blob", sa.String(), nullable=True))
+
+    # Move large bodies out in id order, a batch per round trip. The update
+    # fires the full-text triggers, which reindex the rows with the head only
+    bind = op.get_bind()
+    stmt = (
+        sa.select(snippet.c.id, snippet.c.code)
+        .where(sa.func.length(snippet.c.code) > COMPRESS_THRESHOLD)
+        .order_by(snippet.c.id)
+        .limit(BATCH_SIZE)
+    )
+    update = (
+        snippet.update()
+        .where(snippet.c.id == sa.bindparam("snippet_id"))
+        .values(code=sa.bindparam("head"), code_blob=sa.bindparam("digest"))
+    )
+    stored: set[str] = set()
+    last_id = 0
+    while rows := bind.execute(stmt.where(snippet.c.id > last_id)).all():
+        blobs, updates = [], []
+        for id_, code in rows:
+            digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+            if digest not in stored:
+                stored.add(digest)
+                data = zlib.compress(code.encode("utf-8"), COMPRESSION_LEVEL)
+                blobs.append({"digest": digest, "data": data})
+            updates.append(
+                {"snippet_id": id_, "head": code[:HEAD_LENGTH], "digest": digest}
+            )
+        if blobs:
+            bind.execute(code_blob.insert(), blobs)
+        bind.execute(update, updates)
+        last_id = rows[-1].id
+    op.create_index("ix_snippet_code_blob", "snippet", ["code_blob"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    stmt = (
+        sa.select(snippet.c.id, code_blob.c.data)
+        .join(code_blob, code_blob.c.digest == snippet.c.code_blob)
+        .order_by(snippet.c.id)
+        .limit(BATCH_SIZE)
+    )
+    update = (
+        snippet.update()
+        .where(snippet.c.id == sa.bindparam("snippet_id"))
+        .values(code=sa.bindparam("full_code"), code_blob=None)
+    )
+    last_id = 0
+    while rows := bind.execute(stmt.where(snippet.c.id > last_id)).all():
+        bind.execute(
+            update,
+            [
+                {"snippet_id": id_, "full_code": zlib.decompress(data).decode("utf-8")}
+                for id_, data in rows
+            ],
+        )
+        last_id = rows[-1].id
+    op.drop_index("ix_snippet_code_blob", table_name="snippet")
+    op.drop_column("snippet", "code_blob")
+    op.drop_table("code_blob")
@@ -0,0 +1,139 @@
+"""Drop the uncompressed copy of compressed code
+
+Revision ID: e8a3c6f1b2d4
+Revises: d2f6a8c1e4b7
+Create Date: 2026-10-17 23:52:40.107415
+
+"""
+
+import zlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e8a3c6f1b2d4"
+down_revision: Union[str, Sequence[str], None] = "d2f6a8c1e4b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Blobs decompressed per round trip on downgrade; large ones, so fewer than usual
+BATCH_SIZE = 100
+
+code_blob = sa.table(
+    "code_blob",
+    sa.column("digest", sa.String()),
+    sa.column("data", sa.LargeBinary()),
+    sa.column("text", sa.Text()),
+)
+
+# Copies of snipster.fts as of this revision and the one before, so later
+# changes to it don't change what this migration writes
+FULL_CODE = (
+    "coalesce((SELECT text FROM code_blob WHERE digest = {row}.code_blob), {row}.code)"
+)
+
+
+def _triggers(new_code: str, old_code: str) -> list[str]:
+    return [
+        f"""
+        CREATE TRIGGER snippet_fts_ai AFTER INSERT ON snippet BEGIN
+            INSERT INTO snippet_fts(rowid, title, code, description, tags)
+            VALUES (new.id, new.title, {new_code}, new.description, new.tags);
+        END
+        """,
+        f"""
+        CREATE TRIGGER snippet_fts_ad AFTER DELETE ON snippet BEGIN
+            INSERT INTO snippet_fts(snippet_fts, rowid, title, code, description, tags)
+            VALUES ('delete', old.id, old.title, {old_code}, old.description, old.tags);
+        END
+        """,
+        f"""
+        CREATE TRIGGER snippet_fts_au AFTER UPDATE ON snippet BEGIN
+            INSERT INTO snippet_fts(snippet_fts, rowid, title, code, description, tags)
+            VALUES ('delete', old.id, old.title, {old_code}, old.description, old.tags);
+            INSERT INTO snippet_fts(rowid, title, code, description, tags)
+            VALUES (new.id, new.title, {new_code}, new.description, new.tags);
+        END
+        """,
+    ]
+
+
+def _replace_triggers(new_code: str, old_code: str) -> None:
+    for name in ("snippet_fts_au", "snippet_fts_ad", "snippet_fts_ai"):
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for statement in _triggers(new_code, old_code):
+        op.execute(statement)
+
+
+def _reindex_compressed(indexed: str, code: str) -> None:
+    """Swap the indexed code of compressed rows from ``indexed`` to ``code``."""
+    op.execute(
+        f"""
+        INSERT INTO snippet_fts(snippet_fts, rowid, title, code, description, tags)
+        SELECT 'delete', snippet.id, snippet.title, {indexed},
+               snippet.description, snippet.tags
+        FROM snippet JOIN code_blob ON code_blob.digest = snippet.code_blob
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO snippet_fts(rowid, title, code, description, tags)
+        SELECT snippet.id, snippet.title, {code}, snippet.description, snippet.tags
+        FROM snippet JOIN code_blob ON code_blob.digest = snippet.code_blob
+        """
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _reindex_compressed("code_blob.text", "snippet.code")
+        _replace_triggers("new.code", "old.code")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_code_blob_text_trgm")
+    with op.batch_alter_table("code_blob") as batch_op:
+        batch_op.drop_column("text")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column("code_blob", sa.Column("text", sa.Text(), nullable=True))
+
+    # Fill the text back in, a batch per round trip
+    bind = op.get_bind()
+    stmt = (
+        sa.select(code_blob.c.digest, code_blob.c.data)
+        .order_by(code_blob.c.digest)
+        .limit(BATCH_SIZE)
+    )
+    update = (
+        code_blob.update()
+        .where(code_blob.c.digest == sa.bindparam("blob_digest"))
+        .values(text=sa.bindparam("full_code"))
+    )
+    last_digest = ""
+    while rows := bind.execute(stmt.where(code_blob.c.digest > last_digest)).all():
+        bind.execute(
+            update,
+            [
+                {"blob_digest": digest, "full_code": zlib.decompress(data).decode()}
+                for digest, data in rows
+            ],
+        )
+        last_digest = rows[-1].digest
+    with op.batch_alter_table("code_blob") as batch_op:
+        batch_op.alter_column("text", existing_type=sa.Text(), nullable=False)
+
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        _replace_triggers(FULL_CODE.format(row="new"), FULL_CODE.format(row="old"))
+        _reindex_compressed("snippet.code", "code_blob.text")
+    elif dialect == "postgresql":
+        op.execute(
+            "CREATE INDEX ix_code_blob_text_trgm "
+            "ON code_blob USING gin (text gin_trgm_ops)"
+        )
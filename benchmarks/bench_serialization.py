@@ -0,0 +1,91 @@
+"""Compare the API's old and new JSON paths for a large snippet listing.
+
+"before" is FastAPI's default: validate every row against the response
+model, ``jsonable_encoder`` it and encode with the stdlib ``json``. "after"
+dumps the rows once with pydantic and encodes them with orjson. Sizes are
+the bytes on the wire for each encoding the server can negotiate.
+
+    python -m benchmarks.bench_serialization --rows 1000
+"""
+
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from src.snipster.api import _list_adapter
+from src.snipster.compression import brotli
+from src.snipster.models import Language, Snippet
+
+
+def make_snippets(rows: int) -> list[Snippet]:
+    now = datetime.now(timezone.utc)
+    code = "def handler(event):\n    return {'status': event['status']}\n" * 40
+    return [
+        Snippet(
+            id=i,
+            title=f"Snippet {i}",
+            code=code,
+            description="A handler that echoes the event status",
+            language=Language.python,
+            tags=["python", "handlers"],
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(1, rows + 1)
+    ]
+
+
+def before(snippets: list[Snippet]) -> bytes:
+    validated = _list_adapter(Snippet).validate_python(
+        [s.model_dump() for s in snippets]
+    )
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def after(snippets: list[Snippet]) -> bytes:
+    content = _list_adapter(Snippet).dump_python(snippets, mode="json")
+    return ORJSONResponse(content).body
+
+
+def best_of(fn, snippets: list[Snippet], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(snippets)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def sizes(body: bytes) -> dict[str, int]:
+    result = {"identity": len(body), "gzip": len(gzip.compress(body, 6))}
+    if brotli is not None:
+        result["br"] = len(brotli.compress(body, quality=4))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    snippets = make_snippets(args.rows)
+    assert json.loads(before(snippets)) == json.loads(after(snippets))
+    report = {
+        "rows": args.rows,
+        "seconds": {
+            "before": best_of(before, snippets, args.repeat),
+            "after": best_of(after, snippets, args.repeat),
+        },
+        "bytes": sizes(after(snippets)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
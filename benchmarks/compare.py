@@ -0,0 +1,84 @@
+"""Compare two ``benchmarks.run`` reports operation by operation.
+
+    python -m benchmarks.compare before.json after.json --threshold 1.25
+
+Prints the p50 of each operation in both runs and their ratio, and the SQL
+statements per operation where that changed. Exits with status 1 if any
+operation got slower by more than ``--threshold`` times or runs more
+statements than before.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Sequence
+
+
+def load(path: Path) -> tuple[dict[str, Any], dict[tuple, dict[str, Any]]]:
+    report = json.loads(path.read_text())
+    results = {(r["target"], r["size"], r["operation"]): r for r in report["results"]}
+    return report["environment"], results
+
+
+def compare(
+    before: dict[tuple, dict[str, Any]],
+    after: dict[tuple, dict[str, Any]],
+    stat: str = "p50_ms",
+) -> list[tuple[tuple, float, float, float]]:
+    """``(key, before, after, after / before)`` for operations in both runs."""
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key][stat], after[key][stat]
+        rows.append((key, old, new, new / old if old else float("inf")))
+    return rows
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument(
+        "--stat", default="p50_ms", choices=("mean_ms", "p50_ms", "p95_ms", "min_ms")
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Slowdown ratio that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    before_env, before = load(args.before)
+    after_env, after = load(args.after)
+    print(f"before: {before_env['commit']}  after: {after_env['commit']}")
+    print(
+        f"{'target':<8}{'size':>8}  {'operation':<20}"
+        f"{'before':>12}{'after':>12}{'ratio':>8}"
+    )
+    regressions = 0
+    for key, old, new, ratio in compare(before, after, args.stat):
+        target, size, operation = key
+        flag = ""
+        if ratio > args.threshold:
+            regressions += 1
+            flag = "  slower"
+        old_queries = before[key].get("queries_per_op")
+        new_queries = after[key].get("queries_per_op")
+        if old_queries is not None and new_queries is not None:
+            if new_queries > old_queries:
+                regressions += 1
+                flag += f"  queries {old_queries} -> {new_queries}"
+            elif new_queries < old_queries:
+                flag += f"  queries {old_queries} -> {new_queries}"
+        print(
+            f"{target:<8}{size:>8}  {operation:<20}"
+            f"{old:>12.3f}{new:>12.3f}{ratio:>8.2f}{flag}"
+        )
+    if regressions:
+        print(f"{regressions} regression(s): slower than {args.threshold}x or more SQL")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
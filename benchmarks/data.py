@@ -0,0 +1,96 @@
+"""Synthetic snippets for benchmarking, reproducible from a seed."""
+
+import random
+from dataclasses import dataclass, field
+
+from src.snipster.models import Language, SnippetCreate
+
+WORDS = (
+    "parse cache fetch merge stream retry token buffer socket queue worker "
+    "config render filter reduce index batch client server handler router "
+    "encode decode schema record cursor session logger metric timer thread"
+).split()
+
+TAGS = (
+    "utils async io http json testing cli database regex strings sorting "
+    "recursion iterators errors logging math dates files network security "
+    "performance concurrency parsing templates beginner advanced"
+).split()
+
+# One line of code per language, filled in with generated identifiers
+CODE_LINES = {
+    Language.python: "    {a} = {b}({c}, retries={n})",
+    Language.javascript: "  const {a} = await {b}({c}, {{ retries: {n} }});",
+    Language.rust: "    let {a} = {b}(&{c}, {n})?;",
+}
+
+
+@dataclass
+class DataSpec:
+    """What the generated snippets look like.
+
+    Tags are drawn with Zipf-like weights, so a few are common and most are
+    rare, the way real tag clouds are. ``tag_skew`` of 0 makes them uniform.
+    """
+
+    languages: tuple[str, ...] = tuple(language.value for language in Language)
+    tags: tuple[str, ...] = tuple(TAGS)
+    tags_per_snippet: tuple[int, int] = (0, 4)
+    tag_skew: float = 1.1
+    code_lines: tuple[int, int] = (3, 40)
+    described: float = 0.7
+    favorite: float = 0.1
+    seed: int = 0
+    _tag_weights: list[float] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._tag_weights = [
+            1 / (rank**self.tag_skew) for rank in range(1, len(self.tags) + 1)
+        ]
+
+
+def _identifier(rng: random.Random) -> str:
+    return "_".join(rng.sample(WORDS, 2))
+
+
+def _code(rng: random.Random, language: str, lines: int) -> str:
+    template = CODE_LINES[Language(language)]
+    return "\n".join(
+        template.format(a=_identifier(rng), b=_identifier(rng), c=_identifier(rng), n=i)
+        for i in range(lines)
+    )
+
+
+def generate_snippets(count: int, spec: DataSpec | None = None) -> list[SnippetCreate]:
+    """``count`` snippets; the same spec always produces the same snippets."""
+    spec = spec or DataSpec()
+    rng = random.Random(spec.seed)
+    snippets = []
+    for n in range(count):
+        language = rng.choice(spec.languages)
+        tag_count = rng.randint(*spec.tags_per_snippet)
+        tags = rng.choices(spec.tags, weights=spec._tag_weights, k=tag_count)
+        words = rng.sample(WORDS, 3)
+        snippets.append(
+            SnippetCreate(
+                title=f"{' '.join(words).capitalize()} {n}",
+                code=_code(rng, language, rng.randint(*spec.code_lines)),
+                language=language,
+                description=(
+                    f"How to {words[0]} a {words[1]} with {words[2]}"
+                    if rng.random() < spec.described
+                    else None
+                ),
+                tags=tags,
+                favorite=rng.random() < spec.favorite,
+            )
+        )
+    return snippets
+
+
+def search_terms(count: int, seed: int = 0) -> list[str]:
+    """Queries in the vocabulary the generated snippets are made of."""
+    rng = random.Random(seed)
+    # Three characters is the shortest query the API and trigram index take
+    vocabulary = [word for word in (*WORDS, *TAGS) if len(word) >= 3]
+    return [rng.choice(vocabulary) for _ in range(count)]
@@ -0,0 +1,348 @@
+"""Time the repositories, search and the API at realistic data sizes.
+
+Each size gets a fresh in-memory repo and a fresh SQLite file, bulk loaded
+with generated snippets; the API is then driven through ``TestClient``
+against that same file. Results are printed (or written) as JSON, one
+record per size, target and operation, so runs on different commits can
+be diffed with ``benchmarks/compare.py``.
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --output before.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from datetime import datetime, timezone
+from itertools import batched
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel
+
+from src.snipster.api import (
+    app,
+    get_fuzzy_index,
+    get_session_factory,
+    get_snippet_cache,
+    request_metrics,
+)
+from src.snipster.async_db import AsyncSessionFactory, create_configured_async_engine
+from src.snipster.cache import SnippetCache
+from src.snipster.db import collect_queries, create_configured_engine
+from src.snipster.index import FuzzyIndex
+from src.snipster.repo import (
+    AbstractSnippetRepo,
+    DatabaseBackedSnippetRepo,
+    InMemorySnippetRepo,
+)
+
+from .data import DataSpec, generate_snippets, search_terms
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+TARGETS = ("memory", "sqlite", "api")
+
+# How many times each operation runs per size; ``--scale`` multiplies these
+OPS = {
+    "add": 100,
+    "get": 200,
+    "list_page": 100,
+    "list_all": 3,
+    "search": 20,
+    "fuzzy_search": 20,
+}
+PAGE_SIZE = 50
+# Bulk loads go in batches, as ``snipster import`` does, so the timed
+# add_many gets one sample per batch; batching barely changes the total
+LOAD_BATCH_SIZE = 1000
+
+
+def summarize(timings: Sequence[float]) -> dict[str, Any]:
+    """Per-operation statistics, in milliseconds."""
+    ms = sorted(t * 1000 for t in timings)
+    p95 = statistics.quantiles(ms, n=20)[-1] if len(ms) > 1 else ms[0]
+    return {
+        "ops": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p50_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(p95, 4),
+        "min_ms": round(ms[0], 4),
+        "max_ms": round(ms[-1], 4),
+    }
+
+
+def measure(
+    fn: Callable[[Any], Any],
+    args: Iterable[Any],
+    setup: Callable[[], None] | None = None,
+) -> dict[str, Any]:
+    """Time ``fn(arg)`` for each arg, running the untimed ``setup`` first.
+
+    Also counts the SQL statements each call runs, so query budgets can be
+    compared across commits alongside the timings.
+    """
+    timings, queries = [], 0
+    for arg in args:
+        if setup is not None:
+            setup()
+        with collect_queries() as stats:
+            start = time.perf_counter()
+            fn(arg)
+            timings.append(time.perf_counter() - start)
+        queries += stats.count
+    return {**summarize(timings), "queries_per_op": round(queries / len(timings), 2)}
+
+
+def _queries_served() -> float:
+    return sum(h.sum for h in request_metrics.queries.values())
+
+
+class Suite:
+    def __init__(self, spec: DataSpec, scale: float = 1.0) -> None:
+        self.spec = spec
+        self.ops = {name: max(1, round(count * scale)) for name, count in OPS.items()}
+        self.results: list[dict[str, Any]] = []
+
+    def record(self, size: int, target: str, operation: str, stats: dict) -> None:
+        self.results.append(
+            {"size": size, "target": target, "operation": operation, **stats}
+        )
+        print(
+            f"{target:>6} {size:>7} {operation:<20} p50 {stats['p50_ms']:>10.3f} ms",
+            file=sys.stderr,
+        )
+
+    def samples(self, size: int, ids: Sequence[int]):
+        """The ids, cursors, queries and new snippets each operation uses."""
+        rng = random.Random(self.spec.seed + size)
+        spec = replace(self.spec, seed=self.spec.seed + 1)
+        return {
+            "get": rng.choices(ids, k=self.ops["get"]),
+            "list_page": rng.choices(ids, k=self.ops["list_page"]),
+            "search": search_terms(self.ops["search"], self.spec.seed),
+            "fuzzy_search": search_terms(self.ops["fuzzy_search"], self.spec.seed),
+            "add": generate_snippets(self.ops["add"], spec),
+        }
+
+    def bench_repo(
+        self,
+        size: int,
+        target: str,
+        repo: AbstractSnippetRepo,
+        setup: Callable[[], None] | None = None,
+        cold_index: Callable[[], None] | None = None,
+    ) -> None:
+        snippets = generate_snippets(size, self.spec)
+        ids: list[int] = []
+        # Timed per batch of LOAD_BATCH_SIZE rows
+        self.record(
+            size,
+            target,
+            "add_many",
+            measure(
+                lambda batch: ids.extend(repo.add_many(batch)),
+                batched(snippets, LOAD_BATCH_SIZE),
+            ),
+        )
+
+        samples = self.samples(size, ids)
+        self.record(size, target, "get", measure(repo.get, samples["get"], setup))
+        self.record(
+            size,
+            target,
+            "list_page",
+            measure(
+                lambda after: repo.list(limit=PAGE_SIZE, after=after),
+                samples["list_page"],
+                setup,
+            ),
+        )
+        self.record(
+            size,
+            target,
+            "list_all",
+            measure(lambda _: repo.list(), range(self.ops["list_all"]), setup),
+        )
+        self.record(
+            size, target, "search", measure(repo.search, samples["search"], setup)
+        )
+        if cold_index is not None:
+            # The first fuzzy search builds the index from every row
+            self.record(
+                size,
+                target,
+                "fuzzy_search_cold",
+                measure(repo.fuzzy_search, samples["fuzzy_search"][:1], cold_index),
+            )
+        self.record(
+            size,
+            target,
+            "fuzzy_search",
+            measure(repo.fuzzy_search, samples["fuzzy_search"], setup),
+        )
+        self.record(size, target, "add", measure(repo.add, samples["add"], setup))
+
+    def bench_memory(self, size: int) -> None:
+        self.bench_repo(size, "memory", InMemorySnippetRepo())
+
+    def bench_sqlite(self, size: int, url: str) -> None:
+        engine = create_configured_engine(url)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            repo = DatabaseBackedSnippetRepo(session, fuzzy_index=FuzzyIndex())
+
+            def cold_index() -> None:
+                repo.fuzzy_index = FuzzyIndex()
+                session.expunge_all()
+
+            # Each API request gets a new session, so no operation may be
+            # answered from the identity map of an earlier one
+            self.bench_repo(size, "sqlite", repo, session.expunge_all, cold_index)
+        engine.dispose()
+
+    def bench_api(self, size: int, url: str) -> None:
+        """Drive the endpoints over the database ``bench_sqlite`` filled."""
+        engine = create_configured_async_engine(url)
+        with self._overrides(AsyncSessionFactory(engine)):
+            with TestClient(app) as client:
+                # The database was empty before the bulk load
+                samples = self.samples(size, range(1, size + 1))
+
+                def get(path: str, **params):
+                    response = client.get(path, params=params)
+                    response.raise_for_status()
+
+                requests = {
+                    "get": (lambda i: get(f"/snippets/{i}"), samples["get"]),
+                    "list_page": (
+                        lambda after: get("/snippets", limit=PAGE_SIZE, after=after),
+                        samples["list_page"],
+                    ),
+                    "list_summary_page": (
+                        lambda after: get(
+                            "/snippets", limit=PAGE_SIZE, after=after, view="summary"
+                        ),
+                        samples["list_page"],
+                    ),
+                    "search": (lambda q: get("/search", q=q), samples["search"]),
+                    "create": (
+                        lambda s: client.post(
+                            "/create", json=s.model_dump(mode="json")
+                        ).raise_for_status(),
+                        samples["add"],
+                    ),
+                }
+                # The first search loads the fuzzy index, which the sqlite
+                # target already times as fuzzy_search_cold
+                get("/search", q="warm up")
+                for operation, (fn, args) in requests.items():
+                    # Requests run on the TestClient's event loop thread, out
+                    # of measure's reach, so their statements are read back
+                    # from the metrics the middleware keeps
+                    served = _queries_served()
+                    stats = measure(fn, args)
+                    stats["queries_per_op"] = round(
+                        (_queries_served() - served) / stats["ops"], 2
+                    )
+                    self.record(size, "api", operation, stats)
+                client.portal.call(engine.dispose)
+
+    @staticmethod
+    @contextmanager
+    def _overrides(session_factory: AsyncSessionFactory) -> Iterator[None]:
+        # A fresh index and cache per size, like a freshly started server
+        index, cache = FuzzyIndex(), SnippetCache()
+        app.dependency_overrides[get_session_factory] = lambda: session_factory
+        app.dependency_overrides[get_fuzzy_index] = lambda: index
+        app.dependency_overrides[get_snippet_cache] = lambda: cache
+        try:
+            yield
+        finally:
+            app.dependency_overrides.clear()
+
+    def run(self, sizes: Iterable[int], targets: Sequence[str]) -> None:
+        for size in sizes:
+            if "memory" in targets:
+                self.bench_memory(size)
+            if "sqlite" in targets or "api" in targets:
+                with tempfile.TemporaryDirectory() as tmp:
+                    url = f"sqlite:///{Path(tmp) / 'bench.sqlite'}"
+                    if "sqlite" in targets:
+                        self.bench_sqlite(size, url)
+                    else:
+                        # The API needs the rows even when the repo isn't timed
+                        self._load(size, url)
+                    if "api" in targets:
+                        self.bench_api(size, url)
+
+    def _load(self, size: int, url: str) -> None:
+        engine = create_configured_engine(url)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            repo = DatabaseBackedSnippetRepo(session)
+            for batch in batched(generate_snippets(size, self.spec), LOAD_BATCH_SIZE):
+                repo.add_many(batch)
+        engine.dispose()
+
+
+def environment() -> dict[str, Any]:
+    """What the numbers were measured on, so runs can be told apart."""
+
+    def git(*args: str) -> str | None:
+        try:
+            return subprocess.run(
+                ["git", *args], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, metavar="N"
+    )
+    parser.add_argument(
+        "--targets", nargs="+", choices=TARGETS, default=TARGETS, metavar="TARGET"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier for operation counts"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tag-skew", type=float, default=DataSpec.tag_skew)
+    parser.add_argument("--output", type=Path, help="Write JSON here, not stdout")
+    args = parser.parse_args(argv)
+
+    spec = DataSpec(seed=args.seed, tag_skew=args.tag_skew)
+    suite = Suite(spec, scale=args.scale)
+    suite.run(args.sizes, args.targets)
+    report = {
+        "environment": environment(),
+        "spec": {k: v for k, v in vars(spec).items() if not k.startswith("_")},
+        "results": suite.results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
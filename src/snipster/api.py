@@ -1,65 +1,274 @@
+import hashlib
 import time
 from datetime import datetime
-from typing import Annotated
+from functools import cache
+from typing import Annotated, Any, Literal, Sequence
 
-from fastapi import Body, Depends, FastAPI, HTTPException, Query, status
-from pydantic import BaseModel
+from fastapi import (
+    Body,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter
 
-from .db import default_session_factory
-from .exceptions import SnippetNotFoundError
-from .models import Snippet, SnippetCreate
-from .repo import DatabaseBackedSnippetRepo as db_repo
+from .async_db import async_engine, async_replicas, default_async_session_factory
+from .async_repo import AsyncDatabaseBackedSnippetRepo as db_repo
+from .cache import SnippetCache
+from .compression import CompressionMiddleware
+from .db import EngineSettings, pool_status
+from .dedupe import DedupeMode
+from .exceptions import DuplicateSnippetError, SnippetNotFoundError
+from .index import FuzzyIndex
+from .metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    MetricsMiddleware,
+    RequestMetrics,
+)
+from .models import Snippet, SnippetCreate, SnippetSummary, normalize_tag
+from .repo import PREVIEW_LENGTH
 
-app = FastAPI()
+# Responses smaller than this aren't worth the CPU to compress
+COMPRESSION_MINIMUM_SIZE = 1024
+
+# Per-route request metrics since the process started, served at /metrics
+request_metrics = RequestMetrics()
+engine_settings = EngineSettings()
+
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+app.add_middleware(MetricsMiddleware, metrics=request_metrics, settings=engine_settings)
 
 start_time = time.time()
 
+# Lives for the whole process, so /search loads it once and after that reads
+# the version and the matched rows, plus any rows other processes changed
+fuzzy_index = FuzzyIndex()
+# Likewise, so hot snippets are served without a database round trip
+snippet_cache = SnippetCache()
+
 
 class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
     version: str
     uptime_seconds: float
+    # Connection counts for the API's database pool
+    pool: dict[str, int]
+    # Whether each read replica is in rotation, with its pool counts
+    replicas: list[dict[str, Any]]
+    # Hit, miss and eviction counts for the snippet cache
+    cache: dict[str, int]
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to Snipster API"}
 
 
 @app.get("/health", response_model=HealthResponse, status_code=status.HTTP_200_OK)
-def health_check():
+async def health_check():
     return HealthResponse(
         status="healthy",
         timestamp=datetime.now(),
         version="1.0.0",
         uptime_seconds=time.time() - start_time,
+        pool=pool_status(async_engine.sync_engine),
+        replicas=async_replicas.status() if async_replicas is not None else [],
+        cache=snippet_cache.stats(),
     )
 
 
-def get_session():
-    with default_session_factory.get_session() as session:
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(
+        request_metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE
+    )
+
+
+# Endpoints and dependencies are all async: sync ones would each tie up a
+# threadpool thread, and a blocking connection, for the whole request
+
+
+async def get_session_factory():
+    return default_async_session_factory
+
+
+async def get_session(session_factory=Depends(get_session_factory)):
+    async with session_factory.get_session() as session:
         yield session
 
 
-def get_repo(session=Depends(get_session)):
-    return db_repo(session=session)
+async def get_fuzzy_index():
+    return fuzzy_index
+
 
+async def get_snippet_cache():
+    return snippet_cache
+
+
+async def get_repo(
+    session=Depends(get_session),
+    fuzzy_index=Depends(get_fuzzy_index),
+    cache=Depends(get_snippet_cache),
+):
+    return db_repo(session=session, fuzzy_index=fuzzy_index, cache=cache)
 
-@app.post("/create", status_code=status.HTTP_201_CREATED)
-def create_snippet(snippet: SnippetCreate, repo=Depends(get_repo)) -> Snippet:
-    return repo.add(snippet)
+
+def _etag_headers(version: int, *request: Any) -> dict[str, str]:
+    """Validator headers for a response to ``request`` at repo ``version``.
+
+    ``request`` is the path and the normalized query parameters, so every
+    listing and lookup gets its own ETag. It is weak because compression
+    changes the bytes sent, but not what they represent.
+    """
+    key = hashlib.sha256(repr(request).encode()).hexdigest()[:16]
+    # Browsers may keep the response but must revalidate it before reuse
+    return {"ETag": f'W/"{version}-{key}"', "Cache-Control": "no-cache"}
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    return any(
+        candidate.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for candidate in if_none_match.split(",")
+    )
+
+
+@cache
+def _list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])  # type: ignore[valid-type]
+
+
+def _rows_response(
+    rows: Sequence[Any], model: type[BaseModel], headers: dict[str, str] | None = None
+) -> Response:
+    """JSON for rows of ``model``, skipping FastAPI's response-model pass.
+
+    Rows were validated when they were written, so re-validating them on the
+    way out is wasted work; pydantic dumps them and orjson encodes the result.
+    """
+    content = _list_adapter(model).dump_python(rows, mode="json")
+    return ORJSONResponse(content, headers=headers)
+
+
+@app.post(
+    "/create",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        200: {"description": "Duplicate; the stored snippet (dedupe=existing)"},
+        409: {"description": "Duplicate, refused (dedupe=reject)"},
+    },
+)
+async def create_snippet(
+    snippet: SnippetCreate,
+    response: Response,
+    dedupe: Annotated[
+        DedupeMode,
+        Query(description="What to do when the same code is already stored"),
+    ] = DedupeMode.off,
+    repo=Depends(get_repo),
+) -> Snippet:
+    mode = DedupeMode.off if dedupe == DedupeMode.off else DedupeMode.reject
+    try:
+        return await repo.add(snippet, mode)
+    except DuplicateSnippetError as e:
+        if dedupe == DedupeMode.reject:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": str(e), "snippet_id": e.snippet_id},
+            )
+        # Nothing was created, so not 201
+        response.status_code = status.HTTP_200_OK
+        return await repo.get(e.snippet_id)
 
 
 @app.get("/snippets", status_code=status.HTTP_200_OK)
-def list_snippets(repo=Depends(get_repo)) -> list[Snippet]:
-    return repo.list()
+async def list_snippets(
+    limit: Annotated[
+        int | None, Query(ge=1, le=1000, description="Page size; all if omitted")
+    ] = None,
+    after: Annotated[
+        int | None, Query(description="Return snippets with ids after this one")
+    ] = None,
+    tag: Annotated[
+        str | None, Query(min_length=1, description="Only snippets with this tag")
+    ] = None,
+    view: Annotated[
+        Literal["full", "summary"],
+        Query(description="summary omits code bodies; fetch them by id"),
+    ] = "full",
+    preview: Annotated[
+        int, Query(ge=0, le=1000, description="Code preview length for summaries")
+    ] = PREVIEW_LENGTH,
+    if_none_match: Annotated[str | None, Header()] = None,
+    repo=Depends(get_repo),
+) -> list[Snippet] | list[SnippetSummary]:
+    # The version is one indexed row, so a 304 never reads or serializes snippets.
+    # It comes from the primary, since a replica's may lag behind the last write
+    headers = _etag_headers(
+        await repo.fresh_version(),
+        "/snippets",
+        view,
+        limit,
+        after,
+        normalize_tag(tag) if tag is not None else None,
+        # Only summaries have previews
+        preview if view == "summary" else None,
+    )
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    model: type[BaseModel]
+    if view == "summary":
+        model = SnippetSummary
+        snippets = await repo.list_summaries(
+            limit=limit, after=after, preview_length=preview, tag=tag
+        )
+    else:
+        model = Snippet
+        snippets = await repo.list(limit=limit, after=after, tag=tag)
+    # A full page means there may be more; the client passes this back as after
+    if limit is not None and len(snippets) == limit:
+        headers["X-Next-Cursor"] = str(snippets[-1].id)
+    return _rows_response(snippets, model, headers)
+
+
+@app.get("/snippets/export", response_class=StreamingResponse)
+async def export_snippets(session_factory=Depends(get_session_factory)):
+    """Stream every snippet as newline-delimited JSON, in id order."""
+
+    # The generator owns its session: it has to stay open until the last row
+    # is sent, which is after request-scoped dependencies have been torn down
+    async def lines():
+        async with session_factory.get_session() as session:
+            async for snippet in db_repo(session=session).stream():
+                yield snippet.model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @app.get("/snippets/{snippet_id}")
-def get_snippet(snippet_id: int, repo=Depends(get_repo)) -> Snippet:
+async def get_snippet(
+    snippet_id: int,
+    response: Response,
+    if_none_match: Annotated[str | None, Header()] = None,
+    repo=Depends(get_repo),
+) -> Snippet:
+    headers = _etag_headers(await repo.fresh_version(), f"/snippets/{snippet_id}")
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     try:
-        return repo.get(snippet_id)
+        return await repo.get(snippet_id)
     except SnippetNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -68,9 +277,9 @@ def get_snippet(snippet_id: int, repo=Depends(get_repo)) -> Snippet:
 
 
 @app.delete("/snippets/{snippet_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_snippet(snippet_id: int, repo=Depends(get_repo)):
+async def delete_snippet(snippet_id: int, repo=Depends(get_repo)):
     try:
-        repo.delete(snippet_id)
+        await repo.delete(snippet_id)
         return
     except SnippetNotFoundError:
         raise HTTPException(
@@ -80,9 +289,9 @@ def delete_snippet(snippet_id: int, repo=Depends(get_repo)):
 
 
 @app.post("/snippets/{snippet_id}/toggle-favorite")
-def toggle_favorite(snippet_id: int, repo=Depends(get_repo)) -> Snippet:
+async def toggle_favorite(snippet_id: int, repo=Depends(get_repo)) -> Snippet:
     try:
-        return repo.toggle_favorite(snippet_id)
+        return await repo.toggle_favorite(snippet_id)
     except SnippetNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -95,28 +304,56 @@ class TagsPayload(BaseModel):
 
 
 @app.post("/snippets/{snippet_id}/add-tags", status_code=status.HTTP_201_CREATED)
-def add_tags(
+async def add_tags(
     snippet_id: int,
     tags_payload: Annotated[
         TagsPayload, Body()
     ],  # Example: {"tags": ["python", "fastapi", "web"]}
     repo=Depends(get_repo),
-):
+) -> Snippet:
     try:
-        repo.get(snippet_id)
+        return await repo.add_tags(snippet_id, tags_payload.tags)
     except SnippetNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Snippet with id {snippet_id} not found",
         )
-    for t in tags_payload.tags:
-        repo.add_tag(snippet_id, t)
 
-    return repo.get(snippet_id)
 
+@app.post("/snippets/{snippet_id}/remove-tags")
+async def remove_tags(
+    snippet_id: int,
+    tags_payload: Annotated[TagsPayload, Body()],
+    repo=Depends(get_repo),
+) -> Snippet:
+    try:
+        return await repo.remove_tags(snippet_id, tags_payload.tags)
+    except SnippetNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Snippet with id {snippet_id} not found",
+        )
+
+
+class BulkTagsPayload(TagsPayload):
+    snippet_ids: list[int] = Field(min_length=1, max_length=1000)
 
-@app.get("/search")
-def search(
+
+@app.post("/snippets/add-tags")
+async def add_tags_to_many(
+    payload: Annotated[
+        BulkTagsPayload, Body()
+    ],  # Example: {"snippet_ids": [1, 2, 3], "tags": ["python", "web"]}
+    repo=Depends(get_repo),
+) -> list[Snippet]:
+    try:
+        return await repo.add_tags_to_many(payload.snippet_ids, payload.tags)
+    except SnippetNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@app.get("/search", response_model=list[Snippet])
+async def search(
     q: Annotated[
         str,
         Query(
@@ -127,6 +364,13 @@ def search(
             description="3-25 chars; Must contain non-whitespace",
         ),
     ],
+    limit: Annotated[int, Query(ge=1, le=100, description="Maximum results")] = 5,
+    score_cutoff: Annotated[
+        float, Query(ge=0, le=100, description="Minimum match score, 0-100")
+    ] = 70,
     repo=Depends(get_repo),
 ):
-    return repo.fuzzy_search(q.strip().lower())
+    snippets = await repo.fuzzy_search(
+        q.strip().lower(), limit=limit, score_cutoff=score_cutoff
+    )
+    return _rows_response(snippets, Snippet)
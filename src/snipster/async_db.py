@@ -0,0 +1,97 @@
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Sequence
+
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .db import (
+    EngineSettings,
+    ReplicaSet,
+    RoutingSession,
+    apply_sqlite_pragmas,
+    db_url,
+    engine_options,
+    track_queries,
+)
+
+# Async drivers for the backends the sync engine supports
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+psycopg"}
+
+
+def to_async_url(url: str | URL) -> URL:
+    """Swap the driver in ``url`` for its async counterpart."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver) if driver else url
+
+
+def create_configured_async_engine(
+    url: str | URL, settings: EngineSettings | None = None
+) -> AsyncEngine:
+    """Async counterpart of ``db.create_configured_engine``."""
+    settings = settings or EngineSettings()
+    url = to_async_url(url)
+    engine = create_async_engine(url, **engine_options(url, settings))
+    apply_sqlite_pragmas(engine.sync_engine, settings)
+    track_queries(engine.sync_engine)
+    return engine
+
+
+def create_async_replica_set(
+    urls: Sequence[str], settings: EngineSettings | None = None
+) -> ReplicaSet | None:
+    """Async counterpart of ``db.create_replica_set``.
+
+    The set holds the sync side of each async engine, which is what
+    ``RoutingSession`` routes between.
+    """
+    if not urls:
+        return None
+    settings = settings or EngineSettings()
+    engines = [create_configured_async_engine(url, settings) for url in urls]
+    return ReplicaSet([e.sync_engine for e in engines], settings.replica_retry_after)
+
+
+async_engine = create_configured_async_engine(db_url)
+async_replicas = create_async_replica_set(EngineSettings().replica_urls)
+
+
+class AsyncSessionFactory:
+    """``SessionFactory`` for the async engine, used by the API."""
+
+    def __init__(self, engine: AsyncEngine, replicas: ReplicaSet | None = None):
+        self.engine = engine
+        self.replicas = replicas
+
+    @classmethod
+    def from_urls(
+        cls,
+        primary_url: str | URL,
+        replica_urls: Sequence[str] = (),
+        settings: EngineSettings | None = None,
+    ) -> "AsyncSessionFactory":
+        return cls(
+            create_configured_async_engine(primary_url, settings),
+            create_async_replica_set(replica_urls, settings),
+        )
+
+    @asynccontextmanager
+    async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
+        routing = {}
+        if self.replicas is not None:
+            routing = {"sync_session_class": RoutingSession, "replicas": self.replicas}
+        # Objects outlive the commit so responses can be built from them
+        # without lazy loads, which async sessions can't do implicitly
+        async with AsyncSession(
+            self.engine, expire_on_commit=False, **routing
+        ) as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+
+default_async_session_factory = AsyncSessionFactory(async_engine, async_replicas)
@@ -0,0 +1,158 @@
+import asyncio
+from typing import AsyncIterator, Iterable, Sequence
+
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .cache import CachedSnippetRepo, SnippetCache
+from .dedupe import DedupeMode
+from .index import FuzzyIndex
+from .models import Snippet, SnippetCreate, SnippetSummary
+from .repo import (
+    PREVIEW_LENGTH,
+    DatabaseBackedSnippetRepo,
+    fetch_code,
+    inflate_code,
+    matching_blobs,
+)
+
+# Cached results are copied as they are stored, so they need their code first
+_CACHED_METHODS = {"get", "list"}
+
+
+class AsyncDatabaseBackedSnippetRepo:
+    """``DatabaseBackedSnippetRepo`` for async callers.
+
+    Each call runs the sync repo through ``AsyncSession.run_sync``, which
+    drives the same queries over the async driver without blocking the event
+    loop, so both repos share one implementation of every query. With a
+    ``cache`` the sync repo is wrapped in a ``CachedSnippetRepo``, and hits
+    never touch the database.
+
+    ``run_sync`` still runs Python code on the event loop's thread, so CPU
+    work is kept out of it: loading and scoring the fuzzy index, and
+    decompressing large code bodies, to return them or to search them, run
+    in a worker thread instead. The one exception is ``get`` and ``list``
+    filling a cache, which decompress before the result is stored.
+    """
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        fuzzy_index: FuzzyIndex | None = None,
+        cache: SnippetCache | None = None,
+    ) -> None:
+        self.session = session
+        self.fuzzy_index = fuzzy_index
+        self.cache = cache
+
+    async def _run(self, method: str, *args, **kwargs):
+        cached = self.cache is not None and method in _CACHED_METHODS
+
+        def call(session: Session):
+            repo = DatabaseBackedSnippetRepo(
+                session, fuzzy_index=self.fuzzy_index, inflate_later=not cached
+            )
+            compressed = repo.compressed
+            # Methods only the database repo has, such as the fuzzy index
+            # reads, skip the cache
+            if self.cache is not None and hasattr(CachedSnippetRepo, method):
+                repo = CachedSnippetRepo(repo, self.cache)
+            return getattr(repo, method)(*args, **kwargs), compressed
+
+        result, compressed = await self.session.run_sync(call)
+        if compressed:
+            await asyncio.to_thread(inflate_code, compressed)
+        return result
+
+    async def add(
+        self, snippet: SnippetCreate, dedupe: DedupeMode = DedupeMode.off
+    ) -> Snippet:
+        return await self._run("add", snippet, dedupe)
+
+    async def add_many(self, snippets: Sequence[SnippetCreate]) -> Sequence[int]:
+        return await self._run("add_many", snippets)
+
+    async def get(self, snippet_id: int) -> Snippet:
+        return await self._run("get", snippet_id)
+
+    async def list(
+        self, limit: int | None = None, after: int | None = None, tag: str | None = None
+    ) -> Sequence[Snippet]:
+        return await self._run("list", limit, after, tag)
+
+    async def list_summaries(
+        self,
+        limit: int | None = None,
+        after: int | None = None,
+        preview_length: int = PREVIEW_LENGTH,
+        tag: str | None = None,
+    ) -> Sequence[SnippetSummary]:
+        return await self._run("list_summaries", limit, after, preview_length, tag)
+
+    async def stream(self, batch_size: int = 500) -> AsyncIterator[Snippet]:
+        # Streams natively so rows reach the caller as each batch arrives
+        stmt = (
+            select(Snippet)
+            .order_by(Snippet.id)  # type: ignore
+            .execution_options(yield_per=batch_size)
+        )
+        result = await self.session.stream_scalars(stmt)
+        async for batch in result.partitions():
+            compressed = await self.session.run_sync(fetch_code, batch)
+            if compressed:
+                await asyncio.to_thread(inflate_code, compressed)
+            for snippet in batch:
+                yield snippet
+
+    async def delete(self, snippet_id: int) -> None:
+        await self._run("delete", snippet_id)
+
+    async def toggle_favorite(self, snippet_id: int) -> Snippet:
+        return await self._run("toggle_favorite", snippet_id)
+
+    async def add_tag(self, snippet_id: int, tag: str) -> Snippet | None:
+        return await self._run("add_tag", snippet_id, tag)
+
+    async def remove_tag(self, snippet_id: int, tag: str) -> Snippet:
+        return await self._run("remove_tag", snippet_id, tag)
+
+    async def add_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        return await self._run("add_tags", snippet_id, tags)
+
+    async def remove_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        return await self._run("remove_tags", snippet_id, tags)
+
+    async def add_tags_to_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        return await self._run("add_tags_to_many", snippet_ids, tags)
+
+    async def remove_tags_from_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        return await self._run("remove_tags_from_many", snippet_ids, tags)
+
+    async def search(self, query: str) -> Sequence[Snippet]:
+        found = await self._run("search_heads", query)
+        blobs = await self._run("compressed_blobs")
+        digests = await asyncio.to_thread(matching_blobs, blobs, query)
+        return await self._run("with_blob_matches", found, digests)
+
+    async def version(self) -> int:
+        return await self._run("version")
+
+    async def fresh_version(self) -> int:
+        return await self._run("fresh_version")
+
+    async def fuzzy_search(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[Snippet]:
+        # The reads run on the loop; building and scoring the index don't
+        index = self.fuzzy_index if self.fuzzy_index is not None else FuzzyIndex()
+        changes = await self._run("fuzzy_index_changes", index)
+        if changes is not None:
+            await asyncio.to_thread(index.apply, changes)
+        matches = await asyncio.to_thread(index.search, query, limit, score_cutoff)
+        found = await self._run("fuzzy_matches", index, matches)
+        return [snippet for snippet, _ in found]
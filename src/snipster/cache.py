@@ -0,0 +1,315 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from .dedupe import DedupeMode
+from .models import (
+    Snippet,
+    SnippetCreate,
+    SnippetSummary,
+    normalize_tag,
+    normalize_tags,
+)
+from .repo import PREVIEW_LENGTH, AbstractSnippetRepo, MergedGroups
+
+
+def _copy(item):
+    # Cached items are detached copies, so no caller ever holds an object
+    # that belongs to another session or sees another caller's changes
+    if isinstance(item, Snippet):
+        return Snippet(**item.model_dump())
+    return item.model_copy(deep=True)
+
+
+class _Entry:
+    __slots__ = ("value", "ids", "expires_at", "full", "tag")
+
+    def __init__(self, value, ids, expires_at, full=False, tag=None):
+        self.value = value
+        self.ids = ids
+        self.expires_at = expires_at
+        # A full page can't gain rows from inserts, which always sort last
+        self.full = full
+        self.tag = tag
+
+
+class SnippetCache:
+    """Bounded LRU cache, with a TTL, for ``get`` and ``list`` results.
+
+    It outlives any one repo or session: ``CachedSnippetRepo`` reads through
+    it and invalidates exactly the entries each write can change. The TTL
+    bounds how stale an entry gets when another process writes the database.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300) -> None:
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1.")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._lock = Lock()
+        # The repo version the entries were read at, when known
+        self.version: int | None = None
+        # Moves on every invalidation, so a value loaded before one isn't stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def lookup(self, key: tuple) -> Any | None:
+        """A copy of the value cached under ``key``, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry.value
+        if isinstance(value, list):
+            return [_copy(item) for item in value]
+        return _copy(value)
+
+    def store(
+        self,
+        key: tuple,
+        value,
+        limit: int | None = None,
+        tag=None,
+        generation: int | None = None,
+    ) -> None:
+        """Cache ``value`` under ``key``.
+
+        Pass the ``generation`` read before loading ``value``: if anything was
+        invalidated since, the value may predate that write and is dropped.
+        """
+        if isinstance(value, list):
+            cached = [_copy(item) for item in value]
+            ids = {item.id for item in value}
+        else:
+            cached = _copy(value)
+            ids = {value.id}
+        full = limit is not None and len(cached) >= limit
+        entry = _Entry(cached, ids, time.monotonic() + self.ttl, full, tag)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def check_version(self, version: int) -> None:
+        """Drop everything if the repo has changed in ways this cache didn't see.
+
+        Writes made through a ``CachedSnippetRepo`` forget the version, since
+        they invalidate precisely; only a change between two observed
+        versions means another process wrote.
+        """
+        with self._lock:
+            if self.version is not None and version != self.version:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self.generation += 1
+            self.version = version
+
+    def _invalidate(self, stale: Callable[[tuple, _Entry], bool]) -> None:
+        with self._lock:
+            self.version = None
+            self.generation += 1
+            keys = [key for key, entry in self._entries.items() if stale(key, entry)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+
+    def snippets_added(self, tags: Iterable[str]) -> None:
+        """Drop listings that new snippets with ``tags`` would appear in."""
+        tags = set(tags)
+        self._invalidate(
+            lambda key, entry: (
+                key[0] != "get"
+                and not entry.full
+                and (entry.tag is None or entry.tag in tags)
+            )
+        )
+
+    def snippets_changed(
+        self, snippet_ids: Iterable[int], tags: Iterable[str] = ()
+    ) -> None:
+        """Drop everything showing ``snippet_ids``, and listings of ``tags``."""
+        snippet_ids, tags = set(snippet_ids), set(tags)
+        self._invalidate(
+            lambda key, entry: (
+                not entry.ids.isdisjoint(snippet_ids)
+                or (key[0] != "get" and entry.tag in tags)
+            )
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+class CachedSnippetRepo(AbstractSnippetRepo):
+    """Wraps another repo, serving ``get`` and ``list`` from a ``SnippetCache``.
+
+    Writes go to the wrapped repo and then invalidate the affected entries.
+    Cache hits return detached copies rather than session-bound objects.
+    """
+
+    def __init__(self, repo: AbstractSnippetRepo, cache: SnippetCache) -> None:
+        self.repo = repo
+        self.cache = cache
+
+    def add(
+        self, snippet: SnippetCreate, dedupe: DedupeMode = DedupeMode.off
+    ) -> Snippet:
+        stored_snippet = self.repo.add(snippet, dedupe)
+        self.cache.snippets_added(stored_snippet.tags)  # type: ignore
+        return stored_snippet  # type: ignore
+
+    def add_many(self, snippets: Sequence[SnippetCreate]) -> Sequence[int]:
+        ids = self.repo.add_many(snippets)
+        self.cache.snippets_added(t for snippet in snippets for t in snippet.tags)
+        return ids
+
+    def get(self, snippet_id: int) -> Snippet:
+        key = ("get", snippet_id)
+        snippet = self.cache.lookup(key)
+        if snippet is None:
+            generation = self.cache.generation
+            snippet = self.repo.get(snippet_id)
+            self.cache.store(key, snippet, generation=generation)
+        return snippet  # type: ignore
+
+    def list(
+        self, limit: int | None = None, after: int | None = None, tag: str | None = None
+    ) -> Sequence[Snippet]:
+        tag = normalize_tag(tag) if tag is not None else None
+        key = ("list", limit, after, tag)
+        snippets = self.cache.lookup(key)
+        if snippets is None:
+            generation = self.cache.generation
+            snippets = list(self.repo.list(limit, after, tag))
+            self.cache.store(key, snippets, limit, tag, generation)
+        return snippets
+
+    def list_summaries(
+        self,
+        limit: int | None = None,
+        after: int | None = None,
+        preview_length: int = PREVIEW_LENGTH,
+        tag: str | None = None,
+    ) -> Sequence[SnippetSummary]:
+        tag = normalize_tag(tag) if tag is not None else None
+        key = ("summaries", limit, after, preview_length, tag)
+        summaries = self.cache.lookup(key)
+        if summaries is None:
+            generation = self.cache.generation
+            summaries = list(
+                self.repo.list_summaries(limit, after, preview_length, tag)
+            )
+            self.cache.store(key, summaries, limit, tag, generation)
+        return summaries
+
+    def stream(self, batch_size: int = 500) -> Iterator[Snippet]:
+        return self.repo.stream(batch_size)
+
+    def delete(self, snippet_id: int) -> None:
+        self.repo.delete(snippet_id)
+        self.cache.snippets_changed([snippet_id])
+
+    def toggle_favorite(self, snippet_id: int) -> Snippet:
+        snippet = self.repo.toggle_favorite(snippet_id)
+        self.cache.snippets_changed([snippet_id])
+        return snippet  # type: ignore
+
+    def add_tag(self, snippet_id: int, tag: str) -> Snippet | None:
+        snippet = self.repo.add_tag(snippet_id, tag)
+        self.cache.snippets_changed([snippet_id], normalize_tags([tag]))
+        return snippet
+
+    def remove_tag(self, snippet_id: int, tag: str) -> Snippet:
+        snippet = self.repo.remove_tag(snippet_id, tag)
+        self.cache.snippets_changed([snippet_id], normalize_tags([tag]))
+        return snippet  # type: ignore
+
+    def add_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        tags = normalize_tags(tags)
+        snippet = self.repo.add_tags(snippet_id, tags)
+        self.cache.snippets_changed([snippet_id], tags)
+        return snippet
+
+    def remove_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        tags = normalize_tags(tags)
+        snippet = self.repo.remove_tags(snippet_id, tags)
+        self.cache.snippets_changed([snippet_id], tags)
+        return snippet
+
+    def add_tags_to_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        snippet_ids, tags = list(snippet_ids), normalize_tags(tags)
+        snippets = self.repo.add_tags_to_many(snippet_ids, tags)
+        self.cache.snippets_changed(snippet_ids, tags)
+        return snippets
+
+    def remove_tags_from_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        snippet_ids, tags = list(snippet_ids), normalize_tags(tags)
+        snippets = self.repo.remove_tags_from_many(snippet_ids, tags)
+        self.cache.snippets_changed(snippet_ids, tags)
+        return snippets
+
+    def search(self, query: str) -> Sequence[Snippet]:
+        return self.repo.search(query)
+
+    def version(self) -> int:
+        # Never cached: it is how changes from other processes are noticed
+        version = self.repo.version()
+        self.cache.check_version(version)
+        return version
+
+    def fresh_version(self) -> int:
+        version = self.repo.fresh_version()
+        self.cache.check_version(version)
+        return version
+
+    def fuzzy_search(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[Snippet]:
+        return self.repo.fuzzy_search(query, limit, score_cutoff)  # type: ignore
+
+    def fuzzy_search_scored(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[tuple[Snippet, float]]:
+        return self.repo.fuzzy_search_scored(query, limit, score_cutoff)  # type: ignore
+
+    def ids_by_content_hash(self, hashes: Iterable[str]) -> dict[str, int]:
+        return self.repo.ids_by_content_hash(hashes)
+
+    def merge_duplicates(self, dry_run: bool = False) -> MergedGroups:
+        merged = self.repo.merge_duplicates(dry_run)
+        if merged and not dry_run:
+            self.cache.clear()
+        return merged
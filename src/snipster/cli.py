@@ -1,40 +1,144 @@
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import TYPE_CHECKING, List
+
 import typer
-from dotenv import load_dotenv
 from rich.console import Console
-from rich.panel import Panel
-from rich.syntax import Syntax
-from rich.text import Text
 from typing_extensions import Annotated
 
-from . import cli_snippet_service
-from .db import default_session_factory
-from .exceptions import SnippetNotFoundError
-from .models import Language as LanguageEnum
-from .models import SnippetCreate
+from .dedupe import DedupeMode
+from .exceptions import DuplicateSnippetError, SnippetNotFoundError
+from .languages import Language as LanguageEnum
+
+# SQLAlchemy, SQLModel, rapidfuzz and the engine load only once a command
+# touches the database, so --help and argument errors come back quickly;
+# tests/test_cli.py checks what importing this module pulls in
+if TYPE_CHECKING:
+    from .db import SessionFactory
+    from .shell import Shell
+    from .snapshot import Snapshot
 
-load_dotenv()
+# Note: None means the default session factory, which is backed by postgres in
+# production. In tests, this gets monkey patched to use an in-memory SQLite
+# database via the test_session_factory fixture in tests/conftest.py. This
+# allows tests to run quickly without requiring a real database while still
+# testing the same code paths.
+cli_session_factory: "SessionFactory | None" = None
 
-# Note: This uses the default session factory which is backed by postgres in production.
-# In tests, this gets monkey patched to use an in-memory SQLite database via the
-# test_session_factory fixture in tests/conftest.py. This allows tests to run quickly
-# without requiring a real database while still testing the same code paths.
-cli_session_factory = default_session_factory
 
+# Bad rows shown after an import; the rest are only counted
+MAX_REPORTED_ERRORS = 20
 
 app = typer.Typer(help="Snipster: A CLI for managing code snippets.")
 
 
 @app.callback(invoke_without_command=True)
-def setup(ctx: typer.Context):
-    console = Console()
-    # All commands will use the same session factory (interact with the same DB)
-    ctx.obj = {"session_factory": cli_session_factory, "console": console}
+def setup(
+    ctx: typer.Context,
+    offline: Annotated[
+        bool,
+        typer.Option(
+            "--offline",
+            help="Read from the local snapshot without contacting the database",
+        ),
+    ] = False,
+):
+    # `snipster shell` passes in one obj for all the commands it runs, so they
+    # share its console, snapshot and fuzzy index; the rest is per command
+    if ctx.obj is None:
+        ctx.obj = {"console": Console()}
+    ctx.meta["offline"] = offline
     if ctx.invoked_subcommand is None:
         typer.echo("📘 Welcome to Snipster!\n")
         typer.echo("Use one of the following commands:")
         typer.echo(ctx.get_help())
 
 
+def _session_factory(ctx: typer.Context, reads_only: bool = False) -> "SessionFactory":
+    """The session factory every command shares, set up on first use.
+
+    Commands that only read are served from the local snapshot, if there is
+    one: as it stands with --offline, otherwise after refreshing it when it
+    is older than its max age. Commands that write go to the database and
+    mark the snapshot stale. Collecting the command's SQL statements starts
+    here too, and runs until the command's context closes.
+    """
+    if "session_factory" in ctx.meta:
+        return ctx.meta["session_factory"]
+    from .db import EngineSettings, collect_queries
+
+    settings = EngineSettings()
+    queries = ctx.with_resource(
+        collect_queries(f"snipster {ctx.info_name}", settings.query_warning_threshold)
+    )
+    if settings.query_debug:
+        ctx.call_on_close(
+            lambda: Console(stderr=True).print(
+                f"SQL statements: {queries.count} ({queries.seconds * 1000:.1f} ms)",
+                style="dim",
+            )
+        )
+    primary = _primary_session_factory()
+    snapshot = _snapshot(ctx)
+    if not reads_only:
+        if ctx.meta["offline"]:
+            _fail(ctx, "Error: --offline only works with commands that read.")
+        # The shell's fuzzy index notices the write by the version moving
+        snapshot.mark_stale()
+        factory = primary
+    elif ctx.meta["offline"]:
+        if not snapshot.exists():
+            _fail(ctx, "Error: No snapshot yet; run `snipster snapshot` first.")
+        factory = snapshot.session_factory()
+    elif snapshot.exists():
+        if not snapshot.is_fresh():
+            _refresh_or_warn(snapshot, primary)
+        factory = snapshot.session_factory()
+    else:
+        factory = primary
+    ctx.meta["session_factory"] = factory
+    return factory
+
+
+def _refresh_or_warn(snapshot: "Snapshot", primary: "SessionFactory") -> None:
+    """Refresh ``snapshot``, or keep reading it as it is if the database is down."""
+    from sqlalchemy.exc import OperationalError
+
+    try:
+        snapshot.refresh(primary)
+    except OperationalError as e:
+        Console(stderr=True).print(
+            f"Warning: Can't reach the database ({e.orig}); "
+            "showing the local snapshot, which may be out of date.",
+            style="yellow",
+        )
+
+
+def _primary_session_factory() -> "SessionFactory":
+    from .db import get_default_session_factory
+
+    # All commands will use the same session factory (interact with the same DB)
+    return cli_session_factory or get_default_session_factory()
+
+
+def _snapshot(ctx: typer.Context) -> "Snapshot":
+    """The shell's snapshot, or one closed along with this command."""
+    if "snapshot" in ctx.obj:
+        return ctx.obj["snapshot"]
+    if "snapshot" not in ctx.meta:
+        from .snapshot import Snapshot
+
+        ctx.meta["snapshot"] = Snapshot()
+        ctx.call_on_close(ctx.meta["snapshot"].close)
+    return ctx.meta["snapshot"]
+
+
+def _fail(ctx: typer.Context, message: str):
+    ctx.obj["console"].print(f"[red]{message}[/red]")
+    raise typer.Exit(code=1)
+
+
 @app.command()
 def get(
     ctx: typer.Context,
@@ -43,7 +147,13 @@ def get(
     """
     Get and display a snippet by its ID.
     """
-    session_factory = ctx.obj["session_factory"]
+    from rich.panel import Panel
+    from rich.syntax import Syntax
+    from rich.text import Text
+
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx, reads_only=True)
     console = ctx.obj["console"]
 
     try:
@@ -112,32 +222,154 @@ def add(
             rich_help_panel="Optional",
         ),
     ] = "",
+    dedupe: Annotated[
+        DedupeMode,
+        typer.Option(
+            "--dedupe",
+            help="When the code is already stored: add it anyway, show the "
+            "stored snippet instead, or reject it",
+            rich_help_panel="Optional",
+        ),
+    ] = DedupeMode.off,
 ):
     """
     Add a new code snippet to the repository.
     """
-    session_factory = ctx.obj["session_factory"]
+    from . import cli_snippet_service
+    from .models import SnippetCreate
+
+    session_factory = _session_factory(ctx)
     console = ctx.obj["console"]
 
     snippet = SnippetCreate(
         title=title, code=code, description=description, language=LanguageEnum(language)
     )
-    cli_snippet_service.add_snippet(session_factory, snippet)
+    # Rejecting tells a stored copy apart from a new snippet for both modes
+    mode = DedupeMode.off if dedupe == DedupeMode.off else DedupeMode.reject
+    try:
+        cli_snippet_service.add_snippet(session_factory, snippet, mode)
+    except DuplicateSnippetError as e:
+        if dedupe == DedupeMode.reject:
+            _fail(ctx, f"Error: {e}")
+        stored = cli_snippet_service.get_snippet(session_factory, e.snippet_id)
+        console.print(f"Already stored: {stored}")
+        return
     console.print(f"Added snippet: {title}")
 
 
+@app.command("import")
+def import_(
+    ctx: typer.Context,
+    file: Annotated[
+        Path,
+        typer.Argument(
+            exists=True,
+            dir_okay=False,
+            readable=True,
+            help="JSON Lines file, or a JSON array, of snippets",
+        ),
+    ],
+    batch_size: Annotated[
+        int,
+        typer.Option("--batch-size", "-b", min=1, help="Rows per commit"),
+    ] = 1000,
+    dedupe: Annotated[
+        DedupeMode,
+        typer.Option(
+            "--dedupe",
+            help="Rows whose code is already stored, or earlier in the file: "
+            "import them anyway, skip them, or report them as errors",
+        ),
+    ] = DedupeMode.off,
+):
+    """
+    Import snippets in bulk from a file.
+
+    Each row is validated like `snipster add` input. Rows that fail are
+    reported by row number and skipped; the rest are still imported, and the
+    command exits with code 1 if anything was skipped. With --dedupe existing,
+    duplicate rows are skipped and counted without failing the import.
+    """
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx)
+    console = ctx.obj["console"]
+
+    start = time.perf_counter()
+    try:
+        with Progress(
+            SpinnerColumn(), TextColumn("{task.description}"), console=console
+        ) as progress:
+            task = progress.add_task("Importing...", total=None)
+
+            def report(imported: int) -> None:
+                rate = imported / (time.perf_counter() - start)
+                progress.update(
+                    task, description=f"Imported {imported:,} snippets ({rate:,.0f}/s)"
+                )
+
+            result = cli_snippet_service.import_snippets(
+                session_factory,
+                cli_snippet_service.read_import_rows(file),
+                batch_size=batch_size,
+                on_batch=report,
+                dedupe=dedupe,
+            )
+    except Exception as e:
+        console.print(f"[red]Import failed: {str(e)}[/red]")
+        raise typer.Exit(code=1)
+    elapsed = time.perf_counter() - start
+
+    console.print(
+        f"Imported {result.imported:,} snippets in {elapsed:.2f}s "
+        f"({result.imported / elapsed:,.0f}/s)"
+    )
+    if result.duplicates:
+        console.print(f"Skipped {result.duplicates:,} duplicate rows")
+    if result.errors:
+        console.print(f"[red]Skipped {len(result.errors):,} invalid rows:[/red]")
+        for row_number, error in result.errors[:MAX_REPORTED_ERRORS]:
+            # Messages can quote the row, which may contain markup-like text
+            console.print(f"  Row {row_number}: {error}", style="red", markup=False)
+        if len(result.errors) > MAX_REPORTED_ERRORS:
+            console.print(f"  ... and {len(result.errors) - MAX_REPORTED_ERRORS} more")
+        raise typer.Exit(code=1)
+
+
 @app.command()
-def list(ctx: typer.Context):
+def list(
+    ctx: typer.Context,
+    limit: Annotated[
+        int | None,
+        typer.Option("--limit", "-n", min=1, help="Show at most this many snippets"),
+    ] = None,
+    after: Annotated[
+        int | None,
+        typer.Option("--after", help="Start after the snippet with this ID"),
+    ] = None,
+    tag: Annotated[
+        str | None,
+        typer.Option("--tag", help="Only list snippets with this tag"),
+    ] = None,
+):
     """
-    List all snippets
+    List all snippets, ordered by ID
     """
-    session_factory = ctx.obj["session_factory"]
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx, reads_only=True)
     console = ctx.obj["console"]
 
-    snippets = cli_snippet_service.list_snippets(session_factory)
-    sorted_list = sorted(snippets, key=lambda x: x.id or 0)
-    for snippet in sorted_list:
+    snippets = cli_snippet_service.list_snippets(
+        session_factory, limit=limit, after=after, tag=tag
+    )
+    for snippet in snippets:
         console.print(snippet.__str__())
+    if limit is not None and len(snippets) == limit:
+        last_id = snippets[-1].id
+        console.print(f"[dim]Next page: --limit {limit} --after {last_id}[/dim]")
 
 
 @app.command()
@@ -148,7 +380,9 @@ def toggle_favorite(ctx: typer.Context, id: Annotated[int, typer.Argument]):
     This command will mark a snippet as favorite if it's not already favorited,
     or remove the favorite status if it's already favorited.
     """
-    session_factory = ctx.obj["session_factory"]
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx)
     console = ctx.obj["console"]
 
     try:
@@ -165,6 +399,47 @@ def toggle_favorite(ctx: typer.Context, id: Annotated[int, typer.Argument]):
         raise typer.Exit(code=1)
 
 
+# The list command above shadows the builtin, hence typing.List below
+@app.command()
+def tag(
+    ctx: typer.Context,
+    ids: Annotated[List[int], typer.Argument(help="IDs of the snippets to tag")],
+    tags: Annotated[
+        List[str],
+        typer.Option(..., "--tag", "-t", help="Tag to apply; repeat for several"),
+    ],
+    remove: Annotated[
+        bool, typer.Option("--remove", help="Remove the tags instead of adding them")
+    ] = False,
+):
+    """
+    Add tags to (or remove them from) one or more snippets.
+
+    All of the snippets are updated together, or none are if an ID is missing.
+    """
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx)
+    console = ctx.obj["console"]
+
+    update = (
+        cli_snippet_service.remove_tags_from_snippets
+        if remove
+        else cli_snippet_service.add_tags_to_snippets
+    )
+    try:
+        snippets = update(session_factory, ids, tags)
+    except SnippetNotFoundError as e:
+        console.print(f"[red]Error: {e}[/red]")
+        raise typer.Exit(code=1)
+    except Exception as e:
+        console.print(f"[red]Unexpected error: {str(e)}[/red]")
+        raise typer.Exit(code=1)
+
+    for snippet in snippets:
+        console.print(f"{snippet} [dim]{', '.join(snippet.tags)}[/dim]")
+
+
 @app.command()
 def search(
     ctx: typer.Context,
@@ -180,7 +455,9 @@ def search(
     descriptions, and tags. It will return all snippets that contain the
     search query in any of these fields.
     """
-    session_factory = ctx.obj["session_factory"]
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx, reads_only=True)
     console = ctx.obj["console"]
 
     snippets = cli_snippet_service.search_snippets(session_factory, query)
@@ -189,6 +466,51 @@ def search(
         console.print(snippet.__str__())
 
 
+@app.command()
+def find(
+    ctx: typer.Context,
+    query: Annotated[str, typer.Argument(help="Text to fuzzy match")],
+    limit: Annotated[
+        int, typer.Option("--limit", "-n", min=1, help="Show at most this many")
+    ] = 10,
+    min_score: Annotated[
+        float,
+        typer.Option("--min-score", min=0, max=100, help="Lowest score shown, 0-100"),
+    ] = 70,
+    as_json: Annotated[
+        bool, typer.Option("--json", help="Print one JSON object per line")
+    ] = False,
+):
+    """
+    Fuzzy search snippets, best matches first, with their scores.
+
+    Titles, tags, descriptions and the identifiers in the code are matched
+    with typos allowed; a snippet scores by its best matching field. With
+    --json each result is printed as a JSON line, score included, for piping
+    into other tools.
+    """
+    import json
+
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx, reads_only=True)
+    console = ctx.obj["console"]
+
+    matches = cli_snippet_service.find_snippets(
+        session_factory,
+        query,
+        limit=limit,
+        score_cutoff=min_score,
+        fuzzy_index=ctx.obj.get("fuzzy_index"),
+    )
+    for snippet, score in matches:
+        if as_json:
+            row = {"score": round(score, 1), **snippet.model_dump(mode="json")}
+            typer.echo(json.dumps(row))
+        else:
+            console.print(f"[dim]{score:5.1f}[/dim]  {snippet}")
+
+
 @app.command()
 def delete(
     ctx: typer.Context,
@@ -200,7 +522,9 @@ def delete(
     This command permanently removes a snippet from the repository.
     The deletion cannot be undone, so use this command carefully.
     """
-    session_factory = ctx.obj["session_factory"]
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx)
     console = ctx.obj["console"]
 
     try:
@@ -212,3 +536,135 @@ def delete(
     except Exception as e:
         console.print(f"[red]Unexpected error: {str(e)}[/red]")
         raise typer.Exit(code=1)
+
+
+@app.command()
+def snapshot(
+    ctx: typer.Context,
+    clear: Annotated[
+        bool, typer.Option("--clear", help="Delete the snapshot instead")
+    ] = False,
+):
+    """
+    Create or refresh the local snapshot that read commands are served from.
+
+    Once a snapshot exists, get, list, search and find read from it,
+    refreshing it first when it is older than SNIPSTER_SNAPSHOT_MAX_AGE
+    seconds (300 by default), and --offline reads from it without contacting
+    the database. Writes always go to the database. Use --clear to stop using
+    a snapshot.
+    """
+    console = ctx.obj["console"]
+    snapshot = _snapshot(ctx)
+    if clear:
+        snapshot.clear()
+        console.print(f"Deleted snapshot {snapshot.path}")
+        return
+    if ctx.meta["offline"]:
+        _fail(ctx, "Error: Refreshing the snapshot needs the database.")
+    primary = _session_factory(ctx)
+    try:
+        result = snapshot.refresh(primary)
+    except Exception as e:
+        console.print(f"[red]Snapshot failed: {str(e)}[/red]")
+        raise typer.Exit(code=1)
+    console.print(
+        f"Snapshot {snapshot.path}: copied {result.copied:,}, "
+        f"removed {result.removed:,}"
+    )
+
+
+@app.command()
+def dedupe(
+    ctx: typer.Context,
+    dry_run: Annotated[
+        bool,
+        typer.Option("--dry-run", help="Only list the duplicates to be merged"),
+    ] = False,
+):
+    """
+    Merge snippets with the same code into the oldest copy of each.
+
+    Code is compared per language, ignoring differences in whitespace. The
+    kept snippet gains the tags of its copies, is a favorite if any of them
+    was, and takes a description from them if it has none. The copies are
+    then deleted.
+    """
+    from . import cli_snippet_service
+
+    session_factory = _session_factory(ctx)
+    console = ctx.obj["console"]
+
+    try:
+        groups = cli_snippet_service.merge_duplicate_snippets(session_factory, dry_run)
+    except Exception as e:
+        console.print(f"[red]Dedupe failed: {str(e)}[/red]")
+        raise typer.Exit(code=1)
+    verb = "Would merge" if dry_run else "Merged"
+    for kept, copies in groups:
+        console.print(f"{verb} {', '.join(map(str, copies))} into {kept}")
+    copies_total = sum(len(copies) for _, copies in groups)
+    console.print(f"{verb} {copies_total:,} duplicates into {len(groups):,} snippets")
+
+
+def _shell(ctx: typer.Context) -> "Shell":
+    from . import cli_snippet_service
+    from .index import FuzzyIndex
+    from .shell import Completions, Shell
+
+    obj = {
+        "console": ctx.obj["console"],
+        "snapshot": _snapshot(ctx),
+        "fuzzy_index": FuzzyIndex(),
+    }
+    completions = Completions(
+        lambda: cli_snippet_service.completion_values(_primary_session_factory())
+    )
+    return Shell(typer.main.get_command(app), obj, completions)  # type: ignore[arg-type]
+
+
+@app.command()
+def shell(ctx: typer.Context):
+    """
+    Run snipster commands interactively, in one process.
+
+    Commands are typed without the leading `snipster`. The connection pool,
+    the snapshot and the fuzzy index are set up once and shared, so each
+    command costs only its own queries. History is kept between sessions,
+    and Tab completes commands, options, snippet ids and tags.
+    """
+    from .snapshot import user_cache_dir
+
+    _shell(ctx).repl(history=user_cache_dir() / "shell_history")
+
+
+@app.command()
+def batch(
+    ctx: typer.Context,
+    file: Annotated[
+        Path | None,
+        typer.Argument(
+            exists=True,
+            dir_okay=False,
+            readable=True,
+            help="Commands, one per line; read from stdin if not given",
+        ),
+    ] = None,
+    keep_going: Annotated[
+        bool,
+        typer.Option("--keep-going", "-k", help="Carry on after a failed command"),
+    ] = False,
+):
+    """
+    Run snipster commands from a file or stdin, one per line, in one process.
+
+    Lines are written as in `snipster shell`; blank lines and # comments are
+    skipped. Stops at the first failed command, and exits with its code,
+    unless --keep-going is given.
+    """
+    import sys
+
+    with file.open(encoding="utf-8") if file else nullcontext(sys.stdin) as lines:
+        code = _shell(ctx).batch(lines, keep_going=keep_going)
+    if code:
+        raise typer.Exit(code=code)
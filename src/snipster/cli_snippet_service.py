@@ -1,7 +1,15 @@
-from typing import Sequence
+import json
+from itertools import batched
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Sequence
+
+from pydantic import ValidationError
+from sqlmodel import select
 
 from .db import SessionFactory
-from .models import Snippet, SnippetCreate
+from .dedupe import DedupeMode, content_hash
+from .index import FuzzyIndex
+from .models import Snippet, SnippetCreate, SnippetSummary, Tag
 from .repo import DatabaseBackedSnippetRepo
 
 
@@ -16,23 +24,115 @@ def get_snippet(session_factory: SessionFactory, snippet_id: int) -> Snippet:
 
 
 def add_snippet(
-    session_factory: SessionFactory, snippet_data: SnippetCreate
+    session_factory: SessionFactory,
+    snippet_data: SnippetCreate,
+    dedupe: DedupeMode = DedupeMode.off,
 ) -> Snippet:
-    """Add a new snippet."""
+    """Add a new snippet, or with ``dedupe`` deal with a stored copy of it."""
     with session_factory.get_session() as session:
         repo = DatabaseBackedSnippetRepo(session=session)
-        return repo.add(snippet_data)
+        return repo.add(snippet_data, dedupe)
+
 
+def list_snippets(
+    session_factory: SessionFactory,
+    limit: int | None = None,
+    after: int | None = None,
+    tag: str | None = None,
+) -> Sequence[SnippetSummary]:
+    """List snippets in id order, optionally one page at a time.
 
-def list_snippets(session_factory: SessionFactory) -> Sequence[Snippet]:
-    """List all snippets."""
+    Listings don't show code, so summaries are fetched instead of full snippets.
+    """
     with session_factory.get_session() as session:
         repo = DatabaseBackedSnippetRepo(session=session)
-        snippets = repo.list()
-        # Properly detach all objects from the session
-        for snippet in snippets:
-            session.expunge(snippet)
-        return snippets
+        # Summaries are plain models, not ORM objects, so there's nothing to expunge
+        return repo.list_summaries(limit=limit, after=after, preview_length=0, tag=tag)
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    # (row number, what was wrong with it)
+    errors: list[tuple[int, str]]
+    # Rows skipped because their code was already stored or imported
+    duplicates: int = 0
+
+
+def read_import_rows(path: Path) -> Iterator[tuple[int, Any]]:
+    """Numbered rows of a JSON array or JSON Lines file.
+
+    JSON Lines rows are yielded as raw text and numbered by line, so they can
+    be streamed and parsed during validation; array items are numbered from 1.
+    """
+    with path.open(encoding="utf-8") as f:
+        is_array = f.read(1024).lstrip().startswith("[")
+        f.seek(0)
+        if is_array:
+            yield from enumerate(json.load(f), start=1)
+            return
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                yield line_number, line
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def import_snippets(
+    session_factory: SessionFactory,
+    rows: Iterable[tuple[int, Any]],
+    batch_size: int = 1000,
+    on_batch: Callable[[int], None] | None = None,
+    dedupe: DedupeMode = DedupeMode.off,
+) -> ImportResult:
+    """Validate and bulk insert snippets, committing every ``batch_size`` rows.
+
+    Invalid rows are collected in the result instead of stopping the import.
+    ``on_batch`` is called with the running total after each commit. With
+    ``dedupe``, rows whose code is already stored, or earlier in the file,
+    are skipped, or with ``DedupeMode.reject`` reported as errors.
+    """
+    imported = 0
+    duplicates = 0
+    errors: list[tuple[int, str]] = []
+    # Content hash -> where it was seen, for rows duplicating earlier rows
+    seen: dict[str, str] = {}
+    with session_factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session=session)
+        for batch in batched(rows, batch_size):
+            valid = []
+            for row_number, row in batch:
+                try:
+                    if isinstance(row, str):
+                        snippet = SnippetCreate.model_validate_json(row)
+                    else:
+                        snippet = SnippetCreate.model_validate(row)
+                except ValidationError as e:
+                    errors.append((row_number, _describe(e)))
+                else:
+                    valid.append((row_number, snippet))
+            if dedupe == DedupeMode.off:
+                snippets = [snippet for _, snippet in valid]
+            else:
+                hashes = [content_hash(s.code, s.language) for _, s in valid]
+                stored = repo.ids_by_content_hash(h for h in hashes if h not in seen)
+                seen |= {h: f"snippet {i}" for h, i in stored.items()}
+                snippets = []
+                for (row_number, snippet), digest in zip(valid, hashes):
+                    if digest not in seen:
+                        seen[digest] = f"row {row_number}"
+                        snippets.append(snippet)
+                    elif dedupe == DedupeMode.reject:
+                        errors.append((row_number, f"duplicate of {seen[digest]}"))
+                    else:
+                        duplicates += 1
+            imported += len(repo.add_many(snippets))
+            if on_batch is not None:
+                on_batch(imported)
+    return ImportResult(imported, errors, duplicates)
 
 
 def delete_snippet(session_factory: SessionFactory, snippet_id: int) -> None:
@@ -48,10 +148,7 @@ def toggle_snippet_favorite(
     """Toggle the favorite status of a snippet and return the updated snippet."""
     with session_factory.get_session() as session:
         repo = DatabaseBackedSnippetRepo(session=session)
-        snippet = repo.get(snippet_id)
-        snippet.favorite = not snippet.favorite
-        session.commit()
-        session.refresh(snippet)
+        snippet = repo.toggle_favorite(snippet_id)
         # Properly detach the object from the session
         session.expunge(snippet)
         return snippet
@@ -86,6 +183,30 @@ def remove_tag_from_snippet(
         repo.remove_tag(snippet_id, tag)
 
 
+def add_tags_to_snippets(
+    session_factory: SessionFactory, snippet_ids: Sequence[int], tags: Sequence[str]
+) -> Sequence[Snippet]:
+    """Add tags to one or more snippets in a single transaction."""
+    with session_factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session=session)
+        snippets = repo.add_tags_to_many(snippet_ids, tags)
+        for snippet in snippets:
+            session.expunge(snippet)
+        return snippets
+
+
+def remove_tags_from_snippets(
+    session_factory: SessionFactory, snippet_ids: Sequence[int], tags: Sequence[str]
+) -> Sequence[Snippet]:
+    """Remove tags from one or more snippets in a single transaction."""
+    with session_factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session=session)
+        snippets = repo.remove_tags_from_many(snippet_ids, tags)
+        for snippet in snippets:
+            session.expunge(snippet)
+        return snippets
+
+
 def fuzzy_search_snippets(
     session_factory: SessionFactory, query: str
 ) -> Sequence[Snippet]:
@@ -97,3 +218,43 @@ def fuzzy_search_snippets(
         for snippet in snippets:
             session.expunge(snippet)
         return snippets
+
+
+def find_snippets(
+    session_factory: SessionFactory,
+    query: str,
+    limit: int = 10,
+    score_cutoff: float = 70,
+    fuzzy_index: FuzzyIndex | None = None,
+) -> list[tuple[Snippet, float]]:
+    """The best fuzzy matches and their scores, best first.
+
+    Ranking scores every snippet before any match is known to be among the
+    best, so all of them come back at once. Only the top ``limit`` are kept
+    while ranking, and loaded in one query. A ``fuzzy_index`` kept between
+    calls is loaded once; later calls read only the rows written since, and
+    only when the ``SnippetVersion`` has moved.
+    """
+    with session_factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session=session, fuzzy_index=fuzzy_index)
+        matches = list(repo.fuzzy_search_scored(query, limit, score_cutoff))
+        for snippet, _ in matches:
+            session.expunge(snippet)
+        return matches
+
+
+def completion_values(session_factory: SessionFactory) -> tuple[list[int], list[str]]:
+    """Every snippet id and tag name, for tab completion in the shell."""
+    with session_factory.get_session() as session:
+        snippet_ids = list(session.exec(select(Snippet.id).order_by(Snippet.id)))
+        tags = list(session.exec(select(Tag.name).order_by(Tag.name)))
+        return snippet_ids, tags  # type: ignore[return-value]
+
+
+def merge_duplicate_snippets(
+    session_factory: SessionFactory, dry_run: bool = False
+) -> list[tuple[int, list[int]]]:
+    """Merge snippets with the same code into the oldest copy of each."""
+    with session_factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session=session)
+        return repo.merge_duplicates(dry_run)
@@ -0,0 +1,41 @@
+"""Compressed storage for large code bodies.
+
+Code longer than ``COMPRESS_THRESHOLD`` characters, such as generated files,
+is zlib-compressed into a ``CodeBlob`` row keyed by the SHA-256 of the exact
+code, so snippets holding the same code share one blob. The snippet row keeps
+only the first ``HEAD_LENGTH`` characters in ``code``, which the full-text
+index, the fuzzy index and previews run over, plus the blob's digest in
+``code_blob``. Listings therefore never read the blobs, and the repository
+puts the full code back only into snippets it returns whole.
+
+Search still matches past the head: after the indexed query, it decompresses
+the blobs and matches their text too. That costs time with each search in
+proportion to the compressed code stored, rather than storing the code a
+second time, uncompressed, for an index.
+"""
+
+import hashlib
+import zlib
+
+# Characters of code above which it is compressed into a blob
+COMPRESS_THRESHOLD = 64 * 1024
+# Characters of a compressed snippet's code kept in its row
+HEAD_LENGTH = 4096
+COMPRESSION_LEVEL = 6
+
+
+def digest(code: str) -> str:
+    """SHA-256 of ``code`` exactly as given, as hex."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def should_compress(code: str) -> bool:
+    return len(code) > COMPRESS_THRESHOLD
+
+
+def compress(code: str) -> bytes:
+    return zlib.compress(code.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
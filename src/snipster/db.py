@@ -1,30 +1,424 @@
+import logging
 import os
+import threading
+import time
 from contextlib import contextmanager
-from typing import Generator
+from contextvars import ContextVar
+from functools import cache
+from itertools import count
+from typing import Any, Generator, Iterator, Sequence
 
 from dotenv import load_dotenv
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import Engine, Select, event, exc
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Session, create_engine
 
+from .exceptions import QueryBudgetExceededError
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class EngineSettings(BaseSettings):
+    """Engine and pool tuning, read from ``DB_*`` environment variables.
+
+    Pool settings apply to pooled engines (Postgres, SQLite files). The
+    ``sqlite_*`` settings are applied as pragmas on every new SQLite
+    connection.
+    """
+
+    model_config = SettingsConfigDict(env_prefix="DB_")
+
+    echo: bool = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    # Seconds before a connection is replaced; -1 keeps them forever
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # Compiled SQL statements SQLAlchemy caches per engine
+    statement_cache_size: int = 500
+
+    # WAL lets readers carry on while a writer commits
+    sqlite_journal_mode: str = "WAL"
+    # Safe with WAL; only the last commits can be lost, and only on power loss
+    sqlite_synchronous: str = "NORMAL"
+    # Milliseconds a writer waits for the lock instead of failing at once
+    sqlite_busy_timeout: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # Negative values are KiB, so this is a 64 MiB page cache
+    sqlite_cache_size: int = -64_000
+
+    # Log a warning, with the statements, when one API request or CLI command
+    # runs more than this many; 0 turns the check off
+    query_warning_threshold: int = 25
+    # Report each request's statement count and time in response headers,
+    # and each CLI command's on stderr
+    query_debug: bool = False
+
+    # Read replicas, as a JSON list of URLs; reads are spread over them
+    replica_urls: list[str] = []
+    # Seconds a replica that failed to connect is left out before a retry
+    replica_retry_after: float = 30
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url: str | URL, settings: EngineSettings) -> dict[str, Any]:
+    """Keyword arguments for ``create_engine``/``create_async_engine``."""
+    options: dict[str, Any] = {
+        "echo": settings.echo,
+        "query_cache_size": settings.statement_cache_size,
+    }
+    # In-memory SQLite keeps one connection per thread, with nothing to size
+    if not _is_memory_sqlite(make_url(url)):
+        options |= {
+            "pool_size": settings.pool_size,
+            "max_overflow": settings.max_overflow,
+            "pool_timeout": settings.pool_timeout,
+            "pool_recycle": settings.pool_recycle,
+            "pool_pre_ping": settings.pool_pre_ping,
+        }
+    return options
+
+
+def apply_sqlite_pragmas(engine: Engine, settings: EngineSettings) -> None:
+    """Set the tuned pragmas on each connection ``engine`` opens."""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout,
+        "mmap_size": settings.sqlite_mmap_size,
+        "cache_size": settings.sqlite_cache_size,
+        "temp_store": "MEMORY",
+    }
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+class QueryStats:
+    """The statements run inside one ``collect_queries`` block, and their time."""
+
+    __slots__ = ("count", "seconds", "statements", "parent")
+
+    def __init__(self, parent: "QueryStats | None" = None) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: list[str] = []
+        # Statements also count towards every enclosing block
+        self.parent = parent
+
+    def describe(self) -> str:
+        return "\n".join(
+            f"{n}. {' '.join(statement.split())}"
+            for n, statement in enumerate(self.statements, 1)
+        )
+
+
+_current_queries: ContextVar[QueryStats | None] = ContextVar(
+    "current_queries", default=None
+)
+
+
+@contextmanager
+def collect_queries(
+    label: str = "block", warning_threshold: int = 0
+) -> Iterator[QueryStats]:
+    """Count and time the statements run on tracked engines inside the block.
+
+    The block is whatever runs in the current context, which includes the
+    async engine's greenlets. With a ``warning_threshold``, running more
+    statements than that logs a warning listing them, under ``label``.
+    """
+    stats = QueryStats(parent=_current_queries.get())
+    token = _current_queries.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_queries.reset(token)
+        if warning_threshold and stats.count > warning_threshold:
+            logger.warning(
+                "%s ran %d SQL statements (threshold %d):\n%s",
+                label,
+                stats.count,
+                warning_threshold,
+                stats.describe(),
+            )
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryStats]:
+    """Fail if the block runs more than ``max_queries`` statements.
+
+    For tests and benchmarks, to catch N+1 patterns as they creep in.
+    """
+    with collect_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise QueryBudgetExceededError(
+            f"Ran {stats.count} SQL statements, over the budget of "
+            f"{max_queries}:\n{stats.describe()}"
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    if _current_queries.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    stats = _current_queries.get()
+    started = conn.info.get("query_started")
+    if stats is None or not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    while stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+        stats.statements.append(statement)
+        stats = stats.parent
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def track_queries(engine: Engine) -> None:
+    """Report ``engine``'s statements to ``collect_queries`` blocks.
+
+    Outside a block this costs one context variable lookup per statement.
+    Calling it again for the same engine is harmless.
+    """
+    for name, fn in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+        ("handle_error", _handle_error),
+    ):
+        if not event.contains(engine, name, fn):
+            event.listen(engine, name, fn)
+
+
+def create_configured_engine(
+    url: str | URL, settings: EngineSettings | None = None
+) -> Engine:
+    """An engine tuned by ``settings`` (read from the environment by default)."""
+    settings = settings or EngineSettings()
+    engine = create_engine(url, **engine_options(url, settings))
+    apply_sqlite_pragmas(engine, settings)
+    track_queries(engine)
+    return engine
+
+
+def pool_status(engine: Engine) -> dict[str, int]:
+    """Connection counts for ``engine``'s pool, for health checks and metrics."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+class ReplicaSet:
+    """Read replica engines, handed out round-robin.
+
+    A replica that can't be connected to, or drops its connection, is
+    ejected: left out for ``retry_after`` seconds, then tried again. With
+    every replica ejected, ``choose`` returns None and reads go to the
+    primary.
+    """
+
+    def __init__(self, engines: Sequence[Engine], retry_after: float = 30) -> None:
+        self.engines = list(engines)
+        self.retry_after = retry_after
+        self._turn = count()
+        self._ejected_until: dict[Engine, float] = {}
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, "handle_error", self._handle_error)
+
+    def choose(self) -> Engine | None:
+        now = time.monotonic()
+        for _ in self.engines:
+            engine = self.engines[next(self._turn) % len(self.engines)]
+            if self._ejected_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+    def eject(self, engine: Engine) -> None:
+        with self._lock:
+            self._ejected_until[engine] = time.monotonic() + self.retry_after
+        logger.warning(
+            "Replica %s ejected for %ss",
+            engine.url.render_as_string(hide_password=True),
+            self.retry_after,
+        )
+
+    def is_ejected(self, engine: Engine) -> bool:
+        return self._ejected_until.get(engine, 0) > time.monotonic()
+
+    def _handle_error(self, exception_context) -> None:
+        # No connection means connecting failed; other errors, like a bad
+        # query, say nothing about the replica's health
+        if exception_context.connection is None or exception_context.is_disconnect:
+            self.eject(exception_context.engine)
+
+    def status(self) -> list[dict[str, Any]]:
+        """Health and pool counts per replica, for health checks."""
+        return [
+            {
+                "url": engine.url.render_as_string(hide_password=True),
+                "healthy": not self.is_ejected(engine),
+                **pool_status(engine),
+            }
+            for engine in self.engines
+        ]
+
+
+def create_replica_set(
+    urls: Sequence[str], settings: EngineSettings | None = None
+) -> ReplicaSet | None:
+    """A ``ReplicaSet`` of configured engines for ``urls``, if there are any."""
+    if not urls:
+        return None
+    settings = settings or EngineSettings()
+    engines = [create_configured_engine(url, settings) for url in urls]
+    return ReplicaSet(engines, settings.replica_retry_after)
+
+
+def use_primary(session: Session) -> None:
+    """Send the rest of ``session``'s statements to the primary.
+
+    Repository methods that write call this first, so what they read before
+    writing is current. Objects already read from a replica are expired, to
+    be reloaded from the primary when next used.
+    """
+    if session.info.get("use_primary"):
+        return
+    session.info["use_primary"] = True
+    if session.info.pop("replica", None) is not None:
+        session.expire_all()
+
+
+class RoutingSession(Session):
+    """A session that reads from a replica until it writes.
+
+    Each session picks one replica, so its reads see one consistent copy.
+    Once the session writes, or ``use_primary`` is called, everything goes
+    to the primary, so a request reads its own writes. A single read can go
+    to the primary on its own with the ``use_primary`` execution option. A
+    replica that can't be reached when the session first uses it is skipped
+    for another one, or the primary.
+    """
+
+    def __init__(self, *args, replicas: ReplicaSet, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if not self.info.get("use_primary"):
+            if not isinstance(clause, Select) or self._flushing:
+                # Anything but a read writes, or might
+                self.info["use_primary"] = True
+            elif not clause.get_execution_options().get("use_primary"):
+                replica = self.info.get("replica")
+                if replica is None or self.replicas.is_ejected(replica):
+                    replica = self.info["replica"] = self.replicas.choose()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+    def _run(self, method, *args, **kwargs):
+        try:
+            result = method(*args, **kwargs)
+        except exc.DBAPIError:
+            replica = self.info.get("replica")
+            if (
+                replica is None
+                or self.info.get("replica_used")
+                or not self.replicas.is_ejected(replica)
+            ):
+                raise
+            # Nothing was read from it yet, so another copy can answer
+            self.rollback()
+            return self._run(method, *args, **kwargs)
+        if self.info.get("replica") is not None:
+            self.info["replica_used"] = True
+        return result
+
+    # ``exec`` calls Session.execute directly, so both need wrapping
+    def exec(self, *args, **kwargs):
+        return self._run(super().exec, *args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._run(super().execute, *args, **kwargs)
+
+
 db_url = os.getenv("DATABASE_URL", "sqlite:///snipster.sqlite")
-engine = create_engine(db_url, echo=False)
+
+
+@cache
+def get_engine() -> Engine:
+    """The engine for ``DATABASE_URL``, created on first use, not at import."""
+    return create_configured_engine(db_url)
 
 
 class SessionFactory:
-    def __init__(self, engine):
+    """Sessions on ``engine``, reading from ``replicas`` when there are any.
+
+    With replicas, sessions are ``RoutingSession``s; see there for which
+    statements go where.
+    """
+
+    def __init__(self, engine, replicas: ReplicaSet | None = None):
         self.engine = engine
+        self.replicas = replicas
         self._sessions = []  # Track sessions
 
+    @classmethod
+    def from_urls(
+        cls,
+        primary_url: str | URL,
+        replica_urls: Sequence[str] = (),
+        settings: EngineSettings | None = None,
+    ) -> "SessionFactory":
+        return cls(
+            create_configured_engine(primary_url, settings),
+            create_replica_set(replica_urls, settings),
+        )
+
+    def _new_session(self) -> Session:
+        if self.replicas is None:
+            return Session(self.engine)
+        return RoutingSession(self.engine, replicas=self.replicas)
+
     def create_session(self) -> Session:
         """Create a session without context management."""
-        session = Session(self.engine)
+        session = self._new_session()
         self._sessions.append(session)
         return session
 
     @contextmanager
     def get_session(self) -> Generator[Session, None, None]:
-        session = Session(self.engine)
+        session = self._new_session()
         self._sessions.append(session)
         try:
             yield session
@@ -48,4 +442,18 @@ class SessionFactory:
         self._sessions.clear()
 
 
-default_session_factory = SessionFactory(engine)
+@cache
+def get_default_session_factory() -> SessionFactory:
+    settings = EngineSettings()
+    return SessionFactory(
+        get_engine(), create_replica_set(settings.replica_urls, settings)
+    )
+
+
+def __getattr__(name: str) -> Any:
+    # ``db.engine`` and ``db.default_session_factory`` still work, lazily
+    if name == "engine":
+        return get_engine()
+    if name == "default_session_factory":
+        return get_default_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
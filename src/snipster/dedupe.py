@@ -0,0 +1,34 @@
+"""Content hashes that identify the same snippet pasted more than once.
+
+Kept free of heavy imports, like ``languages``, so the CLI can offer the
+modes without loading the database layer.
+"""
+
+import hashlib
+from enum import Enum
+
+
+class DedupeMode(str, Enum):
+    """What adding a snippet whose content is already stored does."""
+
+    # Store it anyway
+    off = "off"
+    # Hand back the stored snippet instead
+    existing = "existing"
+    # Refuse it with ``DuplicateSnippetError``
+    reject = "reject"
+
+
+def normalize_code(code: str) -> str:
+    """``code`` with every run of whitespace collapsed to one space."""
+    return " ".join(code.split())
+
+
+def content_hash(code: str, language: str) -> str:
+    """SHA-256 of the language and whitespace-normalized code, as hex.
+
+    Snippets differing only in indentation, line endings or trailing blanks
+    hash the same; the title, description and tags don't count.
+    """
+    content = f"{language.lower()}\0{normalize_code(code)}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
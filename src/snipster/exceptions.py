@@ -1,2 +1,14 @@
 class SnippetNotFoundError(Exception):
     pass
+
+
+class QueryBudgetExceededError(AssertionError):
+    """A block ran more SQL statements than its ``query_budget`` allows."""
+
+
+class DuplicateSnippetError(Exception):
+    """The snippet's content is already stored, as ``snippet_id``."""
+
+    def __init__(self, snippet_id: int) -> None:
+        super().__init__(f"Snippet duplicates snippet with id {snippet_id}.")
+        self.snippet_id = snippet_id
@@ -0,0 +1,107 @@
+"""Full-text index over the searchable snippet columns.
+
+SQLite gets an external-content FTS5 table using the trigram tokenizer, which
+answers the same case-insensitive substring queries as ``ILIKE '%q%'`` from an
+index. Triggers keep it in sync with every insert, update and delete on the
+``snippet`` table, so tag changes are picked up along with everything else.
+
+Postgres gets ``pg_trgm`` GIN indexes, which let the planner serve the existing
+``ILIKE`` predicates directly instead of scanning the table.
+
+The DDL is attached to the ``snippet`` table so ``SQLModel.metadata.create_all``
+builds it too; existing databases get it from the Alembic migration.
+"""
+
+from sqlalchemy import DDL, Table, column, event, select, table, text
+
+FTS_TABLE = "snippet_fts"
+
+# Trigram matching needs at least three characters to produce a token
+MIN_QUERY_LENGTH = 3
+
+SQLITE_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, code, description, tags,
+        content='snippet', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON snippet BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, code, description, tags)
+        VALUES (new.id, new.title, new.code, new.description, new.tags);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON snippet BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, code, description, tags)
+        VALUES ('delete', old.id, old.title, old.code, old.description, old.tags);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON snippet BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, code, description, tags)
+        VALUES ('delete', old.id, old.title, old.code, old.description, old.tags);
+        INSERT INTO {FTS_TABLE}(rowid, title, code, description, tags)
+        VALUES (new.id, new.title, new.code, new.description, new.tags);
+    END
+    """,
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_snippet_title_trgm "
+    "ON snippet USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_snippet_code_trgm "
+    "ON snippet USING gin (code gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_snippet_description_trgm "
+    "ON snippet USING gin (description gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_snippet_tags_trgm "
+    "ON snippet USING gin ((CAST(tags AS TEXT)) gin_trgm_ops)",
+]
+
+_fts_table = table(FTS_TABLE, column("rowid"))
+
+
+def install(snippet_table: Table) -> None:
+    """Create the full-text index whenever the snippet table is created."""
+    for statement in SQLITE_DDL:
+        event.listen(
+            snippet_table,
+            "after_create",
+            DDL(statement).execute_if(dialect="sqlite"),
+        )
+    for statement in POSTGRES_DDL:
+        event.listen(
+            snippet_table,
+            "after_create",
+            DDL(statement).execute_if(dialect="postgresql"),
+        )
+    event.listen(
+        snippet_table,
+        "before_drop",
+        DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite"),
+    )
+
+
+def can_match(dialect_name: str, query: str) -> bool:
+    """Whether ``query`` can be answered from the FTS5 index.
+
+    ILIKE treats ``%`` and ``_`` as wildcards, which FTS5 has no equivalent
+    for, so those queries (and ones too short to tokenize) use the scan.
+    """
+    return (
+        dialect_name == "sqlite"
+        and len(query) >= MIN_QUERY_LENGTH
+        and "%" not in query
+        and "_" not in query
+    )
+
+
+def matching_ids(query: str):
+    """Subquery of snippet ids whose indexed columns contain ``query``."""
+    # A quoted phrase of trigrams matches the query as a contiguous substring
+    phrase = '"' + query.replace('"', '""') + '"'
+    return select(_fts_table.c.rowid).where(
+        text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=phrase)
+    )
@@ -0,0 +1,274 @@
+import heapq
+import re
+from datetime import datetime
+from itertools import islice
+from threading import Lock
+from typing import Callable, Iterable, NamedTuple
+
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz import process as rapidfuzz_process
+from rapidfuzz.utils import default_process
+
+# Fields scored by fuzzy search, and how much a match in each one counts
+DEFAULT_FUZZY_WEIGHTS = {
+    "title": 1.0,
+    "tags": 0.95,
+    "description": 0.85,
+    "identifiers": 0.8,
+}
+FUZZY_FIELDS = tuple(DEFAULT_FUZZY_WEIGHTS)
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Keeps huge generated files from dominating the scoring time
+MAX_IDENTIFIERS = 64
+
+
+def _fuzzy_fields(snippet) -> list[str]:
+    """Preprocessed text for each of ``FUZZY_FIELDS``, in order."""
+    identifiers = dict.fromkeys(_IDENTIFIER.findall(snippet.code or ""))
+    return [
+        default_process(snippet.title),
+        default_process(" ".join(snippet.tags or [])),
+        default_process(snippet.description or ""),
+        default_process(" ".join(islice(identifiers, MAX_IDENTIFIERS))),
+    ]
+
+
+class FuzzyIndexChanges(NamedTuple):
+    """What a ``FuzzyIndex`` lacks to match the database, read by the repo."""
+
+    # The SnippetVersion the rows were read at
+    version: int
+    # Every row on a reload, else only rows written since the last sync
+    rows: list
+    reload: bool
+
+
+class FuzzyIndex:
+    """Snippet text kept preprocessed in memory for fuzzy search.
+
+    Each snippet contributes its title, tags, description and the identifiers
+    in its code, run through rapidfuzz's ``default_process`` once when the
+    snippet enters the index. A query scores every field of every snippet in
+    one ``cdist`` call, and a snippet's score is its best weighted field.
+
+    The repos keep the index current on their own writes. The index also
+    records the ``SnippetVersion`` it reflects, so a long-lived index notices
+    writes from other processes: the repo reads the version before each
+    search, and on a change ``apply`` takes in the rows written since, or
+    every row once some were deleted.
+    """
+
+    def __init__(self, weights: dict[str, float] | None = None) -> None:
+        self.weights = {**DEFAULT_FUZZY_WEIGHTS, **(weights or {})}
+        if not all(0 <= w <= 1 for w in self.weights.values()):
+            raise ValueError("Fuzzy field weights must be between 0 and 1.")
+        self._weights = np.array([self.weights[f] for f in FUZZY_FIELDS])
+        # Flat, parallel storage so cdist can take the choices as one list:
+        # snippet ``_ids[n]`` owns ``_choices[n * width : (n + 1) * width]``
+        self._ids: list[int] = []
+        self._choices: list[str] = []
+        self._positions: dict[int, int] = {}
+        self._lock = Lock()
+        self.loaded = False
+        self.max_id = 0
+        # The database version the entries reflect, and the latest write time
+        # (``updated_at``, else ``created_at``) among the rows read for them
+        self.version: int | None = None
+        self.watermark: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, snippet_id: int) -> bool:
+        return snippet_id in self._positions
+
+    def load(self, snippets: Iterable) -> None:
+        """Replace the index contents with ``snippets``.
+
+        Anything with ``id``, ``title``, ``tags``, ``description`` and
+        ``code`` attributes works, so plain result rows can skip ORM hydration.
+        """
+        ids, choices = [], []
+        for snippet in snippets:
+            ids.append(snippet.id)
+            choices.extend(_fuzzy_fields(snippet))
+        with self._lock:
+            self._ids = ids
+            self._choices = choices
+            self._positions = {snippet_id: n for n, snippet_id in enumerate(ids)}
+            self.max_id = max(ids, default=0)
+            self.loaded = True
+
+    def apply(self, changes: FuzzyIndexChanges) -> None:
+        """Bring the index up to ``changes.version``.
+
+        The rows also need a ``written`` attribute, which moves the watermark.
+        """
+        if changes.reload:
+            self.load(changes.rows)
+        else:
+            for row in changes.rows:
+                self.add(row)
+        written = [row.written for row in changes.rows if row.written is not None]
+        with self._lock:
+            if self.watermark is not None and not changes.reload:
+                written.append(self.watermark)
+            self.watermark = max(written, default=None)
+            self.version = changes.version
+
+    def advance(self, version: int) -> None:
+        """Record a write this process made, which took the database to
+        ``version`` and updates the index itself.
+
+        Only a step from the version the index reflects is taken, since
+        anything else means another process wrote in between.
+        """
+        with self._lock:
+            if self.version is not None and self.version == version - 1:
+                self.version = version
+
+    def add(self, snippet) -> None:
+        """Index ``snippet``, replacing any previous entry for its id."""
+        # Until the first load the database is the source of truth
+        if not self.loaded:
+            return
+        fields = _fuzzy_fields(snippet)
+        width = len(FUZZY_FIELDS)
+        with self._lock:
+            position = self._positions.get(snippet.id)
+            if position is None:
+                self._positions[snippet.id] = len(self._ids)
+                self._ids.append(snippet.id)
+                self._choices.extend(fields)
+            else:
+                self._choices[position * width : (position + 1) * width] = fields
+            self.max_id = max(self.max_id, snippet.id)
+
+    def remove(self, snippet_id: int) -> None:
+        width = len(FUZZY_FIELDS)
+        with self._lock:
+            position = self._positions.pop(snippet_id, None)
+            if position is None:
+                return
+            # Move the last entry into the hole so removal stays O(1)
+            last = len(self._ids) - 1
+            if position != last:
+                moved = self._ids[last]
+                self._ids[position] = moved
+                self._positions[moved] = position
+                self._choices[position * width : (position + 1) * width] = (
+                    self._choices[last * width :]
+                )
+            self._ids.pop()
+            del self._choices[last * width :]
+
+    def search(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> list[tuple[int, float]]:
+        """Return ``(snippet_id, score)`` for the best matches, best first."""
+        processed_query = default_process(query)
+        with self._lock:
+            if not self._ids:
+                return []
+            scores = rapidfuzz_process.cdist(
+                [processed_query],
+                self._choices,
+                scorer=fuzz.WRatio,
+                processor=None,
+                # Weights never exceed 1, so a field under the cutoff can't win
+                score_cutoff=score_cutoff,
+                workers=-1,
+            )
+            weighted = (scores.reshape(-1, len(FUZZY_FIELDS)) * self._weights).max(
+                axis=1
+            )
+            hits = np.flatnonzero(weighted >= score_cutoff)
+            # Bounded heap instead of sorting every hit; ties go to the older id
+            best = heapq.nlargest(
+                limit, ((float(weighted[n]), -self._ids[n]) for n in hits)
+            )
+        return [(-negated_id, score) for score, negated_id in best]
+
+
+def ilike_matcher(query: str) -> Callable[[str], bool]:
+    """Whether lowercase text matches ``ILIKE '%query%'``, wildcards included."""
+    query = query.lower()
+    if "%" not in query and "_" not in query:
+        return lambda text: query in text
+    pattern = re.compile(
+        "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in query),
+        re.DOTALL,
+    )
+    return lambda text: pattern.search(text) is not None
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Trigram posting lists for case-insensitive substring search.
+
+    Each document is a tuple of text fields. A query is broken into trigrams,
+    the posting lists for those trigrams are intersected (smallest first) and
+    only the surviving documents are checked against the query. Matching
+    follows ``ILIKE '%query%'`` per field, including ``%`` and ``_`` acting as
+    wildcards, so results agree with the database-backed search.
+    """
+
+    def __init__(self) -> None:
+        self._postings: dict[str, set[int]] = {}
+        self._docs: dict[int, tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: int, fields: Iterable[str | None]) -> None:
+        """Index ``fields`` under ``doc_id``, replacing any previous entry."""
+        self.remove(doc_id)
+        doc = tuple(field.lower() for field in fields if field)
+        self._docs[doc_id] = doc
+        for gram in set().union(*(_trigrams(field) for field in doc)):
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id: int) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for gram in set().union(*(_trigrams(field) for field in doc)):
+            ids = self._postings[gram]
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[gram]
+
+    def search(self, query: str) -> list[int]:
+        """Return the ids of documents with a field matching ``query``, in order."""
+        query = query.lower()
+        # Every literal run between wildcards has to appear in a match
+        grams = set().union(*(_trigrams(part) for part in re.split("[%_]", query)))
+        postings = []
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is None:
+                return []
+            postings.append(ids)
+
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for ids in postings[1:]:
+                candidates &= ids
+                if not candidates:
+                    return []
+        else:
+            # Queries too short to produce a trigram check every document
+            candidates = set(self._docs)
+
+        matches = ilike_matcher(query)
+        return sorted(
+            doc_id
+            for doc_id in candidates
+            if any(matches(field) for field in self._docs[doc_id])
+        )
@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+# Kept apart from models so the CLI can offer these as choices without
+# importing SQLModel just to show --help
+class Language(str, Enum):
+    javascript = "javascript"
+    python = "python"
+    rust = "rust"
@@ -0,0 +1,271 @@
+"""In-process request metrics, exposed in the Prometheus text format.
+
+``MetricsMiddleware`` times every HTTP request and records it, by method and
+route template, in a ``RequestMetrics``. The statements each request runs,
+and the time they take, come from ``db.collect_queries``.
+"""
+
+import math
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .db import EngineSettings, QueryStats, collect_queries
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+SIZE_BUCKETS = tuple(256 * 4**n for n in range(9))  # 256 B to 16 MiB
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Label for requests that matched no route, so 404 probes can't add labels
+UNMATCHED_ROUTE = "unmatched"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus defines them."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket; made cumulative on output
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        total, result = 0, []
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """Estimate by interpolating within the bucket, like histogram_quantile.
+
+        Values beyond the last bucket are reported as its upper bound.
+        """
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        lower, below = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if math.isinf(bound):
+                    return lower
+                in_bucket = total - below
+                return lower + (bound - lower) * (rank - below) / in_bucket
+            lower, below = bound, total
+        return lower  # pragma: no cover - the +Inf bucket always holds rank
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape(str(v))}"' for name, v in labels.items())
+
+
+class RequestMetrics:
+    """Per-route counts, latencies, response sizes and database time.
+
+    Rendered as Prometheus metrics by ``render``. Latency is exported both
+    as a histogram, for aggregating across instances, and as a summary of
+    p50/p95/p99 estimated from it, for reading directly.
+    """
+
+    def __init__(
+        self,
+        latency_buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        size_buckets: tuple[float, ...] = SIZE_BUCKETS,
+        db_time_buckets: tuple[float, ...] = DB_TIME_BUCKETS,
+        query_count_buckets: tuple[float, ...] = QUERY_COUNT_BUCKETS,
+    ) -> None:
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self.db_time_buckets = db_time_buckets
+        self.query_count_buckets = query_count_buckets
+        self._lock = Lock()
+        self.in_flight = 0
+        self.requests: dict[tuple[str, str, int], int] = {}
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.response_size: dict[tuple[str, str], Histogram] = {}
+        self.db_time: dict[tuple[str, str], Histogram] = {}
+        self.queries: dict[tuple[str, str], Histogram] = {}
+
+    def started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        response_bytes: int,
+        queries: QueryStats,
+    ) -> None:
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[method, route, status] = (
+                self.requests.get((method, route, status), 0) + 1
+            )
+            if key not in self.latency:
+                self.latency[key] = Histogram(self.latency_buckets)
+                self.response_size[key] = Histogram(self.size_buckets)
+                self.db_time[key] = Histogram(self.db_time_buckets)
+                self.queries[key] = Histogram(self.query_count_buckets)
+            self.latency[key].observe(seconds)
+            self.response_size[key].observe(response_bytes)
+            self.db_time[key].observe(queries.seconds)
+            self.queries[key].observe(queries.count)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histograms(name: str, help_text: str, family: dict) -> None:
+            header(name, "histogram", help_text)
+            for (method, route), histogram in sorted(family.items()):
+                labels = _labels(method=method, route=route)
+                for bound, total in histogram.cumulative():
+                    le = _format_value(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+                lines.append(f"{name}_sum{{{labels}}} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        with self._lock:
+            header(
+                "snipster_http_requests_total",
+                "counter",
+                "HTTP requests handled, by route and status.",
+            )
+            for (method, route, status), count in sorted(self.requests.items()):
+                labels = _labels(method=method, route=route, status=str(status))
+                lines.append(f"snipster_http_requests_total{{{labels}}} {count}")
+
+            header(
+                "snipster_http_requests_in_flight",
+                "gauge",
+                "HTTP requests being handled right now.",
+            )
+            lines.append(f"snipster_http_requests_in_flight {self.in_flight}")
+
+            histograms(
+                "snipster_http_request_duration_seconds",
+                "Time to handle a request, including streaming the body.",
+                self.latency,
+            )
+            name = "snipster_http_request_latency_seconds"
+            header(name, "summary", "Request latency quantiles, from the histogram.")
+            for (method, route), histogram in sorted(self.latency.items()):
+                labels = _labels(method=method, route=route)
+                for q in QUANTILES:
+                    value = _format_value(histogram.quantile(q))
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {value}')
+                lines.append(f"{name}_sum{{{labels}}} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+            histograms(
+                "snipster_http_response_size_bytes",
+                "Response body bytes sent, after compression.",
+                self.response_size,
+            )
+            histograms(
+                "snipster_db_query_duration_seconds",
+                "Time spent executing SQL statements, per request.",
+                self.db_time,
+            )
+            histograms(
+                "snipster_db_queries_per_request",
+                "SQL statements executed per request.",
+                self.queries,
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Records every HTTP request in a ``RequestMetrics``.
+
+    Added last, so it wraps the others and its timings and byte counts cover
+    what the client sees, compression included. Requests running more than
+    ``settings.query_warning_threshold`` statements are logged with them.
+    With ``settings.query_debug``, responses carry ``X-Query-Count`` and
+    ``X-Query-Time-Ms`` for the statements run before the response started.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        metrics: RequestMetrics,
+        settings: EngineSettings | None = None,
+    ) -> None:
+        self.app = app
+        self.metrics = metrics
+        self.settings = settings or EngineSettings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Unless a response starts, the server will answer with a 500
+        status = 500
+        response_bytes = 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.settings.query_debug:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-Query-Count"] = str(queries.count)
+                    headers["X-Query-Time-Ms"] = f"{queries.seconds * 1000:.3f}"
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.started()
+        start = time.perf_counter()
+        label = f"{scope['method']} {scope['path']}"
+        threshold = self.settings.query_warning_threshold
+        with collect_queries(label, threshold) as queries:
+            try:
+                await self.app(scope, receive, send_with_metrics)
+            finally:
+                # The router records the matched route in the shared scope
+                route = scope.get("route")
+                self.metrics.finished(
+                    scope["method"],
+                    getattr(route, "path", UNMATCHED_ROUTE),
+                    status,
+                    time.perf_counter() - start,
+                    response_bytes,
+                    queries,
+                )
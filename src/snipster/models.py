@@ -1,17 +1,24 @@
 from datetime import datetime, timezone
-from enum import Enum
-from typing import Any, List
+from typing import Any, Iterable, List
 
 from pydantic import field_validator
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index, LargeBinary
 from sqlalchemy.ext.mutable import MutableList
 from sqlmodel import Field, SQLModel
 
+from . import fts
+from .dedupe import content_hash
+from .languages import Language  # noqa: F401 - re-exported for callers
 
-class Language(str, Enum):
-    javascript = "javascript"
-    python = "python"
-    rust = "rust"
+
+def normalize_tag(tag: str) -> str:
+    """Tags are compared case-insensitively, ignoring surrounding whitespace."""
+    return tag.strip().lower()
+
+
+def normalize_tags(tags: Iterable[str]) -> list[str]:
+    """Normalized tags without blanks or duplicates, in the order given."""
+    return list(dict.fromkeys(t for t in map(normalize_tag, tags) if t))
 
 
 class SnippetBase(SQLModel, table=False):
@@ -40,11 +47,29 @@ class SnippetBase(SQLModel, table=False):
             raise ValueError(f"Language must be one of: {allowed}")
         return v
 
+    @field_validator("tags")
+    def validate_tags(cls, v):
+        return normalize_tags(v)
+
 
 class Snippet(SnippetBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime | None = None
+    # Finds copies of the same code; internal, so left out of API responses
+    content_hash: str | None = Field(
+        default=None,
+        index=True,
+        exclude=True,
+        description="dedupe.content_hash of the code and language",
+    )
+    # Set when ``code`` holds only the head of a compressed body; internal too
+    code_blob: str | None = Field(
+        default=None,
+        index=True,
+        exclude=True,
+        description="code_blobs.digest of the full code, kept in CodeBlob",
+    )
 
     def __str__(self) -> str:
         return (
@@ -59,8 +84,86 @@ class Snippet(SnippetBase, table=True):
         code = kwargs.get("code")
         if code is None or len(code) < 3:
             raise ValueError("Code must be at least 3 characters.")
+        kwargs.setdefault("content_hash", content_hash(code, kwargs["language"]))
         return cls(**kwargs)
 
 
+fts.install(Snippet.__table__)  # type: ignore[arg-type]
+
+
+class Tag(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True, index=True, description="Normalized tag name")
+
+
+class SnippetTag(SQLModel, table=True):
+    """Links snippets to tags.
+
+    ``Snippet.tags`` keeps a copy of the names for reading; this table is what
+    tag filtering goes through. The (tag_id, snippet_id) index returns a tag's
+    snippets already in id order, ready for keyset pagination.
+    """
+
+    __tablename__ = "snippet_tag"  # type: ignore[assignment]
+    __table_args__ = (
+        Index("ix_snippet_tag_tag_id_snippet_id", "tag_id", "snippet_id"),
+    )
+
+    snippet_id: int = Field(
+        foreign_key="snippet.id", primary_key=True, ondelete="CASCADE"
+    )
+    tag_id: int = Field(foreign_key="tag.id", primary_key=True, ondelete="CASCADE")
+
+
+class CodeBlob(SQLModel, table=True):
+    """The compressed code of large snippets; see ``code_blobs``.
+
+    Keyed by the digest of the exact code, so snippets holding the same code
+    share a blob. Rows no snippet points at any more are deleted along with
+    the last snippet that did.
+    """
+
+    __tablename__ = "code_blob"  # type: ignore[assignment]
+
+    digest: str = Field(primary_key=True)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class SnippetVersion(SQLModel, table=True):
+    """A single-row counter bumped by every write to snippets or their tags.
+
+    It changes whenever anything a listing shows could have changed, which
+    makes it a cheap validator for the API's ETags.
+    """
+
+    __tablename__ = "snippet_version"  # type: ignore[assignment]
+
+    id: int = Field(default=1, primary_key=True)
+    version: int = 0
+
+
 class SnippetCreate(SnippetBase, table=False):
     pass
+
+
+class SnippetSummary(SQLModel, table=False):
+    """A snippet without its code body, for listings.
+
+    ``preview`` holds the start of the code, truncated by the database so the
+    full body never leaves it.
+    """
+
+    id: int
+    title: str
+    language: str
+    description: str | None = None
+    tags: List[str] = Field(default_factory=list)
+    favorite: bool = False
+    created_at: datetime
+    updated_at: datetime | None = None
+    preview: str | None = None
+
+    def __str__(self) -> str:
+        return (
+            f"{self.id}: {self.title} ({self.language}) {'⭐️' if self.favorite else ''}"
+        )
@@ -1,18 +1,221 @@
+import json
 from abc import ABC, abstractmethod
-from datetime import datetime, timezone
-from typing import Sequence
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from itertools import batched, groupby, islice
+from operator import attrgetter
+from typing import Iterable, Iterator, Sequence
 
-from rapidfuzz import process as rapidfuzz_process
-from sqlalchemy import Text, or_
+from sqlalchemy import Text, delete, func, insert, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import Session, select
 
-from .exceptions import SnippetNotFoundError
-from .models import Snippet, SnippetCreate
+from . import code_blobs, fts
+from .db import RoutingSession, use_primary
+from .dedupe import DedupeMode, content_hash
+from .exceptions import DuplicateSnippetError, SnippetNotFoundError
+from .index import FuzzyIndex, FuzzyIndexChanges, TrigramIndex, ilike_matcher
+from .models import (
+    CodeBlob,
+    Snippet,
+    SnippetCreate,
+    SnippetSummary,
+    SnippetTag,
+    SnippetVersion,
+    Tag,
+    normalize_tag,
+    normalize_tags,
+)
+
+# (kept id, ids merged into it) for each group of duplicates
+MergedGroups = list[tuple[int, list[int]]]
+
+# Snippets stored compressed, each with its blob as read
+CompressedCode = list[tuple[Snippet, bytes]]
+# (digest, data) of code blobs as read
+CompressedBlobs = list[tuple[str, bytes]]
+
+# Characters of code shown with each summary
+PREVIEW_LENGTH = 80
+
+# Timestamps are taken before commit, so a row committed late can carry a
+# time older than a watermark; rows this close to it are read again
+WATERMARK_OVERLAP = timedelta(minutes=1)
+
+# Every column except the code body
+SUMMARY_COLUMNS = (
+    Snippet.id,
+    Snippet.title,
+    Snippet.language,
+    Snippet.description,
+    Snippet.tags,
+    Snippet.favorite,
+    Snippet.created_at,
+    Snippet.updated_at,
+)
+
+
+def _page(stmt, limit: int | None, after: int | None, tag: str | None = None):
+    """Apply an optional tag filter and keyset pagination on id to a select."""
+    key = Snippet.id
+    if tag is not None:
+        tag_id = select(Tag.id).where(Tag.name == normalize_tag(tag))
+        link = SnippetTag.snippet_id == Snippet.id
+        stmt = stmt.join(SnippetTag, link).where(  # type: ignore
+            SnippetTag.tag_id == tag_id.scalar_subquery()
+        )
+        # Paging on the link table's column lets the (tag_id, snippet_id)
+        # index deliver the page in order without sorting
+        key = SnippetTag.snippet_id
+    stmt = stmt.order_by(key)
+    if after is not None:
+        stmt = stmt.where(key > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def _dialect_insert(session: Session, model):
+    """An INSERT supporting ON CONFLICT clauses, for SQLite and Postgres."""
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _insert_ignoring_conflicts(session: Session, model):
+    """An INSERT that skips rows already present, for SQLite and Postgres."""
+    return _dialect_insert(session, model).on_conflict_do_nothing()
+
+
+def link_snippet_tags(
+    session: Session, snippet_tags: Sequence[tuple[int, Sequence[str]]]
+) -> None:
+    """Link each snippet id to its tag names, creating missing tags.
+
+    A fixed number of statements however many snippets there are.
+    """
+    names = list(dict.fromkeys(name for _, tags in snippet_tags for name in tags))
+    if not names:
+        return
+    session.exec(
+        _insert_ignoring_conflicts(session, Tag),
+        params=[{"name": name} for name in names],
+    )
+    stmt = select(Tag.id, Tag.name).where(Tag.name.in_(names))  # type: ignore
+    tag_ids = {name: tag_id for tag_id, name in session.exec(stmt)}
+    session.exec(
+        _insert_ignoring_conflicts(session, SnippetTag),
+        params=[
+            {"snippet_id": snippet_id, "tag_id": tag_ids[name]}
+            for snippet_id, tags in snippet_tags
+            for name in tags
+        ],
+    )
+
+
+def store_code(session: Session, codes: Sequence[str]) -> list[tuple[str, str | None]]:
+    """The ``(code, code_blob)`` to store in the row for each of ``codes``.
+
+    Code over ``code_blobs.COMPRESS_THRESHOLD`` is compressed into a
+    ``CodeBlob``, with one statement for all of them, and only its head is
+    stored in the row.
+    """
+    stored: list[tuple[str, str | None]] = []
+    large: dict[str, str] = {}
+    for code in codes:
+        if not code_blobs.should_compress(code):
+            stored.append((code, None))
+            continue
+        key = code_blobs.digest(code)
+        large[key] = code
+        stored.append((code[: code_blobs.HEAD_LENGTH], key))
+    if large:
+        session.exec(
+            _insert_ignoring_conflicts(session, CodeBlob),
+            params=[
+                {"digest": key, "data": code_blobs.compress(code)}
+                for key, code in large.items()
+            ],
+        )
+    return stored
+
+
+def fetch_code(session: Session, snippets: Iterable[Snippet]) -> CompressedCode:
+    """The compressed code of snippets stored with a compressed body.
+
+    One query for all of them, and none if no snippet is compressed.
+    """
+    compressed = [s for s in snippets if s.code_blob is not None]
+    if not compressed:
+        return []
+    keys = {s.code_blob for s in compressed}
+    stmt = select(CodeBlob.digest, CodeBlob.data).where(CodeBlob.digest.in_(keys))  # type: ignore
+    data = dict(session.exec(stmt).all())  # type: ignore
+    return [(snippet, data[snippet.code_blob]) for snippet in compressed]
+
+
+def inflate_code(compressed: CompressedCode) -> None:
+    """Decompress ``fetch_code`` results into the snippets' code.
+
+    The code is set as loaded from the database, so it isn't written back on
+    flush. This is CPU work only, which async callers run in a thread.
+    """
+    for snippet, data in compressed:
+        set_committed_value(snippet, "code", code_blobs.decompress(data))
+
+
+def matching_blobs(blobs: CompressedBlobs, query: str) -> list[str]:
+    """The digests of ``blobs`` whose code matches ``ILIKE '%query%'``.
+
+    Search indexes only the head of compressed code, so the rest is matched
+    here, decompressing every blob. This is CPU work only, which async
+    callers run in a thread.
+    """
+    matches = ilike_matcher(query)
+    return [key for key, data in blobs if matches(code_blobs.decompress(data).lower())]
+
+
+def load_code(session: Session, snippets: Iterable[Snippet]) -> None:
+    """Put the full code back into snippets stored with a compressed body."""
+    inflate_code(fetch_code(session, snippets))
+
+
+def prune_code_blobs(session: Session, keys: Iterable[str | None] | None) -> None:
+    """Delete the blobs among ``keys``, or any if None, no snippet points at."""
+    used = select(Snippet.code_blob).where(Snippet.code_blob.is_not(None))  # type: ignore
+    stmt = delete(CodeBlob).where(CodeBlob.digest.not_in(used))  # type: ignore
+    if keys is not None:
+        keys = {key for key in keys if key is not None}
+        if not keys:
+            return
+        stmt = stmt.where(CodeBlob.digest.in_(keys))  # type: ignore
+    session.exec(stmt)  # type: ignore
+
+
+def _merge_into(kept: Snippet, copies: Sequence[Snippet]) -> bool:
+    """Give ``kept`` its copies' tags, favorite flag and, if it has none, a
+    description. Returns whether that changed anything."""
+    before = (list(kept.tags), kept.favorite, kept.description)
+    names = normalize_tags(t for copy in copies for t in copy.tags)
+    kept.tags.extend(name for name in names if name not in kept.tags)
+    kept.favorite = kept.favorite or any(copy.favorite for copy in copies)
+    if not kept.description:
+        described = (copy.description for copy in copies if copy.description)
+        kept.description = next(described, kept.description)
+    return (kept.tags, kept.favorite, kept.description) != before
 
 
 class AbstractSnippetRepo(ABC):  # pragma: no cover
     @abstractmethod
-    def add(self, snippet: SnippetCreate) -> Snippet | None:
+    def add(
+        self, snippet: SnippetCreate, dedupe: DedupeMode = DedupeMode.off
+    ) -> Snippet | None:
+        """Store ``snippet``; ``dedupe`` says what happens to duplicate code."""
+        pass
+
+    @abstractmethod
+    def add_many(self, snippets: Sequence[SnippetCreate]) -> Sequence[int]:
+        """Insert ``snippets`` in bulk and return their new ids, in order."""
         pass
 
     @abstractmethod
@@ -20,7 +223,30 @@ class AbstractSnippetRepo(ABC):  # pragma: no cover
         pass
 
     @abstractmethod
-    def list(self) -> Sequence[Snippet]:
+    def list(
+        self, limit: int | None = None, after: int | None = None, tag: str | None = None
+    ) -> Sequence[Snippet]:
+        """Snippets in id order, optionally one keyset page at a time.
+
+        ``after`` is the id of the last snippet on the previous page. ``tag``
+        keeps only snippets carrying exactly that (normalized) tag.
+        """
+        pass
+
+    @abstractmethod
+    def list_summaries(
+        self,
+        limit: int | None = None,
+        after: int | None = None,
+        preview_length: int = PREVIEW_LENGTH,
+        tag: str | None = None,
+    ) -> Sequence[SnippetSummary]:
+        """Like ``list``, but without code bodies; see ``SnippetSummary``."""
+        pass
+
+    @abstractmethod
+    def stream(self, batch_size: int = 500) -> Iterator[Snippet]:
+        """Every snippet in id order, fetched ``batch_size`` rows at a time."""
         pass
 
     @abstractmethod
@@ -39,73 +265,480 @@ class AbstractSnippetRepo(ABC):  # pragma: no cover
     def remove_tag(self, snippet_id: int, tag: str) -> Snippet | None:
         pass
 
+    @abstractmethod
+    def add_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        """Add every tag in ``tags`` the snippet doesn't already have, in one write."""
+        pass
+
+    @abstractmethod
+    def remove_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        """Remove whichever of ``tags`` the snippet has, in one write."""
+        pass
+
+    @abstractmethod
+    def add_tags_to_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        """``add_tags`` for several snippets at once.
+
+        Nothing is written unless every id exists.
+        """
+        pass
+
+    @abstractmethod
+    def remove_tags_from_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        """``remove_tags`` for several snippets at once."""
+        pass
+
     @abstractmethod
     def search(self, query: str) -> Sequence[Snippet]:
         pass
 
+    @abstractmethod
+    def version(self) -> int:
+        """A counter that changes with every write; see ``SnippetVersion``."""
+        pass
+
+    def fresh_version(self) -> int:
+        """``version`` for validating responses, never older than the data.
+
+        Repos with one copy of the data just return ``version``.
+        """
+        return self.version()
+
+    @abstractmethod
+    def ids_by_content_hash(self, hashes: Iterable[str]) -> dict[str, int]:
+        """The oldest stored snippet's id for each of ``hashes`` that has one."""
+        pass
+
+    @abstractmethod
+    def merge_duplicates(self, dry_run: bool = False) -> MergedGroups:
+        """Fold snippets with the same content hash into the oldest of them.
+
+        The oldest keeps its fields and gains the others' tags, their
+        favorite flag, and a description if it had none; the rest are
+        deleted. Returns ``(kept id, deleted ids)`` per group, changing
+        nothing if ``dry_run``.
+        """
+        pass
+
+
+def _writes(method):
+    """Run a repository method, and the rest of its session, on the primary.
+
+    See ``db.use_primary``; without read replicas this changes nothing.
+    """
+
+    @wraps(method)
+    def on_primary(self, *args, **kwargs):
+        use_primary(self.session)
+        return method(self, *args, **kwargs)
+
+    return on_primary
+
 
 class DatabaseBackedSnippetRepo(AbstractSnippetRepo):
     # Good to use a single session across calls incase
     # there are multiple operations called at call site
     # Therefore, let the call site handle session management
-    def __init__(self, session: Session) -> None:
+    def __init__(
+        self,
+        session: Session,
+        fuzzy_index: FuzzyIndex | None = None,
+        inflate_later: bool = False,
+    ) -> None:
         self.session = session
+        # Long-lived callers (the API) pass in an index that outlives the session
+        self.fuzzy_index = fuzzy_index
+        # With ``inflate_later``, compressed code read for returned snippets
+        # collects here instead, for the caller to ``inflate_code``
+        self.compressed: CompressedCode | None = [] if inflate_later else None
+
+    def _load_code(self, snippets: Iterable[Snippet]) -> None:
+        compressed = fetch_code(self.session, snippets)
+        if self.compressed is None:
+            inflate_code(compressed)
+        else:
+            self.compressed.extend(compressed)
+
+    def _link_tags(self, snippet_ids: Sequence[int], names: Sequence[str]) -> None:
+        if not snippet_ids or not names:
+            return
+        self.session.exec(
+            _insert_ignoring_conflicts(self.session, Tag).values(
+                [{"name": name} for name in names]
+            )
+        )
+        stmt = select(Tag.id).where(Tag.name.in_(names))  # type: ignore
+        tag_ids = self.session.exec(stmt).all()
+        self.session.exec(
+            _insert_ignoring_conflicts(self.session, SnippetTag).values(
+                [
+                    {"snippet_id": snippet_id, "tag_id": tag_id}
+                    for snippet_id in snippet_ids
+                    for tag_id in tag_ids
+                ]
+            )
+        )
+
+    def _unlink_tags(self, snippet_ids: Sequence[int], names: Sequence[str]) -> None:
+        if not snippet_ids or not names:
+            return
+        tag_ids = select(Tag.id).where(Tag.name.in_(names))  # type: ignore
+        self.session.exec(
+            delete(SnippetTag).where(
+                SnippetTag.snippet_id.in_(snippet_ids),  # type: ignore
+                SnippetTag.tag_id.in_(tag_ids),  # type: ignore
+            )
+        )
+
+    def _bump_version(self) -> None:
+        # An upsert, so databases created without the row still count
+        stmt = _dialect_insert(self.session, SnippetVersion).values(id=1, version=1)
+        version = self.session.exec(
+            stmt.on_conflict_do_update(  # type: ignore
+                index_elements=["id"],
+                set_={"version": SnippetVersion.version + 1},
+            ).returning(SnippetVersion.version)
+        ).scalar_one()  # type: ignore
+        # Each write updates the index itself, so it needn't be read again
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.advance(version)
+
+    def version(self, primary: bool = False) -> int:
+        stmt = select(SnippetVersion.version).where(SnippetVersion.id == 1)
+        if primary:
+            stmt = stmt.execution_options(use_primary=True)
+        return self.session.exec(stmt).first() or 0
+
+    def fresh_version(self) -> int:
+        """The version on the primary, which a replica may not have reached.
+
+        If this session reads from a replica that is behind it, the session
+        moves to the primary, so nothing it reads after is older than the
+        version returned. Without replicas this is just ``version``.
+        """
+        if not isinstance(self.session, RoutingSession):
+            return self.version()
+        version = self.version(primary=True)
+        if not self.session.info.get("use_primary") and self.version() < version:
+            use_primary(self.session)
+        return version
 
-    def add(self, snippet: SnippetCreate) -> Snippet:
+    def _get_many(self, snippet_ids: Sequence[int]) -> list[Snippet]:
+        """Fetch ``snippet_ids`` in one query, in the order given."""
+        stmt = select(Snippet).where(Snippet.id.in_(snippet_ids))  # type: ignore
+        found = {s.id: s for s in self.session.exec(stmt).all()}
+        self._load_code(found.values())
+        missing = [i for i in snippet_ids if i not in found]
+        if missing:
+            ids = ", ".join(map(str, missing))
+            raise SnippetNotFoundError(f"Snippets with ids {ids} not found.")
+        return [found[i] for i in snippet_ids]
+
+    @_writes
+    def _retag(self, snippet_ids: Iterable[int], tags: Iterable[str], add: bool):
+        snippet_ids = list(dict.fromkeys(snippet_ids))
+        names = normalize_tags(tags)
+        snippets = self._get_many(snippet_ids)
+        changed = []
+        for snippet in snippets:
+            if add:
+                new = [n for n in names if n not in snippet.tags]
+                snippet.tags.extend(new)
+            else:
+                # Rows written before tags were normalized may hold another spelling
+                new = [t for t in snippet.tags if normalize_tag(t) in names]
+                snippet.tags[:] = [t for t in snippet.tags if t not in new]
+            if new:
+                snippet.updated_at = datetime.now(timezone.utc)
+                changed.append(snippet.id)
+        if not changed:
+            return snippets
+        if add:
+            self._link_tags(changed, names)
+        else:
+            self._unlink_tags(changed, names)
+        # The tags column updates go out as a single executemany on flush
+        self._bump_version()
+        self.session.commit()
+        # One query reloads everything the commit expired
+        snippets = self._get_many(snippet_ids)
+        if self.fuzzy_index is not None:
+            for snippet in snippets:
+                if snippet.id in changed:
+                    self.fuzzy_index.add(snippet)
+        return snippets
+
+    def _find_duplicate(self, stored_snippet: Snippet, dedupe: DedupeMode):
+        if dedupe == DedupeMode.off:
+            return None
+        found = self.ids_by_content_hash([stored_snippet.content_hash])  # type: ignore
+        existing_id = found.get(stored_snippet.content_hash)  # type: ignore
+        if existing_id is not None and dedupe == DedupeMode.reject:
+            raise DuplicateSnippetError(existing_id)
+        return existing_id
+
+    @_writes
+    def add(
+        self, snippet: SnippetCreate, dedupe: DedupeMode = DedupeMode.off
+    ) -> Snippet:
         stored_snippet = Snippet.create_snippet(**snippet.model_dump())
+        existing_id = self._find_duplicate(stored_snippet, dedupe)
+        if existing_id is not None:
+            return self.get(existing_id)
+        [(stored_snippet.code, stored_snippet.code_blob)] = store_code(
+            self.session, [stored_snippet.code]
+        )
         self.session.add(stored_snippet)
+        self.session.flush()
+        self._link_tags([stored_snippet.id], stored_snippet.tags)  # type: ignore
+        self._bump_version()
         self.session.commit()
         self.session.refresh(stored_snippet)
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.add(stored_snippet)
+        self._load_code([stored_snippet])
         return stored_snippet
 
+    @_writes
+    def add_many(self, snippets: Sequence[SnippetCreate]) -> Sequence[int]:
+        if not snippets:
+            return []
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                **snippet.model_dump(),
+                "created_at": now,
+                "content_hash": content_hash(snippet.code, snippet.language),
+            }
+            for snippet in snippets
+        ]
+        stored = store_code(self.session, [row["code"] for row in rows])
+        for row, (code, code_blob) in zip(rows, stored):
+            row.update(code=code, code_blob=code_blob)
+        # One executemany, which SQLAlchemy sends as multi-row INSERT ...
+        # RETURNING statements. Ordered RETURNING would fall back to one row
+        # per statement on SQLite, but there new rowids are always max + 1, so
+        # sorting the ids puts them in insertion order anyway. The insert is
+        # on the table, not the entity: ORM bulk inserts leave out None
+        # values, and start a new statement wherever the set of keys changes
+        stmt = insert(Snippet.__table__)  # type: ignore
+        if self.session.get_bind().dialect.name == "sqlite":
+            stmt = stmt.returning(Snippet.id)  # type: ignore
+            ids = sorted(self.session.exec(stmt, params=rows).scalars())  # type: ignore
+        else:
+            stmt = stmt.returning(Snippet.id, sort_by_parameter_order=True)  # type: ignore
+            ids = list(self.session.exec(stmt, params=rows).scalars())  # type: ignore
+
+        link_snippet_tags(self.session, [(i, row["tags"]) for i, row in zip(ids, rows)])
+        self._bump_version()
+        self.session.commit()
+        if self.fuzzy_index is not None and self.fuzzy_index.loaded:
+            for snippet_id, row in zip(ids, rows):
+                self.fuzzy_index.add(Snippet(**row, id=snippet_id))
+        return ids
+
     def get(self, snippet_id: int) -> Snippet:
         snippet = self.session.get(Snippet, snippet_id)
         if snippet is None:
             raise SnippetNotFoundError
+        self._load_code([snippet])
         return snippet
 
-    def list(self) -> Sequence[Snippet]:
-        return list(self.session.exec(select(Snippet)).all())
+    def list(
+        self, limit: int | None = None, after: int | None = None, tag: str | None = None
+    ) -> Sequence[Snippet]:
+        # Seeks straight to the page through the primary key (or tag) index
+        stmt = _page(select(Snippet), limit, after, tag)
+        snippets = list(self.session.exec(stmt).all())
+        self._load_code(snippets)
+        return snippets
+
+    def list_summaries(
+        self,
+        limit: int | None = None,
+        after: int | None = None,
+        preview_length: int = PREVIEW_LENGTH,
+        tag: str | None = None,
+    ) -> Sequence[SnippetSummary]:
+        columns = list(SUMMARY_COLUMNS)
+        if preview_length:
+            preview = func.substr(Snippet.code, 1, preview_length)
+            columns.append(preview.label("preview"))
+        stmt = _page(select(*columns), limit, after, tag)
+        return [SnippetSummary(**row._mapping) for row in self.session.exec(stmt)]
 
+    def stream(self, batch_size: int = 500) -> Iterator[Snippet]:
+        # yield_per uses a server-side cursor where the driver supports one,
+        # so only one batch of rows is held in memory at a time
+        stmt = (
+            select(Snippet)
+            .order_by(Snippet.id)  # type: ignore
+            .execution_options(yield_per=batch_size)
+        )
+        for batch in self.session.exec(stmt).partitions():
+            load_code(self.session, batch)
+            yield from batch
+
+    @_writes
     def delete(self, snippet_id: int):
         snippet = self.session.get(Snippet, snippet_id)
         if snippet is None:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
+        # SQLite only honours ON DELETE CASCADE with foreign keys switched on
+        links = SnippetTag.snippet_id == snippet_id
+        self.session.exec(delete(SnippetTag).where(links))  # type: ignore
         self.session.delete(snippet)
+        prune_code_blobs(self.session, [snippet.code_blob])
+        self._bump_version()
         self.session.commit()
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.remove(snippet_id)
 
+    @_writes
     def toggle_favorite(self, snippet_id: int) -> Snippet:
         snippet = self.session.get(Snippet, snippet_id)
         if snippet is None:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
         snippet.favorite = not snippet.favorite
+        snippet.updated_at = datetime.now(timezone.utc)
+        self._bump_version()
         self.session.commit()
         self.session.refresh(snippet)
+        self._load_code([snippet])
         return snippet
 
+    @_writes
     def add_tag(self, snippet_id: int, tag: str) -> Snippet | None:
         snippet = self.session.get(Snippet, snippet_id)
         if snippet is None:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
-        norm = tag.strip().lower()
-        if norm not in snippet.tags:
-            snippet.tags.append(tag)
+        norm = normalize_tag(tag)
+        if norm and norm not in snippet.tags:
+            snippet.tags.append(norm)
+            snippet.updated_at = datetime.now(timezone.utc)
+            self._link_tags([snippet_id], [norm])
+            self._bump_version()
             self.session.commit()
             self.session.refresh(snippet)
+            if self.fuzzy_index is not None:
+                self.fuzzy_index.add(snippet)
+            self._load_code([snippet])
             return snippet
 
+    @_writes
     def remove_tag(self, snippet_id: int, tag: str) -> Snippet:
         snippet = self.session.get(Snippet, snippet_id)
         if snippet is None:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
-        if tag not in snippet.tags:
+        norm = normalize_tag(tag)
+        # Rows written before tags were normalized may hold another spelling
+        stored = next((t for t in snippet.tags if normalize_tag(t) == norm), None)
+        if stored is None:
             raise ValueError(f"Tag {tag} not found on snippet with id {snippet_id}.")
-        snippet.tags.remove(tag)
+        snippet.tags.remove(stored)
+        snippet.updated_at = datetime.now(timezone.utc)
+        self._unlink_tags([snippet_id], [norm])
+        self._bump_version()
         self.session.commit()
         self.session.refresh(snippet)
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.add(snippet)
+        self._load_code([snippet])
         return snippet
 
+    def add_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        return self._retag([snippet_id], tags, add=True)[0]
+
+    def remove_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        return self._retag([snippet_id], tags, add=False)[0]
+
+    def add_tags_to_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        return self._retag(snippet_ids, tags, add=True)
+
+    def remove_tags_from_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        return self._retag(snippet_ids, tags, add=False)
+
+    def ids_by_content_hash(self, hashes: Iterable[str]) -> dict[str, int]:
+        hashes = list(dict.fromkeys(hashes))
+        if not hashes:
+            return {}
+        stmt = (
+            select(Snippet.content_hash, func.min(Snippet.id))
+            .where(Snippet.content_hash.in_(hashes))  # type: ignore
+            .group_by(Snippet.content_hash)
+        )
+        return dict(self.session.exec(stmt).all())  # type: ignore
+
+    @_writes
+    def merge_duplicates(self, dry_run: bool = False) -> MergedGroups:
+        shared = (
+            select(Snippet.content_hash)
+            .where(Snippet.content_hash.is_not(None))  # type: ignore
+            .group_by(Snippet.content_hash)
+            .having(func.count() > 1)
+        )
+        # One pass over the hash index, which hands each group over together
+        stmt = (
+            select(Snippet)
+            .where(Snippet.content_hash.in_(shared))  # type: ignore
+            .order_by(Snippet.content_hash, Snippet.id)
+        )
+        groups = [
+            list(group)
+            for _, group in groupby(
+                self.session.exec(stmt), key=attrgetter("content_hash")
+            )
+        ]
+        merged = [(kept.id, [c.id for c in copies]) for kept, *copies in groups]
+        if dry_run or not groups:
+            return merged  # type: ignore
+
+        new_tags = []
+        for kept, *copies in groups:
+            if _merge_into(kept, copies):
+                kept.updated_at = datetime.now(timezone.utc)
+            names = normalize_tags(t for c in copies for t in c.tags)
+            new_tags.append((kept.id, names))
+        link_snippet_tags(self.session, new_tags)  # type: ignore
+        deleted = [i for _, copies in merged for i in copies]
+        for ids in batched(deleted, 500):
+            links = SnippetTag.snippet_id.in_(ids)  # type: ignore
+            self.session.exec(delete(SnippetTag).where(links))  # type: ignore
+            self.session.exec(delete(Snippet).where(Snippet.id.in_(ids)))  # type: ignore
+        copies = (c for _, *copies in groups for c in copies)
+        prune_code_blobs(self.session, [c.code_blob for c in copies])
+        self._bump_version()
+        self.session.commit()
+        if self.fuzzy_index is not None:
+            for snippet_id in deleted:
+                self.fuzzy_index.remove(snippet_id)
+            for kept, *_ in groups:
+                self.fuzzy_index.add(kept)
+        return merged  # type: ignore
+
     def search(self, query: str) -> Sequence[Snippet]:
+        found = self.search_heads(query)
+        return self.with_blob_matches(
+            found, matching_blobs(self.compressed_blobs(), query)
+        )
+
+    def search_heads(self, query: str) -> Sequence[Snippet]:
+        """``search`` over the rows alone, so only the head of compressed code."""
+        dialect_name = self.session.get_bind().dialect.name
+        if fts.can_match(dialect_name, query):
+            matches = fts.matching_ids(query)
+            stmt = select(Snippet).where(Snippet.id.in_(matches))  # type: ignore
+            snippets = list(self.session.exec(stmt).all())
+            self._load_code(snippets)
+            return snippets
         stmt = select(Snippet).where(
             or_(
                 Snippet.title.ilike(f"%{query}%"),  # type: ignore
@@ -116,98 +749,313 @@ class DatabaseBackedSnippetRepo(AbstractSnippetRepo):
             )
         )
         results = self.session.exec(stmt).all()
+        self._load_code(results)
         return [snippet for snippet in results]
 
-    def fuzzy_search(self, query: str) -> Sequence[Snippet]:
-        all_snippets = self.session.exec(select(Snippet)).all()
-        snippet_dict = {s.title.lower(): s for s in all_snippets}
-        # Normalize query to lowercase for better matching
-        normalized_query = query.lower()
-        matches = rapidfuzz_process.extract(
-            normalized_query, snippet_dict.keys(), limit=5, score_cutoff=70
+    def compressed_blobs(self) -> CompressedBlobs:
+        """Every compressed code body, for ``matching_blobs`` to search."""
+        return list(self.session.exec(select(CodeBlob.digest, CodeBlob.data)).all())  # type: ignore
+
+    def with_blob_matches(
+        self, found: Sequence[Snippet], digests: Sequence[str]
+    ) -> Sequence[Snippet]:
+        """``found`` plus the snippets whose compressed code is in ``digests``."""
+        if not digests:
+            return list(found)
+        seen = {snippet.id for snippet in found}
+        stmt = select(Snippet).where(
+            Snippet.code_blob.in_(digests),  # type: ignore
+            Snippet.id.not_in(seen),  # type: ignore
         )
-        results = [snippet_dict[m[0]] for m in matches]
-        return results
+        more = list(self.session.exec(stmt).all())
+        self._load_code(more)
+        return sorted([*found, *more], key=attrgetter("id"))
+
+    def fuzzy_search(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[Snippet]:
+        return [s for s, _ in self.fuzzy_search_scored(query, limit, score_cutoff)]
+
+    def fuzzy_search_scored(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[tuple[Snippet, float]]:
+        """The best ``limit`` matches with their scores (0-100), best first."""
+        index = self.fuzzy_index if self.fuzzy_index is not None else FuzzyIndex()
+        changes = self.fuzzy_index_changes(index)
+        if changes is not None:
+            index.apply(changes)
+        return self.fuzzy_matches(index, index.search(query, limit, score_cutoff))
+
+    def fuzzy_index_changes(self, index: FuzzyIndex) -> FuzzyIndexChanges | None:
+        """The rows ``index`` lacks, or None if it matches the database.
+
+        A current index costs one query for the version. After writes from
+        other processes, only rows with new ids or written since the index's
+        watermark are read, unless the row count shows deletions too.
+        """
+        version = self.version()
+        if index.loaded and index.version == version:
+            return None
+        # Plain rows are enough to index, so skip hydrating Snippet objects.
+        # Identifiers come from the head of compressed code, as in the row
+        written = func.coalesce(Snippet.updated_at, Snippet.created_at)
+        fields = select(
+            Snippet.id,
+            Snippet.title,
+            Snippet.tags,
+            Snippet.description,
+            Snippet.code,
+            written.label("written"),
+        ).execution_options(yield_per=1000)
+        if index.loaded:
+            changed = Snippet.id > index.max_id  # type: ignore
+            if index.watermark is not None:
+                since = index.watermark - WATERMARK_OVERLAP
+                changed = or_(changed, written >= since)
+            rows = list(self.session.exec(fields.where(changed)))  # type: ignore
+            count = self.session.exec(select(func.count(Snippet.id))).one()  # type: ignore
+            added = sum(1 for row in rows if row.id not in index)
+            if len(index) + added == count:
+                return FuzzyIndexChanges(version, rows, reload=False)
+        rows = list(self.session.exec(fields))  # type: ignore
+        return FuzzyIndexChanges(version, rows, reload=True)
+
+    def fuzzy_matches(
+        self, index: FuzzyIndex, matches: Sequence[tuple[int, float]]
+    ) -> Sequence[tuple[Snippet, float]]:
+        """The snippets for ``FuzzyIndex.search`` results, with their scores."""
+        if not matches:
+            return []
+        snippet_ids = [i for i, _ in matches]
+        stmt = select(Snippet).where(Snippet.id.in_(snippet_ids))  # type: ignore
+        found = {s.id: s for s in self.session.exec(stmt).all()}
+        self._load_code(found.values())
+        # Rows deleted since the index was synced drop out of it here; a
+        # replica may just not have the newest rows yet
+        if self.session.info.get("replica") is None:
+            for snippet_id in snippet_ids:
+                if snippet_id not in found:
+                    index.remove(snippet_id)
+        return [(found[i], score) for i, score in matches if i in found]
 
 
 class InMemorySnippetRepo(AbstractSnippetRepo):
     def __init__(self):
         self.snippets: dict[int, Snippet] = {}
         self._next_id = 1
+        self.fuzzy_index = FuzzyIndex()
+        self.fuzzy_index.load([])
+        self.search_index = TrigramIndex()
+        self.tag_index: dict[str, set[int]] = {}
+        self.hash_index: dict[str, set[int]] = {}
+        self._version = 0
+
+    def _index_for_search(self, snippet: Snippet) -> None:
+        # Tags are indexed as their JSON text, the same text the SQL search sees
+        self.search_index.add(
+            snippet.id,  # type: ignore
+            (
+                snippet.title,
+                snippet.code,
+                snippet.description,
+                json.dumps(snippet.tags),
+            ),
+        )
 
-    def add(self, snippet: SnippetCreate) -> Snippet:
+    def add(
+        self, snippet: SnippetCreate, dedupe: DedupeMode = DedupeMode.off
+    ) -> Snippet:
         stored_snippet = Snippet.create_snippet(
             **snippet.model_dump(),
             id=self._next_id,
             created_at=datetime.now(timezone.utc),
             updated_at=None,
         )
+        if dedupe != DedupeMode.off:
+            found = self.ids_by_content_hash([stored_snippet.content_hash])  # type: ignore
+            existing_id = found.get(stored_snippet.content_hash)  # type: ignore
+            if existing_id is not None:
+                if dedupe == DedupeMode.reject:
+                    raise DuplicateSnippetError(existing_id)
+                return self.snippets[existing_id]
         self.snippets[self._next_id] = stored_snippet
+        self.hash_index.setdefault(stored_snippet.content_hash, set()).add(  # type: ignore
+            self._next_id
+        )
+        self.fuzzy_index.add(stored_snippet)
+        self._index_for_search(stored_snippet)
+        for tag in stored_snippet.tags:
+            self.tag_index.setdefault(tag, set()).add(self._next_id)
         self._next_id += 1
+        self._version += 1
         return stored_snippet
 
+    def add_many(self, snippets: Sequence[SnippetCreate]) -> Sequence[int]:
+        return [self.add(snippet).id for snippet in snippets]  # type: ignore
+
     def get(self, snippet_id: int) -> Snippet:
         snippet = self.snippets.get(snippet_id)
         if not snippet:
             raise SnippetNotFoundError
         return snippet
 
-    def list(self) -> Sequence[Snippet]:
-        return list(self.snippets.values())
+    def list(
+        self, limit: int | None = None, after: int | None = None, tag: str | None = None
+    ) -> Sequence[Snippet]:
+        if tag is not None:
+            ids = sorted(self.tag_index.get(normalize_tag(tag), ()))
+            snippets = (self.snippets[i] for i in ids)
+        else:
+            # Ids are handed out in increasing order, so the dict is already sorted
+            snippets = iter(self.snippets.values())
+        if after is not None:
+            snippets = (s for s in snippets if s.id > after)  # type: ignore
+        return list(islice(snippets, limit))
+
+    def list_summaries(
+        self,
+        limit: int | None = None,
+        after: int | None = None,
+        preview_length: int = PREVIEW_LENGTH,
+        tag: str | None = None,
+    ) -> Sequence[SnippetSummary]:
+        return [
+            SnippetSummary(
+                **snippet.model_dump(exclude={"code"}),
+                preview=snippet.code[:preview_length] if preview_length else None,
+            )
+            for snippet in self.list(limit, after, tag)
+        ]
+
+    def stream(self, batch_size: int = 500) -> Iterator[Snippet]:
+        yield from list(self.snippets.values())
 
     def delete(self, snippet_id: int) -> None:
-        self.snippets.pop(snippet_id, None)
+        snippet = self.snippets.pop(snippet_id, None)
+        if snippet is not None:
+            for tag in snippet.tags:
+                self.tag_index[tag].discard(snippet_id)
+            self.hash_index[snippet.content_hash].discard(snippet_id)  # type: ignore
+            self._version += 1
+        self.fuzzy_index.remove(snippet_id)
+        self.search_index.remove(snippet_id)
 
     def toggle_favorite(self, snippet_id: int) -> Snippet:
         snippet = self.snippets.get(snippet_id)
         if not snippet:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
         snippet.favorite = not snippet.favorite
+        snippet.updated_at = datetime.now(timezone.utc)
+        self._version += 1
         return snippet
 
     def add_tag(self, snippet_id: int, tag: str) -> Snippet | None:
         snippet = self.snippets.get(snippet_id)
         if not snippet:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
-        if tag not in snippet.tags:
-            snippet.tags.append(tag)
+        norm = normalize_tag(tag)
+        if norm and norm not in snippet.tags:
+            snippet.tags.append(norm)
+            snippet.updated_at = datetime.now(timezone.utc)
+            self.tag_index.setdefault(norm, set()).add(snippet_id)
+            self._version += 1
+            self._index_for_search(snippet)
+            self.fuzzy_index.add(snippet)
             return snippet
 
     def remove_tag(self, snippet_id: int, tag: str) -> Snippet:
         snippet = self.snippets.get(snippet_id)
         if not snippet:
             raise SnippetNotFoundError(f"Snippet with id {snippet_id} not found.")
-        if tag not in snippet.tags:
+        norm = normalize_tag(tag)
+        if norm not in snippet.tags:
             raise ValueError(f"Tag {tag} not found on snippet with id {snippet_id}.")
-        snippet.tags.remove(tag)
+        snippet.tags.remove(norm)
+        snippet.updated_at = datetime.now(timezone.utc)
+        self.tag_index[norm].discard(snippet_id)
+        self._version += 1
+        self._index_for_search(snippet)
+        self.fuzzy_index.add(snippet)
         return snippet
 
+    def _retag(self, snippet_ids: Iterable[int], tags: Iterable[str], add: bool):
+        snippet_ids = list(dict.fromkeys(snippet_ids))
+        names = normalize_tags(tags)
+        missing = [i for i in snippet_ids if i not in self.snippets]
+        if missing:
+            ids = ", ".join(map(str, missing))
+            raise SnippetNotFoundError(f"Snippets with ids {ids} not found.")
+        snippets = [self.snippets[i] for i in snippet_ids]
+        for snippet in snippets:
+            if add:
+                new = [n for n in names if n not in snippet.tags]
+                snippet.tags.extend(new)
+                for name in new:
+                    self.tag_index.setdefault(name, set()).add(snippet.id)  # type: ignore
+            else:
+                new = [n for n in names if n in snippet.tags]
+                for name in new:
+                    snippet.tags.remove(name)
+                    self.tag_index[name].discard(snippet.id)  # type: ignore
+            if new:
+                snippet.updated_at = datetime.now(timezone.utc)
+                self._index_for_search(snippet)
+                self.fuzzy_index.add(snippet)
+                self._version += 1
+        return snippets
+
+    def add_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        return self._retag([snippet_id], tags, add=True)[0]
+
+    def remove_tags(self, snippet_id: int, tags: Iterable[str]) -> Snippet:
+        return self._retag([snippet_id], tags, add=False)[0]
+
+    def add_tags_to_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        return self._retag(snippet_ids, tags, add=True)
+
+    def remove_tags_from_many(
+        self, snippet_ids: Iterable[int], tags: Iterable[str]
+    ) -> Sequence[Snippet]:
+        return self._retag(snippet_ids, tags, add=False)
+
+    def version(self) -> int:
+        return self._version
+
+    def ids_by_content_hash(self, hashes: Iterable[str]) -> dict[str, int]:
+        return {h: min(self.hash_index[h]) for h in hashes if self.hash_index.get(h)}
+
+    def merge_duplicates(self, dry_run: bool = False) -> MergedGroups:
+        groups = [
+            [self.snippets[i] for i in sorted(ids)]
+            for _, ids in sorted(self.hash_index.items())
+            if len(ids) > 1
+        ]
+        merged = [(kept.id, [c.id for c in copies]) for kept, *copies in groups]
+        if dry_run:
+            return merged  # type: ignore
+        for kept, *copies in groups:
+            if _merge_into(kept, copies):
+                kept.updated_at = datetime.now(timezone.utc)
+            for copy in copies:
+                self.delete(copy.id)  # type: ignore
+            for tag in kept.tags:
+                self.tag_index.setdefault(tag, set()).add(kept.id)  # type: ignore
+            self._index_for_search(kept)
+            self.fuzzy_index.add(kept)
+        return merged  # type: ignore
+
     def search(self, query: str) -> Sequence[Snippet]:
-        query = query.lower()
-        results = []
-        for snippet in self.snippets.values():
-            hit = False
-            if query in snippet.title.lower():
-                hit = True
-            if query in snippet.code.lower():
-                hit = True
-            if snippet.description:
-                if query in snippet.description.lower():
-                    hit = True
-            if len(snippet.tags) > 0:
-                print(snippet.tags)
-                if query in snippet.tags:
-                    hit = True
-            if hit:
-                results.append(snippet)
-        return list(results)
-
-    def fuzzy_search(self, query: str) -> Sequence[Snippet]:
-        snippet_dict = {s.title.lower(): s for s in self.snippets.values()}
-        # Normalize query to lowercase for better matching
-        normalized_query = query.lower()
-        matches = rapidfuzz_process.extract(
-            normalized_query, snippet_dict.keys(), limit=5, score_cutoff=70
-        )
-        results = [snippet_dict[m[0]] for m in matches]
-        return results
+        return [self.snippets[i] for i in self.search_index.search(query)]
+
+    def fuzzy_search(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[Snippet]:
+        return [s for s, _ in self.fuzzy_search_scored(query, limit, score_cutoff)]
+
+    def fuzzy_search_scored(
+        self, query: str, limit: int = 5, score_cutoff: float = 70
+    ) -> Sequence[tuple[Snippet, float]]:
+        matches = self.fuzzy_index.search(query, limit, score_cutoff)
+        return [(self.snippets[i], score) for i, score in matches]
@@ -0,0 +1,183 @@
+"""Run many snipster commands in one process: ``snipster shell`` and ``batch``.
+
+Each line is parsed like a shell command line and run through the same click
+group as ``snipster`` itself, with one ``obj`` shared by every command. The
+engine and its connection pool, the snapshot and the fuzzy index are
+therefore set up by the first command that needs them and reused by the
+rest, instead of once per process.
+
+The interactive shell keeps its history in the user cache directory and
+tab-completes commands, options, snippet ids and tags. The ids and tags are
+loaded once and reloaded only after a command that could change them.
+"""
+
+import shlex
+from pathlib import Path
+from typing import Callable, Iterable
+
+import click
+
+try:
+    import readline
+except ImportError:  # pragma: no cover - not built on Windows
+    readline = None
+
+PROMPT = "snipster> "
+HISTORY_LENGTH = 1000
+
+# Can't run inside the shell; the shell itself is already running
+NESTED_COMMANDS = {"shell", "batch"}
+# Change nothing, so the completions stay valid after them
+READ_COMMANDS = {"get", "list", "search", "find"}
+# Take snippet ids as arguments
+ID_COMMANDS = {"get", "delete", "toggle-favorite", "tag"}
+TAG_OPTIONS = {"--tag", "-t"}
+
+
+class Completions:
+    """Snippet ids and tags, loaded on first use and kept until invalidated."""
+
+    def __init__(self, load: Callable[[], tuple[Iterable[int], Iterable[str]]]):
+        self._load = load
+        self._values: tuple[list[str], list[str]] | None = None
+
+    def _loaded(self) -> tuple[list[str], list[str]]:
+        if self._values is None:
+            ids, tags = self._load()
+            self._values = ([str(i) for i in ids], list(tags))
+        return self._values
+
+    @property
+    def ids(self) -> list[str]:
+        return self._loaded()[0]
+
+    @property
+    def tags(self) -> list[str]:
+        return self._loaded()[1]
+
+    def invalidate(self) -> None:
+        self._values = None
+
+
+class Shell:
+    def __init__(
+        self,
+        group: click.Group,
+        obj: dict,
+        completions: Completions,
+        prog_name: str = "snipster",
+    ) -> None:
+        self.group = group
+        self.obj = obj
+        self.completions = completions
+        self.prog_name = prog_name
+        self._matches: list[str] = []
+
+    def run(self, line: str) -> int:
+        """Run one command line and return its exit code."""
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as e:
+            click.echo(f"Error: {e}", err=True)
+            return 2
+        if not args:
+            return 0
+        command = next((a for a in args if not a.startswith("-")), None)
+        if command in NESTED_COMMANDS:
+            click.echo(f"Error: {command} can't run inside the shell.", err=True)
+            return 2
+        try:
+            code = self.group.main(
+                args, prog_name=self.prog_name, standalone_mode=False, obj=self.obj
+            )
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+            return 1
+        except Exception as e:
+            # One failed command shouldn't end the session
+            click.echo(f"Error: {e}", err=True)
+            return 1
+        finally:
+            if command not in READ_COMMANDS:
+                self.completions.invalidate()
+        # Commands return None; an explicit typer.Exit comes back as its code
+        return code if isinstance(code, int) else 0
+
+    def batch(self, lines: Iterable[str], keep_going: bool = False) -> int:
+        """Run each line in turn; the exit code is the first failure's, or 0.
+
+        Stops at the first failure unless ``keep_going`` is set.
+        """
+        result = 0
+        for line_number, line in enumerate(lines, start=1):
+            code = self.run(line)
+            if code:
+                click.echo(f"Line {line_number} failed: {line.strip()}", err=True)
+                result = result or code
+                if not keep_going:
+                    break
+        return result
+
+    def candidates(self, before: str, text: str) -> list[str]:
+        """Completions for the word ``text``, typed after ``before``."""
+        words = before.split()
+        command = next((w for w in words if not w.startswith("-")), None)
+        if command is None:
+            options = [o for p in self.group.params for o in p.opts]
+            choices = [*self.group.commands, *options]
+        elif words[-1] in TAG_OPTIONS:
+            choices = self.completions.tags
+        elif text.startswith("-") or command not in ID_COMMANDS:
+            params = getattr(self.group.commands.get(command), "params", [])
+            choices = [o for p in params for o in (*p.opts, *p.secondary_opts)]
+            choices = [o for o in choices if o.startswith("-")]
+        else:
+            choices = self.completions.ids
+        return sorted(c for c in set(choices) if c.startswith(text))
+
+    def _complete(self, text: str, state: int) -> str | None:
+        if state == 0:
+            line = readline.get_line_buffer()  # type: ignore[union-attr]
+            before = line[: readline.get_begidx()]  # type: ignore[union-attr]
+            try:
+                self._matches = self.candidates(before, text)
+            except Exception:
+                # readline hides a completer's errors; offer nothing instead
+                self._matches = []
+        matches = self._matches
+        return matches[state] + " " if state < len(matches) else None
+
+    def repl(
+        self,
+        history: Path | None = None,
+        read: Callable[[str], str] = input,
+    ) -> None:
+        """Read and run commands until end of input or ``exit``."""
+        if readline is not None:
+            readline.set_completer(self._complete)
+            readline.set_completer_delims(" \t")
+            readline.parse_and_bind("tab: complete")
+            if history is not None and history.exists():
+                readline.read_history_file(history)
+            readline.set_history_length(HISTORY_LENGTH)
+        click.echo("Snipster shell. Type --help for commands, exit to quit.")
+        try:
+            while True:
+                try:
+                    line = read(PROMPT)
+                except KeyboardInterrupt:
+                    click.echo()
+                    continue
+                except EOFError:
+                    click.echo()
+                    break
+                if line.strip() in ("exit", "quit"):
+                    break
+                self.run(line)
+        finally:
+            if readline is not None and history is not None:
+                history.parent.mkdir(parents=True, exist_ok=True)
+                readline.write_history_file(history)
@@ -0,0 +1,287 @@
+"""A local SQLite copy of the snippets, for reading without the primary database.
+
+The snapshot has the same schema as the primary, full-text index included, so
+the usual repository and service functions read from it unchanged. It is
+refreshed incrementally: rows with an id past the last one copied, or written
+(``updated_at``, else ``created_at``) since the last refresh, are copied
+again. Rows deleted from the primary are found by comparing row counts, then
+ids only within the ranges of ids whose counts differ. When the primary's
+``SnippetVersion`` hasn't moved, a refresh is a single query.
+
+Writes always go to the primary; the CLI marks the snapshot stale after one,
+so the next read refreshes it first.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import batched
+from pathlib import Path
+from typing import NamedTuple
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Engine,
+    Float,
+    Integer,
+    MetaData,
+    Table,
+    delete,
+    func,
+    insert,
+    inspect,
+    literal_column,
+    or_,
+    update,
+)
+from sqlmodel import Session, SQLModel, select
+
+from .db import SessionFactory, create_configured_engine, track_queries
+from .models import CodeBlob, Snippet, SnippetTag, SnippetVersion
+from .repo import (
+    WATERMARK_OVERLAP,
+    DatabaseBackedSnippetRepo,
+    link_snippet_tags,
+    prune_code_blobs,
+)
+
+# Rows copied per statement while refreshing
+BATCH_SIZE = 1000
+
+
+def user_cache_dir() -> Path:
+    """Where the platform keeps per-user caches."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "snipster"
+
+
+class SnapshotSettings(BaseSettings):
+    """Snapshot location and freshness, read from ``SNIPSTER_SNAPSHOT_*``."""
+
+    model_config = SettingsConfigDict(env_prefix="SNIPSTER_SNAPSHOT_")
+
+    path: Path = user_cache_dir() / "snapshot.sqlite"
+    # Seconds a refresh is trusted before reads check the primary again
+    max_age: float = 300
+
+
+# Kept out of SQLModel.metadata, so the primary never gets this table
+_metadata = MetaData()
+snapshot_state = Table(
+    "snapshot_state",
+    _metadata,
+    Column("id", Integer, primary_key=True),
+    # The primary's SnippetVersion when the rows were copied
+    Column("version", Integer, nullable=False),
+    Column("max_id", Integer, nullable=False),
+    Column("watermark", DateTime),
+    # Unix time of the last refresh; 0 once a write makes it stale
+    Column("refreshed_at", Float, nullable=False),
+)
+
+
+class RefreshResult(NamedTuple):
+    copied: int
+    removed: int
+
+
+class Snapshot:
+    def __init__(self, settings: SnapshotSettings | None = None) -> None:
+        self.settings = settings or SnapshotSettings()
+        self.path = self.settings.path
+        self._engine: Engine | None = None
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            new = not self.exists()
+            self._engine = create_configured_engine(f"sqlite:///{self.path}")
+            if not new and not self._schema_current(self._engine):
+                # Written by an older snipster; a full refresh rebuilds it
+                self.clear()
+                new = True
+                self._engine = create_configured_engine(f"sqlite:///{self.path}")
+            track_queries(self._engine)
+            if new:
+                SQLModel.metadata.create_all(self._engine)
+                _metadata.create_all(self._engine)
+        return self._engine
+
+    @staticmethod
+    def _schema_current(engine: Engine) -> bool:
+        """Whether the file has the columns the snippet models have now."""
+        inspector = inspect(engine)
+        return all(
+            {c["name"] for c in inspector.get_columns(model.__tablename__)}  # type: ignore
+            == set(model.__table__.columns.keys())  # type: ignore
+            for model in (Snippet, CodeBlob)
+        )
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def session_factory(self) -> SessionFactory:
+        return SessionFactory(self.engine)
+
+    def _state(self, session: Session):
+        return session.exec(select(*snapshot_state.columns)).first()
+
+    def age(self) -> float | None:
+        """Seconds since the last refresh, or None if it was never refreshed."""
+        if not self.exists():
+            return None
+        with Session(self.engine) as session:
+            state = self._state(session)
+        if state is None or not state.refreshed_at:
+            return None
+        return time.time() - state.refreshed_at
+
+    def is_fresh(self) -> bool:
+        age = self.age()
+        return age is not None and age < self.settings.max_age
+
+    def mark_stale(self) -> None:
+        """Make the next read refresh first; a no-op without a snapshot."""
+        if not self.exists():
+            return
+        with Session(self.engine) as session:
+            session.exec(update(snapshot_state).values(refreshed_at=0))  # type: ignore
+            session.commit()
+
+    def refresh(self, primary: SessionFactory) -> RefreshResult:
+        """Copy what changed on the primary since the last refresh."""
+        with Session(self.engine) as local, primary.get_session() as remote:
+            state = self._state(local)
+            version = DatabaseBackedSnippetRepo(remote).version()
+            if state is not None and state.version == version:
+                self._save_state(local, version, state.max_id, state.watermark)
+                return RefreshResult(0, 0)
+
+            written = func.coalesce(Snippet.updated_at, Snippet.created_at)
+            columns = Snippet.__table__.columns  # type: ignore
+            stmt = select(*columns).order_by(Snippet.id)  # type: ignore
+            if state is not None:
+                changed = Snippet.id > state.max_id  # type: ignore
+                if state.watermark is not None:
+                    since = state.watermark - WATERMARK_OVERLAP
+                    changed = or_(changed, written >= since)
+                stmt = stmt.where(changed)
+            result = remote.exec(stmt.execution_options(yield_per=BATCH_SIZE))
+
+            max_id = state.max_id if state is not None else 0
+            watermark = state.watermark if state is not None else None
+            copied = 0
+            for batch in batched(result.mappings(), BATCH_SIZE):  # type: ignore
+                rows = [dict(row) for row in batch]
+                self._copy_blobs(local, remote, rows)
+                self._replace(local, rows)
+                copied += len(rows)
+                max_id = max(max_id, rows[-1]["id"])
+                latest = max(row["updated_at"] or row["created_at"] for row in rows)
+                watermark = latest if watermark is None else max(watermark, latest)
+
+            removed = self._removed_ids(local, remote, max_id)
+            for ids in batched(removed, BATCH_SIZE):
+                self._remove(local, ids)
+            if removed:
+                prune_code_blobs(local, None)
+
+            # Mirrored into the snapshot's own version row, which is what a
+            # long-lived fuzzy index over the snapshot checks for changes
+            local.exec(delete(SnippetVersion))  # type: ignore
+            local.exec(insert(SnippetVersion).values(id=1, version=version))  # type: ignore
+            self._save_state(local, version, max_id, watermark)
+        return RefreshResult(copied, len(removed))
+
+    def _removed_ids(self, local: Session, remote: Session, max_id: int) -> list[int]:
+        """Ids in the snapshot that the primary no longer has.
+
+        Every primary row up to ``max_id`` has been copied by now, so equal
+        counts mean nothing was deleted. Otherwise counts per range of ids
+        narrow the comparison of ids down to the ranges that lost rows.
+        """
+        copied = Snippet.id <= max_id  # type: ignore
+        count = select(func.count()).select_from(Snippet).where(copied)
+        if local.exec(count).one() == remote.exec(count).one():
+            return []
+
+        # Inlined, as a bound parameter in both clauses is two different ones
+        # to Postgres, which then rejects the GROUP BY
+        bucket = Snippet.id // literal_column(str(BATCH_SIZE), Integer)  # type: ignore
+        counts = select(bucket, func.count()).where(copied).group_by(bucket)
+        remote_counts = dict(remote.exec(counts).all())  # type: ignore
+        removed = []
+        for n, local_count in local.exec(counts).all():  # type: ignore
+            if remote_counts.get(n, 0) == local_count:
+                continue
+            in_bucket = Snippet.id.between(  # type: ignore
+                n * BATCH_SIZE, (n + 1) * BATCH_SIZE - 1
+            )
+            ids = select(Snippet.id).where(in_bucket)
+            removed += set(local.exec(ids).all()) - set(remote.exec(ids).all())
+        return sorted(removed)
+
+    def _copy_blobs(self, local: Session, remote: Session, rows: list[dict]) -> None:
+        """Copy the compressed code of ``rows`` that the snapshot lacks."""
+        keys = {row["code_blob"] for row in rows if row["code_blob"] is not None}
+        if not keys:
+            return
+        have = select(CodeBlob.digest).where(CodeBlob.digest.in_(keys))  # type: ignore
+        keys -= set(local.exec(have).all())
+        if not keys:
+            return
+        columns = CodeBlob.__table__.columns  # type: ignore
+        stmt = select(*columns).where(CodeBlob.digest.in_(keys))  # type: ignore
+        blobs = [dict(row) for row in remote.exec(stmt).mappings()]  # type: ignore
+        local.exec(insert(CodeBlob), params=blobs)  # type: ignore
+
+    def _remove(self, session: Session, ids) -> None:
+        # SQLite only honours ON DELETE CASCADE with foreign keys switched on
+        links = SnippetTag.snippet_id.in_(ids)  # type: ignore
+        session.exec(delete(SnippetTag).where(links))  # type: ignore
+        session.exec(delete(Snippet).where(Snippet.id.in_(ids)))  # type: ignore
+
+    def _replace(self, session: Session, rows: list[dict]) -> None:
+        # Deleting and reinserting lets the full-text triggers do the updates
+        self._remove(session, [row["id"] for row in rows])
+        session.exec(insert(Snippet.__table__), params=rows)  # type: ignore
+        link_snippet_tags(session, [(row["id"], row["tags"]) for row in rows])
+
+    def _save_state(
+        self,
+        session: Session,
+        version: int,
+        max_id: int,
+        watermark: datetime | None,
+    ) -> None:
+        session.exec(delete(snapshot_state))  # type: ignore
+        session.exec(
+            insert(snapshot_state).values(  # type: ignore
+                id=1,
+                version=version,
+                max_id=max_id,
+                watermark=watermark,
+                refreshed_at=time.time(),
+            )
+        )
+        session.commit()
+
+    def clear(self) -> None:
+        """Delete the snapshot file."""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
@@ -1,10 +1,12 @@
 from typing import Generator
 
 import pytest
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import SQLModel, create_engine
 
-from src.snipster.db import SessionFactory
+from src.snipster.async_db import AsyncSessionFactory, to_async_url
+from src.snipster.db import SessionFactory, track_queries
 from src.snipster.models import Language, SnippetCreate
 from src.snipster.repo import DatabaseBackedSnippetRepo, InMemorySnippetRepo
 
@@ -14,21 +16,31 @@ from src.snipster.repo import DatabaseBackedSnippetRepo, InMemorySnippetRepo
 
 
 @pytest.fixture(scope="function")
-def test_session_factory():
-    """Provide a SessionFactory with in-memory SQLite for tests."""
+def test_db_url(tmp_path):
+    """A fresh SQLite database file, with the schema created."""
+    url = f"sqlite:///{tmp_path / 'test.sqlite'}"
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    with engine.connect() as connection:
+        # WAL lets the sync test sessions and the API's async sessions read
+        # while the other writes; the setting is stored in the file itself
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+    engine.dispose()
+    return url
+
+
+@pytest.fixture(scope="function")
+def test_session_factory(test_db_url):
+    """Provide a SessionFactory backed by the test database file."""
     test_engine = create_engine(
-        "sqlite://",
-        # This allows multiple threads to use the same connection
-        # otherwise you'll get an error:
-        # "SQLite objects created in a thread can only be used in that same thread"
+        test_db_url,
+        # Sessions are opened in test threads and the TestClient's thread
         connect_args={"check_same_thread": False},
-        # StaticPool maintains a single connection shared by all threads to avoid
-        # "database is locked" errors with in-memory SQLite
-        poolclass=StaticPool,
         # Disable SQL query logging to keep test output clean
         echo=False,
     )
-    SQLModel.metadata.create_all(test_engine)
+    # So tests can put query budgets on the code they exercise
+    track_queries(test_engine)
     factory = SessionFactory(test_engine)
 
     yield factory
@@ -37,6 +49,19 @@ def test_session_factory():
     test_engine.dispose()
 
 
+@pytest.fixture(scope="function")
+def test_async_session_factory(test_db_url):
+    """Provide an AsyncSessionFactory on the same file as test_session_factory.
+
+    A file rather than an in-memory database, because a sync and an async
+    engine can't share one in-memory database. NullPool closes connections
+    with their session, so none outlive the TestClient's event loop.
+    """
+    test_engine = create_async_engine(to_async_url(test_db_url), poolclass=NullPool)
+    track_queries(test_engine.sync_engine)
+    return AsyncSessionFactory(test_engine)
+
+
 @pytest.fixture(scope="function")
 def get_test_session(test_session_factory):
     """Provide a database session for tests that use SessionFactory."""
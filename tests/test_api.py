@@ -1,13 +1,32 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 
-from src.snipster.api import app, get_session
+from src.snipster import api
+from src.snipster.api import (
+    app,
+    get_fuzzy_index,
+    get_session_factory,
+    get_snippet_cache,
+)
+from src.snipster.cache import SnippetCache
+from src.snipster.compression import supported_encodings
+from src.snipster.index import FuzzyIndex
 from src.snipster.models import SnippetCreate
 
 
 @pytest.fixture(autouse=True)
-def override_db(get_test_session):
-    app.dependency_overrides[get_session] = lambda: get_test_session
+def override_db(test_async_session_factory):
+    # get_session opens its sessions from the overridden factory
+    app.dependency_overrides[get_session_factory] = lambda: (
+        test_async_session_factory
+    )
+    # Each test gets its own database, so it needs its own fuzzy index too
+    index = FuzzyIndex()
+    app.dependency_overrides[get_fuzzy_index] = lambda: index
+    cache = SnippetCache()
+    app.dependency_overrides[get_snippet_cache] = lambda: cache
     yield
     app.dependency_overrides.clear()
 
@@ -60,6 +79,25 @@ def test_create_snippet(client):
     assert payload["language"] == "javascript"
 
 
+def test_create_snippet_dedupe(client):
+    body = {"title": "Test", "code": "print(1)", "language": "python"}
+    created = client.post("/create", json=body).json()
+    assert "content_hash" not in created
+
+    copy = {**body, "title": "Copy", "code": "print(1)\n"}
+    response = client.post("/create", params={"dedupe": "existing"}, json=copy)
+    assert response.status_code == 200
+    assert response.json()["id"] == created["id"]
+
+    response = client.post("/create", params={"dedupe": "reject"}, json=copy)
+    assert response.status_code == 409
+    assert response.json()["detail"]["snippet_id"] == created["id"]
+
+    response = client.post("/create", json=copy)
+    assert response.status_code == 201
+    assert response.json()["id"] != created["id"]
+
+
 def test_create_snippet_short_title(client):
     """
     Example 422 response body
@@ -225,6 +263,146 @@ def test_list_snippets(client):
         assert len(snippet["code"]) >= 3
 
 
+def test_list_snippets_pages(client, snippet, db_repo):
+    ids = [db_repo.add(snippet).id for _ in range(5)]
+
+    response = client.get("/snippets", params={"limit": 2})
+    assert response.status_code == 200
+    assert [s["id"] for s in response.json()] == ids[:2]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get("/snippets", params={"limit": 2, "after": cursor})
+    assert [s["id"] for s in response.json()] == ids[2:4]
+
+    response = client.get("/snippets", params={"limit": 2, "after": ids[3]})
+    assert [s["id"] for s in response.json()] == ids[4:]
+    assert "X-Next-Cursor" not in response.headers
+
+    assert client.get("/snippets", params={"limit": 0}).status_code == 422
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_list_snippets_by_tag(client):
+    response = client.get("/snippets", params={"tag": "beginner"})
+    assert response.status_code == 200
+    assert [s["title"] for s in response.json()] == ["Hello World", "Hello Rust"]
+
+    response = client.get("/snippets", params={"tag": "Beginner", "limit": 1})
+    assert [s["title"] for s in response.json()] == ["Hello World"]
+
+    response = client.get("/snippets", params={"tag": "array", "view": "summary"})
+    assert [s["title"] for s in response.json()] == ["Array Map"]
+
+    assert client.get("/snippets", params={"tag": "nope"}).json() == []
+
+
+def test_list_snippets_summary_view(client, db_repo):
+    big = db_repo.add(
+        SnippetCreate(title="Generated", code="x = 1\n" * 5000, language="python")
+    )
+
+    full = client.get("/snippets")
+    summary = client.get("/snippets", params={"view": "summary"})
+    assert summary.status_code == 200
+    body = summary.json()
+    assert "code" not in body[0]
+    assert body[0]["title"] == "Generated"
+    assert body[0]["preview"] == big.code[:80]
+    assert len(summary.content) * 10 < len(full.content)
+
+    body = client.get("/snippets", params={"view": "summary", "preview": 0}).json()
+    assert body[0]["preview"] is None
+
+    response = client.get("/snippets", params={"view": "everything"})
+    assert response.status_code == 422
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_list_snippets_etag(client, db_repo):
+    response = client.get("/snippets", params={"view": "summary"})
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+
+    cached = client.get(
+        "/snippets", params={"view": "summary"}, headers={"If-None-Match": etag}
+    )
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    strong = etag.removeprefix("W/")
+    listed = client.get(
+        "/snippets",
+        params={"view": "summary"},
+        headers={"If-None-Match": f'"x", {strong}'},
+    )
+    assert listed.status_code == 304
+
+    # Each listing has its own ETag, however its parameters are spelled
+    assert etag.startswith('W/"')
+
+    def summary_etag(**params):
+        response = client.get("/snippets", params={"view": "summary", **params})
+        return response.headers["etag"]
+
+    others = [
+        client.get("/snippets").headers["etag"],
+        summary_etag(limit=1),
+        summary_etag(tag="x"),
+        summary_etag(preview=5),
+        client.get("/snippets/1").headers["etag"],
+    ]
+    assert len({etag, *others}) == 6
+    assert summary_etag(tag=" X ") == others[2]
+    full = client.get("/snippets", headers={"If-None-Match": etag})
+    assert full.status_code == 200
+
+    # Any write, even one the API didn't make, changes the ETag
+    db_repo.toggle_favorite(1)
+    response = client.get(
+        "/snippets", params={"view": "summary"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()[0]["favorite"] is True
+
+
+# =============================================================================
+# GET /snippets/export
+# =============================================================================
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_export_snippets(client, sample_snippets):
+    with client.stream("GET", "/snippets/export") as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert [r["title"] for r in rows] == [s["title"] for s in sample_snippets]
+    assert [r["id"] for r in rows] == sorted(r["id"] for r in rows)
+    assert rows[0]["code"] == "print('Hello, world!')"
+    assert rows[0]["tags"] == ["beginner", "basics"]
+
+
+def test_export_snippets_large_code(client, monkeypatch):
+    monkeypatch.setattr("src.snipster.code_blobs.COMPRESS_THRESHOLD", 100)
+    code = "\n".join(f"value_{i} = {i}" for i in range(50))
+    body = {"title": "Generated", "code": code, "language": "python"}
+    created = client.post("/create", json=body).json()
+    assert created["code"] == code
+    assert "code_blob" not in created
+
+    assert client.get(f"/snippets/{created['id']}").json()["code"] == code
+    rows = client.get("/snippets/export").text.splitlines()
+    assert [json.loads(row)["code"] for row in rows] == [code]
+
+
+def test_export_snippets_empty(client):
+    response = client.get("/snippets/export")
+    assert response.status_code == 200
+    assert response.text == ""
+
+
 # =============================================================================
 # GET /snippets/{id}
 # =============================================================================
@@ -264,6 +442,22 @@ def test_get_snippet_missing_id(client):
     assert detail == "Snippet with id 0 not found"
 
 
+@pytest.mark.usefixtures("seed_db")
+def test_get_snippet_etag(client):
+    response = client.get("/snippets/1")
+    etag = response.headers["etag"]
+    cached = client.get("/snippets/1", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    other = client.get("/snippets/2", headers={"If-None-Match": etag})
+    assert other.status_code == 200
+
+    client.post("/snippets/1/add-tags", json={"tags": ["etag"]})
+    response = client.get("/snippets/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "etag" in response.json()["tags"]
+
+
 # =============================================================================
 # DELETE /snippets/{id}
 # =============================================================================
@@ -421,6 +615,50 @@ def test_add_duplicate_tags(client, snippet, db_repo):
     assert data["tags"].count("python") == 1
 
 
+def test_add_tags_returns_snippet(client, snippet, db_repo):
+    created = db_repo.add(snippet)
+    response = client.post(
+        f"/snippets/{created.id}/add-tags", json={"tags": ["Web", "web", "api"]}
+    )
+    assert response.status_code == 201
+    assert response.json()["tags"] == ["web", "api"]
+
+
+def test_remove_tags(client, snippet, db_repo):
+    created = db_repo.add(snippet)
+    db_repo.add_tags(created.id, ["web", "api"])
+    response = client.post(
+        f"/snippets/{created.id}/remove-tags", json={"tags": ["WEB", "missing"]}
+    )
+    assert response.status_code == 200
+    assert response.json()["tags"] == ["api"]
+
+    response = client.post("/snippets/0/remove-tags", json={"tags": ["api"]})
+    assert response.status_code == 404
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_add_tags_to_many(client):
+    response = client.post(
+        "/snippets/add-tags", json={"snippet_ids": [1, 3], "tags": ["shared"]}
+    )
+    assert response.status_code == 200
+    assert [s["id"] for s in response.json()] == [1, 3]
+    assert all("shared" in s["tags"] for s in response.json())
+    tagged = client.get("/snippets", params={"tag": "shared"}).json()
+    assert [s["id"] for s in tagged] == [1, 3]
+
+    response = client.post(
+        "/snippets/add-tags", json={"snippet_ids": [2, 999], "tags": ["partial"]}
+    )
+    assert response.status_code == 404
+    assert "999" in response.json()["detail"]
+    assert client.get("/snippets", params={"tag": "partial"}).json() == []
+
+    response = client.post("/snippets/add-tags", json={"snippet_ids": [], "tags": []})
+    assert response.status_code == 422
+
+
 # =============================================================================
 # GET /search
 # =============================================================================
@@ -433,10 +671,12 @@ def test_search(sample_snippets_for_testing_search, client):
     response = client.get("/search", params={"q": "foo"})
     results = response.json()
     assert response.status_code == 200
-    assert len(results) == 2
+    assert len(results) == 3
     titles = [r["title"] for r in results]
     assert "Foo" in titles
     assert "Super Foo" in titles
+    # Matched through its "foo" tag
+    assert "Blah" in titles
 
     response = client.get("/search", params={"q": "baz"})
     results = response.json()
@@ -453,6 +693,43 @@ def test_search(sample_snippets_for_testing_search, client):
     assert results[0]["description"] == "This is a blah snippet"
 
 
+def test_search_index_tracks_writes(sample_snippets_for_testing_search, client):
+    for s in sample_snippets_for_testing_search:
+        client.post("/create", json=s)
+
+    # The first search loads the index; later writes update it in place
+    assert len(client.get("/search", params={"q": "baz"}).json()) == 1
+    created = client.post(
+        "/create",
+        json={"title": "Bazooka", "code": "print('boom')", "language": "python"},
+    ).json()
+    titles = [r["title"] for r in client.get("/search", params={"q": "baz"}).json()]
+    assert "Bazooka" in titles
+
+    client.delete(f"/snippets/{created['id']}")
+    titles = [r["title"] for r in client.get("/search", params={"q": "baz"}).json()]
+    assert titles == ["Baz"]
+
+
+def test_search_limit_and_score_cutoff(sample_snippets_for_testing_search, client):
+    for s in sample_snippets_for_testing_search:
+        client.post("/create", json=s)
+
+    response = client.get("/search", params={"q": "foo", "limit": 1})
+    assert response.status_code == 200
+    assert [r["title"] for r in response.json()] == ["Foo"]
+
+    response = client.get("/search", params={"q": "foo", "score_cutoff": 100})
+    assert response.status_code == 200
+    assert [r["title"] for r in response.json()] == ["Foo"]
+
+    assert client.get("/search", params={"q": "foo", "limit": 0}).status_code == 422
+    assert (
+        client.get("/search", params={"q": "foo", "score_cutoff": 101}).status_code
+        == 422
+    )
+
+
 def test_search_missing_param(client):
     response = client.get("/search")
     assert response.status_code == 422
@@ -471,3 +748,125 @@ def test_search_string_too_long(client):
 def test_search_whitespace_only(client):
     response = client.get("/search", params={"q": "   "})
     assert response.status_code == 422
+
+
+# =============================================================================
+# Serialization and compression
+# =============================================================================
+
+
+def test_large_listing_is_compressed(client, db_repo):
+    code = "print('hello, world')\n" * 100
+    for i in range(5):
+        db_repo.add(SnippetCreate(title=f"Snippet {i}", code=code, language="python"))
+
+    plain = client.get("/snippets", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    gzipped = client.get("/snippets", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+    assert int(gzipped.headers["content-length"]) < len(plain.content)
+    # The weak ETag holds for every encoding, and the body decodes to the same JSON
+    assert gzipped.headers["etag"] == plain.headers["etag"]
+    assert gzipped.headers["etag"].startswith("W/")
+    assert gzipped.json() == plain.json()
+
+    if "br" in supported_encodings():
+        brotli = client.get("/snippets", headers={"Accept-Encoding": "gzip, br"})
+        assert brotli.headers["content-encoding"] == "br"
+        assert brotli.json() == plain.json()
+    refused = client.get("/snippets", headers={"Accept-Encoding": "br;q=0, gzip"})
+    assert refused.headers["content-encoding"] == "gzip"
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_small_response_is_not_compressed(client):
+    response = client.get("/snippets?limit=1", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"] == "application/json"
+
+
+# =============================================================================
+# GET /metrics
+# =============================================================================
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_metrics(client):
+    client.get("/snippets/1")
+    client.get("/snippets/9999")
+    client.get("/no-such-route")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    labels = 'method="GET",route="/snippets/{snippet_id}"'
+    # Counted per route template, not per path
+    assert any(
+        line.startswith(f'snipster_http_requests_total{{{labels},status="200"}}')
+        for line in lines
+    )
+    assert any(
+        line.startswith(f'snipster_http_requests_total{{{labels},status="404"}}')
+        for line in lines
+    )
+    assert any('route="unmatched"' in line for line in lines)
+    # The lookups hit the database, and their time is attributed to the route
+    db_time = next(
+        line
+        for line in lines
+        if line.startswith(f"snipster_db_query_duration_seconds_sum{{{labels}}}")
+    )
+    assert float(db_time.split()[-1]) > 0
+    assert "snipster_http_requests_in_flight 1" in lines  # the /metrics request
+
+
+# =============================================================================
+# Query budgets
+# =============================================================================
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_query_count_headers(client, monkeypatch):
+    assert "x-query-count" not in client.get("/snippets/1").headers
+
+    monkeypatch.setattr(api.engine_settings, "query_debug", True)
+    response = client.get("/snippets/1")
+    assert int(response.headers["x-query-count"]) >= 1
+    assert float(response.headers["x-query-time-ms"]) > 0
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_query_budgets(client, monkeypatch):
+    """Statements per request stay flat however many snippets or tags there are."""
+    monkeypatch.setattr(api.engine_settings, "query_debug", True)
+    new = {"title": "New", "code": "x = 1", "language": "python", "tags": ["a", "b"]}
+    bulk = {"snippet_ids": [1, 2, 3], "tags": ["q", "r"]}
+    budgets = [
+        ("get", "/snippets", None, 2),
+        ("get", "/snippets?view=summary", None, 2),
+        ("get", "/snippets/1", None, 2),
+        ("post", "/create", new, 6),
+        ("post", "/snippets/1/add-tags", {"tags": ["x", "y", "z"]}, 7),
+        ("post", "/snippets/1/remove-tags", {"tags": ["x", "y"]}, 5),
+        ("post", "/snippets/add-tags", bulk, 7),
+        ("post", "/snippets/1/toggle-favorite", None, 4),
+        # The first search loads the index, at the version it reads first
+        ("get", "/search?q=hello", None, 3),
+        ("delete", "/snippets/2", None, 4),
+    ]
+    for method, path, body, budget in budgets:
+        response = client.request(method.upper(), path, json=body)
+        assert response.is_success, path
+        count = int(response.headers["x-query-count"])
+        assert count <= budget, f"{method.upper()} {path} ran {count} statements"
+
+
+@pytest.mark.usefixtures("seed_db")
+def test_query_warning(client, monkeypatch, caplog):
+    monkeypatch.setattr(api.engine_settings, "query_warning_threshold", 1)
+    client.post("/snippets/1/add-tags", json={"tags": ["x"]})
+    assert "POST /snippets/1/add-tags ran" in caplog.text
+    assert "threshold 1" in caplog.text
@@ -0,0 +1,28 @@
+from benchmarks.compare import compare
+from benchmarks.data import DataSpec, generate_snippets, search_terms
+from benchmarks.run import Suite
+
+
+def test_generated_snippets_are_reproducible():
+    spec = DataSpec(seed=3, languages=("rust",), tags_per_snippet=(2, 2))
+    first = generate_snippets(20, spec)
+    assert first == generate_snippets(20, spec)
+    assert first != generate_snippets(20, DataSpec(seed=4))
+    assert {s.language for s in first} == {"rust"}
+    assert all(1 <= len(s.tags) <= 2 for s in first)
+    assert all(len(term) >= 3 for term in search_terms(50))
+
+
+def test_suite_smoke():
+    # Just enough to keep the suite runnable as the code under it changes
+    suite = Suite(DataSpec(), scale=0.01)
+    suite.run([30], ["memory", "sqlite", "api"])
+    results = {(r["target"], r["operation"]): r for r in suite.results}
+    assert results["memory", "fuzzy_search"]["ops"] == 1
+    assert results["sqlite", "add_many"]["p50_ms"] > 0
+    assert ("sqlite", "fuzzy_search_cold") in results
+    assert ("api", "create") in results
+
+    before = {(r["target"], r["size"], r["operation"]): r for r in suite.results}
+    after = {key: {**r, "p50_ms": r["p50_ms"] * 2} for key, r in before.items()}
+    assert all(ratio == 2 for *_, ratio in compare(before, after))
@@ -0,0 +1,148 @@
+import pytest
+
+from src.snipster.cache import CachedSnippetRepo, SnippetCache
+from src.snipster.exceptions import SnippetNotFoundError
+from src.snipster.models import Snippet, SnippetCreate
+
+
+@pytest.fixture
+def cache():
+    return SnippetCache(maxsize=8)
+
+
+@pytest.fixture
+def cached_repo(repo, cache):
+    return CachedSnippetRepo(repo, cache)
+
+
+@pytest.fixture
+def ids(cached_repo, sample_snippets):
+    return [cached_repo.add(SnippetCreate(**data)).id for data in sample_snippets]
+
+
+def test_get_reads_through(cached_repo, cache, ids):
+    first = cached_repo.get(ids[0])
+    second = cached_repo.get(ids[0])
+    assert second.title == first.title
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+    # Hits are copies, so changing one doesn't leak into the next
+    second.title = "Changed"
+    assert cached_repo.get(ids[0]).title == first.title
+    with pytest.raises(SnippetNotFoundError):
+        cached_repo.get(9999)
+
+
+def test_list_reads_through(cached_repo, cache, ids):
+    assert [s.id for s in cached_repo.list(limit=2)] == ids[:2]
+    assert [s.id for s in cached_repo.list(limit=2)] == ids[:2]
+    summaries = cached_repo.list_summaries(tag=" Beginner")
+    assert [s.id for s in cached_repo.list_summaries(tag="beginner")] == [
+        s.id for s in summaries
+    ]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_writes_invalidate(cached_repo, cache, ids):
+    cached_repo.get(ids[0])
+    cached_repo.get(ids[1])
+    first_page = [s.id for s in cached_repo.list(limit=1)]
+    cached_repo.list(tag="shared")
+    cached_repo.list()
+
+    # Only the unbounded listing can show a new untagged snippet
+    added = cached_repo.add(
+        SnippetCreate(title="Untagged", code="x = 1", language="python")
+    )
+    assert [s.id for s in cached_repo.list()] == [*ids, added.id]
+    assert [s.id for s in cached_repo.list(limit=1)] == first_page
+    assert cached_repo.get(ids[0]).favorite is False
+    assert cache.stats()["hits"] == 2
+
+    cached_repo.toggle_favorite(ids[0])
+    assert cached_repo.get(ids[0]).favorite is True
+    assert cached_repo.list(limit=1)[0].favorite is True
+
+    # Tagging changes the snippet and the listing of that tag
+    cached_repo.add_tags_to_many([ids[1], ids[2]], ["Shared"])
+    assert [s.id for s in cached_repo.list(tag="shared")] == ids[1:]
+    assert "shared" in cached_repo.get(ids[1]).tags
+    cached_repo.remove_tag(ids[2], "shared")
+    assert [s.id for s in cached_repo.list(tag="shared")] == [ids[1]]
+
+    cached_repo.delete(ids[1])
+    with pytest.raises(SnippetNotFoundError):
+        cached_repo.get(ids[1])
+    assert ids[1] not in [s.id for s in cached_repo.list()]
+
+
+def test_lru_eviction_and_ttl(repo, ids):
+    cache = SnippetCache(maxsize=2)
+    cached_repo = CachedSnippetRepo(repo, cache)
+    for snippet_id in ids:
+        cached_repo.get(snippet_id)
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    cached_repo.get(ids[0])
+    assert cache.stats()["hits"] == 0
+
+    expired = SnippetCache(ttl=0)
+    cached_repo = CachedSnippetRepo(repo, expired)
+    cached_repo.get(ids[0])
+    cached_repo.get(ids[0])
+    assert expired.stats()["hits"] == 0
+    assert expired.stats()["misses"] == 2
+
+    with pytest.raises(ValueError):
+        SnippetCache(maxsize=0)
+
+
+def test_other_writers_clear_cache(repo, cache, ids):
+    cached_repo = CachedSnippetRepo(repo, cache)
+    cached_repo.version()
+    assert cached_repo.get(ids[0]).favorite is False
+
+    # A write that bypasses the cache is noticed at the next version check
+    repo.toggle_favorite(ids[0])
+    assert cached_repo.get(ids[0]).favorite is False
+    cached_repo.version()
+    assert cached_repo.get(ids[0]).favorite is True
+
+    # Its own writes are invalidated precisely instead
+    cached_repo.get(ids[1])
+    cached_repo.toggle_favorite(ids[0])
+    cached_repo.version()
+    assert len(cache) == 1
+
+
+def test_load_racing_a_write_is_not_stored(repo, cache, ids, monkeypatch):
+    cached_repo = CachedSnippetRepo(repo, cache)
+    # Another request sharing the cache, writing while the load is in flight
+    writer = CachedSnippetRepo(repo, cache)
+    read_get, read_list = repo.get, repo.list
+
+    def get_then_write(snippet_id):
+        # A copy, as another session would have read it before the write
+        snippet = Snippet(**read_get(snippet_id).model_dump())
+        writer.toggle_favorite(snippet_id)
+        return snippet
+
+    def list_then_write(*args):
+        snippets = [Snippet(**s.model_dump()) for s in read_list(*args)]
+        writer.add_tags(snippets[0].id, ["raced"])
+        return snippets
+
+    monkeypatch.setattr(repo, "get", get_then_write)
+    monkeypatch.setattr(repo, "list", list_then_write)
+    assert cached_repo.get(ids[0]).favorite is False
+    assert "raced" not in cached_repo.list(limit=2)[0].tags
+    assert len(cache) == 0
+
+    monkeypatch.undo()
+    assert cached_repo.get(ids[0]).favorite is True
+    assert "raced" in cached_repo.list(limit=2)[0].tags
+    # Loads that no write overtook are stored as usual
+    assert cached_repo.get(ids[0]).favorite is True
+    assert cache.stats()["hits"] == 1
@@ -1,7 +1,13 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 from typer.testing import CliRunner
 
 import src.snipster.cli as cli_module
+from src.snipster.db import SessionFactory, query_budget
 
 app = cli_module.app
 
@@ -27,6 +33,14 @@ def setup_test_db(test_session_factory):
     cli_module.cli_session_factory = original
 
 
+@pytest.fixture(autouse=True)
+def snapshot_path(tmp_path, monkeypatch):
+    """Keep the tests' snapshots out of the user's cache directory."""
+    path = tmp_path / "snapshot.sqlite"
+    monkeypatch.setenv("SNIPSTER_SNAPSHOT_PATH", str(path))
+    return path
+
+
 def test_add_snippet():
     result = runner.invoke(
         app, ["add", "--title", "Test", "--code", "print('hi')", "--language", "python"]
@@ -255,6 +269,166 @@ def test_list_snippets():
     assert "Test List Snippet" in list_result.stdout
 
 
+def test_list_snippets_pages():
+    """Test paging through snippets via CLI."""
+    for title in ["First Snippet", "Second Snippet", "Third Snippet"]:
+        add_result = runner.invoke(
+            app, ["add", "--title", title, "--code", "x = 1", "--language", "python"]
+        )
+        assert add_result.exit_code == 0
+
+    list_result = runner.invoke(app, ["list", "--limit", "2"])
+    assert list_result.exit_code == 0
+    assert "First Snippet" in list_result.stdout
+    assert "Second Snippet" in list_result.stdout
+    assert "Third Snippet" not in list_result.stdout
+    assert "--after 2" in list_result.stdout
+
+    list_result = runner.invoke(app, ["list", "--limit", "2", "--after", "2"])
+    assert list_result.exit_code == 0
+    assert "First Snippet" not in list_result.stdout
+    assert "Third Snippet" in list_result.stdout
+
+
+def test_list_snippets_by_tag(test_session_factory):
+    """Test filtering the listing by tag via CLI."""
+    from src.snipster.cli_snippet_service import add_snippet
+    from src.snipster.models import SnippetCreate
+
+    for title, tags in [
+        ("Tagged One", ["cli"]),
+        ("Untagged", []),
+        ("Tagged Two", ["cli"]),
+    ]:
+        add_snippet(
+            test_session_factory,
+            SnippetCreate(title=title, code="x = 1", language="python", tags=tags),
+        )
+
+    list_result = runner.invoke(app, ["list", "--tag", "CLI"])
+    assert list_result.exit_code == 0
+    assert "Tagged One" in list_result.stdout
+    assert "Tagged Two" in list_result.stdout
+    assert "Untagged" not in list_result.stdout
+
+
+def test_tag_snippets(test_session_factory):
+    """Test adding and removing tags on several snippets via CLI."""
+    from src.snipster.cli_snippet_service import add_snippet, get_snippet
+    from src.snipster.models import SnippetCreate
+
+    for title in ["First Snippet", "Second Snippet"]:
+        add_snippet(
+            test_session_factory,
+            SnippetCreate(title=title, code="x = 1", language="python"),
+        )
+
+    # The same few statements however many snippets are tagged
+    with query_budget(8):
+        tag_result = runner.invoke(app, ["tag", "1", "2", "-t", "Web", "--tag", "api"])
+    assert tag_result.exit_code == 0
+    assert "First Snippet" in tag_result.stdout
+    assert get_snippet(test_session_factory, 2).tags == ["web", "api"]
+
+    remove_result = runner.invoke(app, ["tag", "2", "-t", "web", "--remove"])
+    assert remove_result.exit_code == 0
+    assert get_snippet(test_session_factory, 1).tags == ["web", "api"]
+    assert get_snippet(test_session_factory, 2).tags == ["api"]
+
+    missing_result = runner.invoke(app, ["tag", "1", "99", "-t", "nope"])
+    assert missing_result.exit_code == 1
+    assert "99" in missing_result.stdout
+    assert get_snippet(test_session_factory, 1).tags == ["web", "api"]
+
+
+def test_import_snippets(tmp_path, test_session_factory):
+    """Test bulk importing a JSON Lines file via CLI, skipping bad rows."""
+    from src.snipster.cli_snippet_service import list_snippets
+
+    rows = [
+        {"title": "Imported One", "code": "x = 1", "language": "python"},
+        {"title": "no", "code": "x = 2", "language": "python"},
+        {"title": "Imported Two", "code": "let x = 3;", "language": "rust"},
+    ]
+    path = tmp_path / "snippets.jsonl"
+    lines = [json.dumps(row) for row in rows] + ["", "{not json"]
+    path.write_text("\n".join(lines) + "\n")
+
+    result = runner.invoke(app, ["import", str(path), "--batch-size", "2"])
+    assert result.exit_code == 1
+    assert "Imported 2 snippets" in result.stdout
+    assert "Row 2: title" in result.stdout
+    assert "Row 5:" in result.stdout
+    titles = [s.title for s in list_snippets(test_session_factory)]
+    assert titles == ["Imported One", "Imported Two"]
+
+
+def test_import_snippets_json_array(tmp_path, test_session_factory):
+    """Test importing a JSON array file via CLI."""
+    from src.snipster.cli_snippet_service import list_snippets
+
+    rows = [
+        {"title": f"Array Item {i}", "code": "x = 1", "language": "python"}
+        for i in range(3)
+    ]
+    path = tmp_path / "snippets.json"
+    path.write_text(json.dumps(rows, indent=2))
+
+    result = runner.invoke(app, ["import", str(path)])
+    assert result.exit_code == 0
+    assert "Imported 3 snippets" in result.stdout
+    assert len(list_snippets(test_session_factory)) == 3
+
+
+def test_import_snippets_dedupe(tmp_path, test_session_factory):
+    """Test skipping, then rejecting, rows whose code is already stored."""
+    from src.snipster.cli_snippet_service import list_snippets
+
+    rows = [
+        {"title": "Original", "code": "x = 1", "language": "python"},
+        {"title": "Same Code", "code": "x  =  1", "language": "python"},
+        {"title": "Other", "code": "x = 2", "language": "python"},
+    ]
+    path = tmp_path / "snippets.jsonl"
+    path.write_text("\n".join(json.dumps(row) for row in rows) + "\n")
+
+    result = runner.invoke(app, ["import", str(path), "--dedupe", "existing"])
+    assert result.exit_code == 0
+    assert "Imported 2 snippets" in result.stdout
+    assert "Skipped 1 duplicate rows" in result.stdout
+
+    result = runner.invoke(app, ["import", str(path), "--dedupe", "reject", "-b", "1"])
+    assert result.exit_code == 1
+    assert "Imported 0 snippets" in result.stdout
+    assert "Row 2: duplicate of snippet 1" in result.stdout
+    titles = [s.title for s in list_snippets(test_session_factory)]
+    assert titles == ["Original", "Other"]
+
+
+def test_add_and_merge_duplicates():
+    """Test adding with --dedupe and merging duplicates with `dedupe`."""
+    add = ["add", "-t", "Original", "-c", "print(1)", "-l", "python"]
+    runner.invoke(app, add)
+
+    result = runner.invoke(app, [*add, "--dedupe", "existing"])
+    assert result.exit_code == 0
+    assert "Already stored: 1: Original (python)" in result.stdout
+
+    result = runner.invoke(app, [*add, "--dedupe", "reject"])
+    assert result.exit_code == 1
+    assert "duplicates snippet with id 1" in result.stdout
+
+    runner.invoke(app, [*add[:2], "Copy", *add[3:]])
+    result = runner.invoke(app, ["dedupe", "--dry-run"])
+    assert "Would merge 2 into 1" in result.stdout
+
+    result = runner.invoke(app, ["dedupe"])
+    assert result.exit_code == 0
+    assert "Merged 1 duplicates into 1 snippets" in result.stdout
+    result = runner.invoke(app, ["get", "2"])
+    assert result.exit_code == 1
+
+
 def test_toggle_favorite():
     """Test toggling favorite status via CLI."""
     add_result = runner.invoke(
@@ -305,6 +479,29 @@ def test_search_snippets():
     assert "Test Search Snippet" in search_result.stdout
 
 
+def test_find_snippets():
+    for title in ("Parse JSON String", "Read JSON File", "Sort a List"):
+        runner.invoke(app, ["add", "-t", title, "-c", "x = 1", "-l", "python"])
+
+    result = runner.invoke(app, ["find", "parse json", "--limit", "1"])
+    assert result.exit_code == 0
+    lines = result.stdout.strip().splitlines()
+    assert len(lines) == 1
+    assert "1: Parse JSON String (python)" in lines[0]
+
+    result = runner.invoke(app, ["find", "json", "--json"])
+    assert result.exit_code == 0
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert {row["title"] for row in rows} == {"Parse JSON String", "Read JSON File"}
+    assert [row["score"] for row in rows] == sorted(
+        (row["score"] for row in rows), reverse=True
+    )
+
+    result = runner.invoke(app, ["find", "nothing like it", "--json"])
+    assert result.exit_code == 0
+    assert result.stdout == ""
+
+
 def test_delete_snippet():
     """Test deleting a snippet via CLI."""
     add_result = runner.invoke(
@@ -330,3 +527,107 @@ def test_delete_snippet():
     print(f"Delete test - Delete output: {delete_result.stdout}")
     print(f"Delete test - Delete error: {delete_result.stderr}")
     assert delete_result.exit_code == 0
+
+
+def test_query_debug_output(monkeypatch, caplog):
+    result = runner.invoke(app, ["list"])
+    assert "SQL statements" not in result.stderr
+
+    monkeypatch.setenv("DB_QUERY_DEBUG", "true")
+    result = runner.invoke(app, ["list"])
+    assert result.exit_code == 0
+    assert "SQL statements: 1 (" in result.stderr
+
+    monkeypatch.setenv("DB_QUERY_WARNING_THRESHOLD", "1")
+    runner.invoke(app, ["add", "-t", "Tagged", "-c", "x = 1", "-l", "python"])
+    assert "snipster add ran" in caplog.text
+
+
+def test_snapshot_serves_reads(snapshot_path):
+    runner.invoke(app, ["add", "-t", "Cached", "-c", "print('c')", "-l", "python"])
+
+    result = runner.invoke(app, ["snapshot"])
+    assert result.exit_code == 0
+    assert "copied 1," in result.stdout
+    assert snapshot_path.exists()
+
+    # Served without touching the test database at all
+    cli_module.cli_session_factory = None
+    result = runner.invoke(app, ["--offline", "list"])
+    assert result.exit_code == 0
+    assert "1: Cached (python)" in result.stdout
+    result = runner.invoke(app, ["--offline", "search", "Cached"])
+    assert "1: Cached (python)" in result.stdout
+
+
+def test_snapshot_refreshed_after_write(snapshot_path):
+    runner.invoke(app, ["add", "-t", "First", "-c", "print('1')", "-l", "python"])
+    runner.invoke(app, ["snapshot"])
+    runner.invoke(app, ["add", "-t", "Second", "-c", "print('2')", "-l", "python"])
+
+    # The write marked the snapshot stale, so this read refreshes it first
+    result = runner.invoke(app, ["list"])
+    assert "2: Second (python)" in result.stdout
+    result = runner.invoke(app, ["--offline", "get", "2"])
+    assert result.exit_code == 0
+    assert "Second" in result.stdout
+
+
+def test_stale_snapshot_served_when_database_is_down(snapshot_path, tmp_path):
+    runner.invoke(app, ["add", "-t", "Cached", "-c", "print('c')", "-l", "python"])
+    runner.invoke(app, ["snapshot"])
+    runner.invoke(app, ["add", "-t", "Missed", "-c", "print('m')", "-l", "python"])
+
+    missing = tmp_path / "missing" / "snipster.sqlite"
+    cli_module.cli_session_factory = SessionFactory.from_urls(f"sqlite:///{missing}")
+    result = runner.invoke(app, ["list"])
+    assert result.exit_code == 0
+    assert "1: Cached (python)" in result.stdout
+    assert "Missed" not in result.stdout
+    assert "Can't reach the database" in result.stderr
+
+
+def test_offline_without_snapshot():
+    result = runner.invoke(app, ["--offline", "list"])
+    assert result.exit_code == 1
+    assert "No snapshot yet" in result.stdout
+
+    result = runner.invoke(app, ["--offline", "delete", "1"])
+    assert result.exit_code == 1
+    assert "only works with commands that read" in result.stdout
+
+
+def test_snapshot_clear(snapshot_path):
+    runner.invoke(app, ["snapshot"])
+    assert snapshot_path.exists()
+    result = runner.invoke(app, ["snapshot", "--clear"])
+    assert result.exit_code == 0
+    assert not snapshot_path.exists()
+
+
+def test_import_stays_light():
+    """Importing the CLI, as --help does, must not load the database stack.
+
+    Run with ``-X importtime`` in a fresh interpreter. Typer (and the rich
+    modules it loads) comes first, so what is left is the CLI's own cost.
+    """
+    code = (
+        "import sys, typer, src.snipster.cli;"
+        "print(','.join(m for m in sys.modules if m.split('.')[0] in "
+        "{'sqlalchemy', 'sqlmodel', 'pydantic', 'numpy', 'rapidfuzz', 'dotenv'}))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    assert result.stdout.strip() == ""
+    # Lines read "import time: self [us] | cumulative [us] | name"
+    snipster_us = 0
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        if name.strip().startswith("src"):
+            snipster_us = max(snipster_us, int(cumulative))
+    assert 0 < snipster_us < 100_000
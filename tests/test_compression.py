@@ -0,0 +1,25 @@
+import pytest
+
+from src.snipster.compression import choose_encoding
+
+# The expectations below assume both encodings are on offer
+pytest.importorskip("brotli")
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip, deflate, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("BR, GZIP;q=0.9", "br"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("*;q=0.1, gzip", "gzip"),
+        ("gzip;q=nonsense", None),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding) == expected
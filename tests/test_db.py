@@ -0,0 +1,224 @@
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from src.snipster.async_db import AsyncSessionFactory, create_configured_async_engine
+from src.snipster.async_repo import AsyncDatabaseBackedSnippetRepo
+from src.snipster.db import (
+    EngineSettings,
+    ReplicaSet,
+    SessionFactory,
+    collect_queries,
+    create_configured_engine,
+    engine_options,
+    pool_status,
+    query_budget,
+)
+from src.snipster.exceptions import QueryBudgetExceededError
+from src.snipster.models import SnippetCreate
+from src.snipster.repo import DatabaseBackedSnippetRepo
+
+
+def test_engine_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_SQLITE_SYNCHRONOUS", "FULL")
+    settings = EngineSettings()
+    assert settings.pool_size == 20
+    assert settings.pool_pre_ping is False
+    assert settings.sqlite_synchronous == "FULL"
+
+
+def test_engine_options():
+    settings = EngineSettings(pool_size=3, pool_recycle=60, statement_cache_size=50)
+    options = engine_options("postgresql+psycopg://db/snipster", settings)
+    assert options["pool_size"] == 3
+    assert options["pool_recycle"] == 60
+    assert options["query_cache_size"] == 50
+    # In-memory SQLite isn't pooled, so there is nothing to size
+    assert "pool_size" not in engine_options("sqlite://", settings)
+
+
+def _pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_sqlite_pragmas(tmp_path):
+    settings = EngineSettings(sqlite_busy_timeout=1234, pool_size=2)
+    engine = create_configured_engine(f"sqlite:///{tmp_path / 'p.sqlite'}", settings)
+    with engine.connect() as connection:
+        assert _pragma(connection, "journal_mode") == "wal"
+        assert _pragma(connection, "synchronous") == 1  # NORMAL
+        assert _pragma(connection, "busy_timeout") == 1234
+        assert pool_status(engine) == {
+            "size": 2,
+            "checked_in": 0,
+            "checked_out": 1,
+            "overflow": -1,
+        }
+    assert pool_status(engine)["checked_in"] == 1
+    engine.dispose()
+
+
+def test_async_sqlite_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'p.sqlite'}"
+    engine = create_configured_async_engine(url, EngineSettings())
+
+    async def run():
+        try:
+            async with engine.connect() as connection:
+                return await connection.run_sync(_pragma, "journal_mode")
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(run()) == "wal"
+
+
+def test_collect_queries(db_repo, get_test_session, caplog):
+    with collect_queries() as outer:
+        with collect_queries("listing", warning_threshold=1) as inner:
+            get_test_session.exec(text("SELECT 1"))
+            db_repo.list()
+        get_test_session.exec(text("SELECT 2"))
+    # Statements count towards every enclosing block
+    assert inner.count == 2
+    assert outer.count == 3
+    assert inner.seconds > 0
+    assert "SELECT 2" in outer.statements[-1]
+    assert "listing ran 2 SQL statements (threshold 1)" in caplog.text
+    assert "1. SELECT 1" in caplog.text
+
+    # Outside a block nothing is collected
+    get_test_session.exec(text("SELECT 1"))
+    assert outer.count == 3
+
+
+def test_query_budget(db_repo):
+    with query_budget(1) as stats:
+        db_repo.list()
+    assert stats.count == 1
+    with pytest.raises(QueryBudgetExceededError, match="over the budget of 1"):
+        with query_budget(1):
+            db_repo.list()
+            db_repo.list()
+
+
+# =============================================================================
+# Read replicas, stood in for by copies of the test database file
+# =============================================================================
+
+
+def _new_snippet(title: str) -> SnippetCreate:
+    return SnippetCreate(title=title, code="print(1)", language="python")
+
+
+@pytest.fixture
+def copy_database(test_db_url, tmp_path):
+    """Copy the test database as it is now, returning the copy's URL."""
+    primary_path = test_db_url.removeprefix("sqlite:///")
+
+    def copy(name: str) -> str:
+        path = tmp_path / f"{name}.sqlite"
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(path) as dest:
+            source.backup(dest)
+        source.close()
+        dest.close()
+        return f"sqlite:///{path}"
+
+    return copy
+
+
+def test_reads_go_to_a_replica_until_a_write(db_repo, copy_database, test_db_url):
+    db_repo.add(_new_snippet("On Both"))
+    replica_url = copy_database("replica")
+    db_repo.add(_new_snippet("Primary Only"))
+
+    factory = SessionFactory.from_urls(test_db_url, [replica_url])
+    with factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session)
+        assert [s.title for s in repo.list()] == ["On Both"]
+        # Writes read the primary first, so this finds the newer snippet
+        assert repo.toggle_favorite(2).favorite
+        # And the rest of the session reads its own write
+        assert [s.title for s in repo.list()] == ["On Both", "Primary Only"]
+    with factory.get_session() as session:
+        assert len(DatabaseBackedSnippetRepo(session).list()) == 1
+
+
+def test_fresh_version_comes_from_the_primary(db_repo, copy_database, test_db_url):
+    db_repo.add(_new_snippet("On Both"))
+    replica_url = copy_database("replica")
+    db_repo.add(_new_snippet("Primary Only"))
+
+    factory = SessionFactory.from_urls(test_db_url, [replica_url])
+    with factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session)
+        assert repo.version() < repo.fresh_version() == db_repo.version()
+        # The replica is behind that version, so the reads after it aren't
+        assert [s.title for s in repo.list()] == ["On Both", "Primary Only"]
+
+    # A replica that has caught up keeps serving the session's reads
+    copy_database("replica")
+    with factory.get_session() as session:
+        repo = DatabaseBackedSnippetRepo(session)
+        assert repo.fresh_version() == db_repo.version()
+        assert not session.info.get("use_primary")
+
+
+def test_replicas_round_robin_and_ejection(
+    db_repo, copy_database, test_db_url, tmp_path
+):
+    first = copy_database("first")
+    db_repo.add(_new_snippet("Second Only"))
+    second = copy_database("second")
+    missing = f"sqlite:///{tmp_path / 'missing' / 'replica.sqlite'}"
+
+    settings = EngineSettings(replica_retry_after=60)
+    factory = SessionFactory.from_urls(test_db_url, [first, second, missing], settings)
+
+    def count_snippets() -> int:
+        with factory.get_session() as session:
+            return len(DatabaseBackedSnippetRepo(session).list())
+
+    assert [count_snippets() for _ in range(2)] == [0, 1]
+    # The missing replica fails to connect and the read moves on to the next
+    assert count_snippets() == 0
+    assert [r["healthy"] for r in factory.replicas.status()] == [True, True, False]
+    assert [count_snippets() for _ in range(4)] == [1, 0, 1, 0]
+
+    factory.replicas.retry_after = 0
+    factory.replicas.eject(factory.replicas.engines[2])
+    assert factory.replicas.choose() is not None
+    assert all(r["healthy"] for r in factory.replicas.status())
+
+
+def test_all_replicas_ejected_reads_primary(db_repo, test_db_url, tmp_path):
+    db_repo.add(_new_snippet("Primary"))
+    replica = create_configured_engine(f"sqlite:///{tmp_path / 'missing' / 'r.sqlite'}")
+    factory = SessionFactory(
+        create_configured_engine(test_db_url), ReplicaSet([replica])
+    )
+    with factory.get_session() as session:
+        assert len(DatabaseBackedSnippetRepo(session).list()) == 1
+    assert factory.replicas.choose() is None
+
+
+def test_async_replica_routing(db_repo, copy_database, test_db_url):
+    replica_url = copy_database("replica")
+    db_repo.add(_new_snippet("Primary Only"))
+    factory = AsyncSessionFactory.from_urls(test_db_url, [replica_url])
+
+    async def run():
+        async with factory.get_session() as session:
+            repo = AsyncDatabaseBackedSnippetRepo(session)
+            before = await repo.list()
+            await repo.add(_new_snippet("Added"))
+            after = await repo.list()
+        await factory.engine.dispose()
+        for engine in factory.replicas.engines:  # type: ignore[union-attr]
+            engine.dispose()
+        return [s.title for s in before], [s.title for s in after]
+
+    assert asyncio.run(run()) == ([], ["Primary Only", "Added"])
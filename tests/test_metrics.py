@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+from src.snipster.db import QueryStats
+from src.snipster.metrics import Histogram, RequestMetrics
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram((0.1, 0.2, 0.4))
+    assert math.isnan(histogram.quantile(0.5))
+    for value in (0.05, 0.15, 0.15, 0.3, 1.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.1, 1), (0.2, 3), (0.4, 4), (math.inf, 5)]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(1.65)
+    # Rank 2.5 falls three quarters of the way through the 0.1-0.2 bucket
+    assert histogram.quantile(0.5) == pytest.approx(0.175)
+    # Beyond the last bucket, the estimate stops at its bound
+    assert histogram.quantile(0.99) == 0.4
+
+
+def test_render_prometheus_text():
+    metrics = RequestMetrics(latency_buckets=(0.1, 1), size_buckets=(100,))
+    metrics.started()
+    metrics.started()
+    queries = QueryStats()
+    queries.count, queries.seconds = 2, 0.003
+    metrics.finished("GET", "/snippets/{snippet_id}", 200, 0.05, 120, queries)
+    metrics.finished("GET", 'odd"route', 404, 2.0, 10, QueryStats())
+
+    lines = metrics.render().splitlines()
+    labels = 'method="GET",route="/snippets/{snippet_id}"'
+    assert "# TYPE snipster_http_requests_total counter" in lines
+    assert f'snipster_http_requests_total{{{labels},status="200"}} 1' in lines
+    assert "snipster_http_requests_in_flight 0" in lines
+    assert (
+        f'snipster_http_request_duration_seconds_bucket{{{labels},le="0.1"}} 1' in lines
+    )
+    assert f'snipster_http_response_size_bytes_bucket{{{labels},le="+Inf"}} 1' in lines
+    assert f"snipster_http_response_size_bytes_sum{{{labels}}} 120.0" in lines
+    assert f'snipster_http_request_latency_seconds{{{labels},quantile="0.5"}} 0.05' in (
+        lines
+    )
+    assert f'snipster_db_queries_per_request_bucket{{{labels},le="2"}} 1' in lines
+    # Label values are escaped
+    assert 'route="odd\\"route"' in metrics.render()
@@ -1,7 +1,17 @@
+import asyncio
+import threading
+
 import pytest
+from sqlmodel import func, select
 
-from src.snipster.exceptions import SnippetNotFoundError
-from src.snipster.models import Language, Snippet, SnippetCreate
+from src.snipster import code_blobs
+from src.snipster.async_repo import AsyncDatabaseBackedSnippetRepo
+from src.snipster.db import query_budget
+from src.snipster.dedupe import DedupeMode, content_hash
+from src.snipster.exceptions import DuplicateSnippetError, SnippetNotFoundError
+from src.snipster.index import FuzzyIndex
+from src.snipster.models import CodeBlob, Language, Snippet, SnippetCreate
+from src.snipster.repo import DatabaseBackedSnippetRepo
 
 from .conftest import add_search_data
 
@@ -46,6 +56,40 @@ def test_repo_list(snippet, another_snippet, repo):
     assert len(list) == 2
 
 
+def test_repo_list_pages(repo, sample_snippets):
+    for data in sample_snippets * 2:
+        repo.add(SnippetCreate(**data))
+    ids = [s.id for s in repo.list()]
+    assert ids == sorted(ids)
+
+    first_page = repo.list(limit=4)
+    assert [s.id for s in first_page] == ids[:4]
+    second_page = repo.list(limit=4, after=first_page[-1].id)
+    assert [s.id for s in second_page] == ids[4:]
+    assert repo.list(limit=4, after=ids[-1]) == []
+    assert [s.id for s in repo.list(after=ids[2])] == ids[3:]
+
+
+def test_repo_list_summaries(repo, sample_snippets):
+    for data in sample_snippets:
+        repo.add(SnippetCreate(**data))
+    repo.add(
+        SnippetCreate(title="Big One", code="x = 1\n" * 1000, language=Language.python)
+    )
+
+    summaries = repo.list_summaries()
+    assert [s.title for s in summaries] == [s.title for s in repo.list()]
+    assert not hasattr(summaries[0], "code")
+    assert summaries[0].tags == ["beginner", "basics"]
+    assert summaries[0].preview == "print('Hello, world!')"
+    assert summaries[-1].preview == ("x = 1\n" * 1000)[:80]
+
+    page = repo.list_summaries(limit=2, after=summaries[0].id, preview_length=5)
+    assert [s.id for s in page] == [s.id for s in summaries[1:3]]
+    assert page[0].preview == "const"
+    assert repo.list_summaries(preview_length=0)[0].preview is None
+
+
 def test_repo_delete(snippet, repo):
     repo.add(snippet)
     list = repo.list()
@@ -71,6 +115,26 @@ def test_repo_toggle_favorite(snippet, repo):
         repo.toggle_favorite(9999)
 
 
+def test_repo_add_many(repo, sample_snippets):
+    existing = repo.add(SnippetCreate(**sample_snippets[0]))
+    ids = repo.add_many([SnippetCreate(**data) for data in sample_snippets])
+    assert ids == [existing.id + 1, existing.id + 2, existing.id + 3]
+    assert [repo.get(i).title for i in ids] == [s["title"] for s in sample_snippets]
+    assert [s.id for s in repo.list(tag="beginner")] == [existing.id, ids[0], ids[2]]
+    assert [s.id for s in repo.search("Array")] == [ids[1]]
+    assert repo.add_many([]) == []
+
+
+def test_db_repo_add_many_query_budget(db_repo, sample_snippets):
+    # Rows with and without descriptions, interleaved, still share one INSERT
+    snippets = [
+        SnippetCreate(**{**data, "description": data["description"] if n % 2 else None})
+        for n, data in enumerate(sample_snippets * 20)
+    ]
+    with query_budget(5):
+        assert len(db_repo.add_many(snippets)) == 60
+
+
 def test_repo_add_tag(snippet, repo):
     stored_snippet = repo.add(snippet)
     repo.add_tag(stored_snippet.id, "foo")
@@ -100,6 +164,265 @@ def test_repo_search(repo):
     assert len(repo.search("zap")) == 0
 
 
+def test_repo_list_by_tag(repo, sample_snippets):
+    ids = [repo.add(SnippetCreate(**data)).id for data in sample_snippets]
+
+    assert [s.id for s in repo.list(tag="beginner")] == [ids[0], ids[2]]
+    assert [s.id for s in repo.list(tag=" Beginner ")] == [ids[0], ids[2]]
+    assert [s.id for s in repo.list(tag="begin")] == []
+    assert [s.id for s in repo.list(tag="beginner", limit=1)] == [ids[0]]
+    assert [s.id for s in repo.list(tag="beginner", after=ids[0])] == [ids[2]]
+    assert [s.title for s in repo.list_summaries(tag="array")] == ["Array Map"]
+
+    repo.add_tag(ids[1], "Beginner")
+    assert [s.id for s in repo.list(tag="beginner")] == ids
+    assert repo.get(ids[1]).tags == ["array", "functional", "beginner"]
+    repo.remove_tag(ids[0], "BEGINNER")
+    assert [s.id for s in repo.list(tag="beginner")] == ids[1:]
+    repo.delete(ids[2])
+    assert [s.id for s in repo.list(tag="beginner")] == [ids[1]]
+
+
+def test_repo_add_and_remove_tags(snippet, repo):
+    stored_snippet = repo.add(snippet)
+    updated = repo.add_tags(stored_snippet.id, ["Web", "web ", "", "api"])
+    assert updated.tags == ["web", "api"]
+    assert repo.add_tags(stored_snippet.id, ["API"]).tags == ["web", "api"]
+    assert [s.id for s in repo.list(tag="api")] == [stored_snippet.id]
+
+    # Tags the snippet doesn't have are skipped rather than an error
+    updated = repo.remove_tags(stored_snippet.id, ["WEB", "missing"])
+    assert updated.tags == ["api"]
+    assert repo.list(tag="web") == []
+    with pytest.raises(SnippetNotFoundError):
+        repo.add_tags(9999, ["test"])
+    with pytest.raises(SnippetNotFoundError):
+        repo.remove_tags(9999, ["test"])
+
+
+def test_repo_tags_many(repo, sample_snippets):
+    ids = [repo.add(SnippetCreate(**data)).id for data in sample_snippets]
+
+    updated = repo.add_tags_to_many([ids[2], ids[0], ids[2]], ["shared", "Basics"])
+    assert [s.id for s in updated] == [ids[2], ids[0]]
+    assert repo.get(ids[0]).tags == ["beginner", "basics", "shared"]
+    assert repo.get(ids[2]).tags == ["beginner", "shared", "basics"]
+    assert [s.id for s in repo.list(tag="shared")] == [ids[0], ids[2]]
+    assert [s.id for s in repo.search("shared")] == [ids[0], ids[2]]
+
+    updated = repo.remove_tags_from_many(ids, ["shared"])
+    assert [s.tags for s in updated] == [
+        ["beginner", "basics"],
+        ["array", "functional"],
+        ["beginner", "basics"],
+    ]
+    assert repo.list(tag="shared") == []
+
+    # One missing id means nothing is written
+    with pytest.raises(SnippetNotFoundError):
+        repo.add_tags_to_many([ids[0], 9999], ["partial"])
+    assert repo.get(ids[0]).tags == ["beginner", "basics"]
+    assert repo.list(tag="partial") == []
+
+
+def test_repo_version(snippet, repo):
+    versions = [repo.version()]
+    stored_snippet = repo.add(snippet)
+    versions.append(repo.version())
+    repo.toggle_favorite(stored_snippet.id)
+    versions.append(repo.version())
+    repo.add_tags(stored_snippet.id, ["versioned"])
+    versions.append(repo.version())
+    # Writes that change nothing leave the version alone
+    repo.add_tags(stored_snippet.id, ["versioned"])
+    assert repo.version() == versions[-1]
+    repo.delete(stored_snippet.id)
+    versions.append(repo.version())
+    assert len(set(versions)) == len(versions)
+
+
+def test_repo_updates_stamp_updated_at(snippet, repo):
+    stored_snippet = repo.add(snippet)
+    assert repo.get(stored_snippet.id).updated_at is None
+    stamps = []
+    for update in (
+        lambda i: repo.toggle_favorite(i),
+        lambda i: repo.add_tag(i, "stamped"),
+        lambda i: repo.add_tags(i, ["again"]),
+        lambda i: repo.remove_tag(i, "stamped"),
+    ):
+        update(stored_snippet.id)
+        stamps.append(repo.get(stored_snippet.id).updated_at)
+    assert None not in stamps
+    assert stamps == sorted(stamps)
+
+
+def test_content_hash_ignores_whitespace():
+    assert content_hash("def f():\n    return 1\n", "python") == content_hash(
+        "def f():\r\n\treturn 1", "Python"
+    )
+    assert content_hash("return 1", "python") != content_hash("return 2", "python")
+    assert content_hash("x", "python") != content_hash("x", "rust")
+
+
+def test_repo_add_dedupe(snippet, repo):
+    stored_snippet = repo.add(snippet)
+    copy = snippet.model_copy(update={"title": "Copy", "code": f" {snippet.code}\n"})
+
+    assert repo.add(copy, DedupeMode.existing).id == stored_snippet.id
+    with pytest.raises(DuplicateSnippetError) as excinfo:
+        repo.add(copy, DedupeMode.reject)
+    assert excinfo.value.snippet_id == stored_snippet.id
+    assert len(repo.list()) == 1
+
+    assert repo.add(copy).id != stored_snippet.id
+    assert repo.ids_by_content_hash([content_hash(snippet.code, "python")]) == {
+        content_hash(snippet.code, "python"): stored_snippet.id
+    }
+
+
+def test_repo_merge_duplicates(repo):
+    def add(title, code, **fields):
+        return repo.add(
+            SnippetCreate(title=title, code=code, language=Language.python, **fields)
+        ).id
+
+    kept = add("First", "x = 1", tags=["one"])
+    other = add("Other", "y = 2")
+    copy = add("Copy", "x  =  1", description="Sets x", tags=["two"])
+    favorite = add("Favorite", "x = 1\n", favorite=True)
+
+    assert repo.merge_duplicates(dry_run=True) == [(kept, [copy, favorite])]
+    assert len(repo.list()) == 4
+
+    assert repo.merge_duplicates() == [(kept, [copy, favorite])]
+    assert [s.id for s in repo.list()] == [kept, other]
+    merged = repo.get(kept)
+    assert merged.title == "First"
+    assert merged.description == "Sets x"
+    assert merged.favorite
+    assert sorted(merged.tags) == ["one", "two"]
+    assert [s.id for s in repo.list(tag="two")] == [kept]
+    with pytest.raises(SnippetNotFoundError):
+        repo.get(copy)
+    assert repo.merge_duplicates() == []
+
+
+@pytest.fixture
+def small_blobs(monkeypatch):
+    monkeypatch.setattr(code_blobs, "COMPRESS_THRESHOLD", 100)
+    monkeypatch.setattr(code_blobs, "HEAD_LENGTH", 20)
+
+
+def generated_code(lines: int = 50) -> str:
+    return "\n".join(f"value_{i} = {i}" for i in range(lines))
+
+
+def test_repo_large_code_round_trips(repo, small_blobs):
+    code = generated_code()
+    stored_snippet = repo.add(
+        SnippetCreate(title="Generated", code=code, language=Language.python)
+    )
+    assert stored_snippet.code == code
+    [copy_id] = repo.add_many(
+        [SnippetCreate(title="Copy", code=code, language=Language.python)]
+    )
+
+    assert repo.get(copy_id).code == code
+    assert [s.code for s in repo.list()] == [code, code]
+    assert [s.code for s in repo.stream()] == [code, code]
+    # The start of the code is still searchable
+    assert [s.id for s in repo.search("value_1")] == [stored_snippet.id, copy_id]
+    assert repo.toggle_favorite(stored_snippet.id).code == code
+    assert repo.add_tags(stored_snippet.id, ["generated"]).code == code
+    [summary] = repo.list_summaries(limit=1, preview_length=10)
+    assert summary.preview == code[:10]
+
+
+def test_repo_searches_past_the_head(repo, monkeypatch):
+    monkeypatch.setattr(code_blobs, "COMPRESS_THRESHOLD", 5000)
+    code = "x = 1\n" * 1000 + "def unique_tail_marker(): pass\n"
+    assert code.index("unique_tail_marker") > code_blobs.HEAD_LENGTH
+    stored_snippet = repo.add(
+        SnippetCreate(title="Generated", code=code, language=Language.python)
+    )
+    # Both the full-text and the ILIKE queries, wildcards included
+    assert [s.id for s in repo.search("tail_marker")] == [stored_snippet.id]
+    assert [s.id for s in repo.search("tail marker")] == []
+    assert [s.id for s in repo.search("UNIQUE%marker")] == [stored_snippet.id]
+    assert [s.id for s in repo.search("(): pass")] == [stored_snippet.id]
+
+    # Found once when the head matches too, and among other matches
+    other = repo.add(
+        SnippetCreate(title="Marker", code="x = 2", language=Language.python)
+    )
+    assert [s.id for s in repo.search("x = 1")] == [stored_snippet.id]
+    assert [s.id for s in repo.search("marker")] == [stored_snippet.id, other.id]
+    assert repo.search("marker")[0].code == code
+
+    repo.delete(stored_snippet.id)
+    assert repo.search("(): pass") == []
+    assert repo.search("tail_marker") == []
+
+
+def test_db_repo_compresses_large_code(db_repo, small_blobs):
+    code = generated_code()
+    first = db_repo.add(SnippetCreate(title="First", code=code, language="python"))
+    second = db_repo.add(SnippetCreate(title="Second", code=code, language="python"))
+    db_repo.add(SnippetCreate(title="Small", code="x = 1", language="python"))
+
+    stmt = select(Snippet.code, Snippet.code_blob).order_by(Snippet.id)
+    rows = db_repo.session.exec(stmt).all()
+    assert rows[0] == (code[:20], code_blobs.digest(code))
+    assert rows[1] == rows[0]
+    assert rows[2] == ("x = 1", None)
+
+    def blob_count():
+        return db_repo.session.exec(select(func.count()).select_from(CodeBlob)).one()
+
+    # Shared until the last snippet using it is gone
+    assert blob_count() == 1
+    db_repo.delete(first.id)
+    assert blob_count() == 1
+    db_repo.delete(second.id)
+    assert blob_count() == 0
+
+
+def test_snippet_create_normalizes_tags():
+    snippet = SnippetCreate(
+        title="Tags",
+        code="x = 1",
+        language=Language.python,
+        tags=["Python", " python ", "", "Web"],
+    )
+    assert snippet.tags == ["python", "web"]
+
+
+def test_repo_search_tracks_changes(snippet, repo):
+    stored_snippet = repo.add(snippet)
+    assert len(repo.search("searchable")) == 0
+    repo.add_tag(stored_snippet.id, "searchable")
+    assert len(repo.search("searchable")) == 1
+    repo.remove_tag(stored_snippet.id, "searchable")
+    assert len(repo.search("searchable")) == 0
+    assert len(repo.search("my snip")) == 1
+    repo.delete(stored_snippet.id)
+    assert len(repo.search("my snip")) == 0
+
+
+def test_repo_search_substring_semantics(repo):
+    add_search_data(repo)
+    # Case-insensitive substrings, answered from the index
+    assert len(repo.search("FOO")) == 3
+    assert len(repo.search("int('ba")) == 2
+    assert len(repo.search("even more")) == 1
+    # Queries too short for trigrams, and ILIKE wildcards, behave like ILIKE
+    assert len(repo.search("ba")) == 2
+    assert len(repo.search("fo")) == 3
+    assert len(repo.search("b_z")) == 1
+    assert len(repo.search("super%oo")) == 1
+
+
 def test_repo_fuzzy_search(repo):
     # Test exact match
     snippet1 = SnippetCreate(
@@ -140,3 +463,140 @@ def test_repo_fuzzy_search(repo):
     # Test no match below threshold
     results = repo.fuzzy_search("Something Completely Different")
     assert len(results) == 0
+
+
+def test_repo_fuzzy_search_scored(repo, sample_snippets):
+    repo.add_many([SnippetCreate(**s) for s in sample_snippets])
+    results = repo.fuzzy_search_scored("Hello", limit=2, score_cutoff=50)
+    assert [s.title for s, _ in results] == ["Hello World", "Hello Rust"]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    assert all(50 <= score <= 100 for score in scores)
+    assert [s for s, _ in results] == list(
+        repo.fuzzy_search("Hello", limit=2, score_cutoff=50)
+    )
+
+
+def test_repo_fuzzy_search_fields(repo):
+    repo.add(
+        SnippetCreate(
+            title="Read File",
+            code="def parse_settings(path): return open(path).read()",
+            description="Load a configuration file from disk",
+            language=Language.python,
+            tags=["filesystem"],
+        )
+    )
+    repo.add(
+        SnippetCreate(
+            title="Read File",
+            code="fs.readFileSync(path)",
+            language=Language.javascript,
+        )
+    )
+    # Snippets sharing a title are both returned
+    assert len(repo.fuzzy_search("read file")) == 2
+    # Tags, descriptions and code identifiers are matched too
+    assert [s.language for s in repo.fuzzy_search("filesystem")] == ["python"]
+    assert [s.language for s in repo.fuzzy_search("configuration")] == ["python"]
+    assert [s.language for s in repo.fuzzy_search("parse_settings")] == ["python"]
+    assert len(repo.fuzzy_search("read file", limit=1)) == 1
+    assert len(repo.fuzzy_search("read fyle", score_cutoff=100)) == 0
+
+
+def test_db_repo_fuzzy_index_follows_other_writers(test_session_factory):
+    with (
+        test_session_factory.get_session() as session,
+        test_session_factory.get_session() as other_session,
+    ):
+        repo = DatabaseBackedSnippetRepo(session, fuzzy_index=FuzzyIndex())
+        # Stands in for another process, such as the CLI
+        other = DatabaseBackedSnippetRepo(other_session)
+        json = repo.add(
+            SnippetCreate(title="Parse JSON", code="x = 1", language="python")
+        )
+        hello = repo.add(
+            SnippetCreate(title="Hello World", code="x = 2", language="rust")
+        )
+        assert [s.id for s in repo.fuzzy_search("parse json")] == [json.id]
+        # Writes through the repo keep the index current by themselves
+        repo.add(SnippetCreate(title="Read File", code="x = 3", language="python"))
+        with query_budget(2):
+            assert len(repo.fuzzy_search("read file")) == 1
+
+        other.add_tags(json.id, ["yaml"])
+        other.add(SnippetCreate(title="Sort List", code="x = 4", language="python"))
+        assert [s.id for s in repo.fuzzy_search("yaml")] == [json.id]
+        assert len(repo.fuzzy_search("sort list")) == 1
+
+        other.delete(hello.id)
+        assert repo.fuzzy_search("hello world") == []
+        assert hello.id not in repo.fuzzy_index
+        with query_budget(2):
+            repo.fuzzy_search("parse json")
+
+
+def test_async_repo(test_async_session_factory, sample_snippets):
+    async def scenario():
+        async with test_async_session_factory.get_session() as session:
+            repo = AsyncDatabaseBackedSnippetRepo(session)
+            ids = await repo.add_many(
+                [SnippetCreate(**data) for data in sample_snippets]
+            )
+            created = await repo.add(SnippetCreate(**sample_snippets[0]))
+            assert created.id == ids[-1] + 1
+
+            assert [s.id for s in await repo.list(limit=2, after=ids[0])] == ids[1:]
+            summaries = await repo.list_summaries(tag="array")
+            assert [s.title for s in summaries] == ["Array Map"]
+            assert [s.id async for s in repo.stream(batch_size=2)] == [*ids, created.id]
+
+            assert (await repo.add_tags(ids[1], ["Shared"])).tags[-1] == "shared"
+            assert (await repo.toggle_favorite(ids[1])).favorite is False
+            assert [s.id for s in await repo.search("Array")] == [ids[1]]
+            found = await repo.fuzzy_search("array map")
+            assert found[0].id == ids[1]
+
+            await repo.delete(created.id)
+            with pytest.raises(SnippetNotFoundError):
+                await repo.get(created.id)
+
+    asyncio.run(scenario())
+
+
+def test_async_repo_cpu_work_leaves_the_loop(
+    test_async_session_factory, small_blobs, monkeypatch
+):
+    threads = []
+
+    def recording(function):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return function(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(code_blobs, "decompress", recording(code_blobs.decompress))
+    monkeypatch.setattr(FuzzyIndex, "apply", recording(FuzzyIndex.apply))
+    monkeypatch.setattr(FuzzyIndex, "search", recording(FuzzyIndex.search))
+
+    async def scenario():
+        async with test_async_session_factory.get_session() as session:
+            repo = AsyncDatabaseBackedSnippetRepo(session, fuzzy_index=FuzzyIndex())
+            code = generated_code()
+            created = await repo.add(
+                SnippetCreate(title="Generated", code=code, language=Language.python)
+            )
+            assert created.code == code
+            assert (await repo.get(created.id)).code == code
+            assert [s.code async for s in repo.stream()] == [code]
+            [found] = await repo.fuzzy_search("generated")
+            assert found.code == code
+            # Matching the blob's text, then inflating the result
+            [found] = await repo.search(code[-20:])
+            assert found.code == code
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(threads) == 8
+    assert loop_thread not in threads
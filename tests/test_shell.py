@@ -0,0 +1,126 @@
+import pytest
+from typer.testing import CliRunner
+
+import src.snipster.cli as cli_module
+from src.snipster.db import collect_queries
+from src.snipster.models import SnippetCreate
+
+app = cli_module.app
+
+runner = CliRunner()
+
+
+@pytest.fixture(autouse=True)
+def setup_test_db(test_session_factory, tmp_path, monkeypatch):
+    original = cli_module.cli_session_factory
+    cli_module.cli_session_factory = test_session_factory
+    monkeypatch.setenv("SNIPSTER_SNAPSHOT_PATH", str(tmp_path / "snapshot.sqlite"))
+    yield
+    cli_module.cli_session_factory = original
+
+
+@pytest.fixture
+def shell():
+    # _shell only needs the obj the top-level callback sets up
+    ctx = cli_module.typer.Context(cli_module.typer.main.get_command(app))
+    ctx.obj = {"console": cli_module.Console()}
+    with ctx:
+        yield cli_module._shell(ctx)
+
+
+def test_batch(tmp_path):
+    commands = tmp_path / "commands.txt"
+    commands.write_text(
+        "# Comments and blank lines are skipped\n"
+        "\n"
+        "add -t 'Batch One' -c 'print(1)' -l python\n"
+        "add -t 'Batch Two' -c 'print(2)' -l rust\n"
+        "tag 1 2 --tag batched\n"
+        "list --tag batched\n"
+    )
+    result = runner.invoke(app, ["batch", str(commands)])
+    assert result.exit_code == 0
+    assert "1: Batch One (python)" in result.stdout
+    assert "2: Batch Two (rust)" in result.stdout
+
+
+def test_batch_from_stdin_stops_at_failure():
+    lines = "get 99\nadd -t Never -c 'print(0)' -l python\n"
+    result = runner.invoke(app, ["batch"], input=lines)
+    assert result.exit_code == 1
+    assert "Line 1 failed: get 99" in result.stderr
+
+    result = runner.invoke(app, ["batch", "--keep-going"], input=lines)
+    assert result.exit_code == 1
+    assert "Added snippet: Never" in result.stdout
+
+
+def test_shell_runs_commands(shell, capsys):
+    assert shell.run("add -t Shell -c 'print(1)' -l python") == 0
+    assert shell.run("get 1") == 0
+    assert shell.run("get 2") == 1
+    assert shell.run("list --limit") == 2  # Missing option value
+    assert shell.run("shell") == 2
+    assert shell.run("'unterminated") == 2
+    assert shell.run("   ") == 0
+    assert "Shell" in capsys.readouterr().out
+
+
+def test_shell_keeps_fuzzy_index(shell, capsys, monkeypatch):
+    shell.run("add -t 'Parse JSON' -c 'print(1)' -l python")
+    shell.run("find json")
+    with collect_queries() as queries:
+        shell.run("find json")
+    # The index is already loaded, so only new rows and the matches are read
+    assert queries.count == 2
+    assert capsys.readouterr().out.count("1: Parse JSON") == 2
+
+    # A write leaves it loaded, and the next find adds just the new row
+    shell.run("add -t 'Parse YAML' -c 'print(2)' -l python")
+    index = shell.obj["fuzzy_index"]
+    monkeypatch.setattr(index, "load", lambda rows: pytest.fail("reloaded"))
+    shell.run("find parse")
+    assert shell.obj["fuzzy_index"] is index
+    out = capsys.readouterr().out
+    assert "Parse JSON" in out
+    assert "Parse YAML" in out
+
+
+def test_shell_fuzzy_index_follows_snapshot_refresh(shell, capsys, db_repo):
+    # Every read refreshes the snapshot first
+    shell.obj["snapshot"].settings.max_age = 0
+    shell.run("add -t 'Parse JSON' -c 'print(1)' -l python")
+    shell.run("snapshot")
+    shell.run("find parse")
+    assert "Parse JSON" in capsys.readouterr().out
+
+    # Written by another process, so only the refresh brings it in
+    db_repo.add(SnippetCreate(title="Parse YAML", code="print(2)", language="python"))
+    shell.run("find parse")
+    out = capsys.readouterr().out
+    assert "Parse JSON" in out
+    assert "Parse YAML" in out
+
+
+def test_shell_completions(shell):
+    shell.run("add -t One -c 'print(1)' -l python")
+    shell.run("add -t Two -c 'print(2)' -l python")
+    shell.run("tag 1 --tag first --tag fun")
+
+    assert shell.candidates("", "li") == ["list"]
+    assert "--offline" in shell.candidates("", "--")
+    assert shell.candidates("get ", "") == ["1", "2"]
+    assert shell.candidates("tag 1 --tag ", "f") == ["first", "fun"]
+    assert "--json" in shell.candidates("find json ", "--")
+
+    shell.run("delete 2")
+    assert shell.candidates("get ", "") == ["1"]
+
+
+def test_shell_repl(shell, tmp_path, capsys):
+    lines = iter(["add -t Repl -c 'print(1)' -l python", "list", "exit", "list"])
+    history = tmp_path / "history"
+    shell.repl(history=history, read=lambda prompt: next(lines))
+    out = capsys.readouterr().out
+    assert out.count("1: Repl (python)") == 1
+    assert history.exists()
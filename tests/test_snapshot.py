@@ -0,0 +1,152 @@
+import sqlite3
+from datetime import timedelta
+
+import pytest
+from sqlmodel import select
+
+from src.snipster.db import collect_queries, query_budget
+from src.snipster.models import CodeBlob, SnippetCreate
+from src.snipster.repo import DatabaseBackedSnippetRepo
+from src.snipster.snapshot import RefreshResult, Snapshot, SnapshotSettings
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    snapshot = Snapshot(SnapshotSettings(path=tmp_path / "cache" / "snapshot.sqlite"))
+    yield snapshot
+    snapshot.close()
+
+
+@pytest.fixture
+def local_repo(snapshot):
+    def open_repo() -> DatabaseBackedSnippetRepo:
+        return DatabaseBackedSnippetRepo(snapshot.session_factory().create_session())
+
+    return open_repo
+
+
+def test_first_refresh_copies_everything(
+    snapshot, local_repo, db_repo, test_session_factory, sample_snippets
+):
+    db_repo.add_many([SnippetCreate(**s) for s in sample_snippets])
+    assert not snapshot.exists()
+
+    assert snapshot.refresh(test_session_factory) == RefreshResult(3, 0)
+
+    local = local_repo()
+    assert [s.title for s in local.list()] == [s["title"] for s in sample_snippets]
+    beginner = local.list_summaries(tag="beginner")
+    assert [s.title for s in beginner] == ["Hello World", "Hello Rust"]
+    assert [s.title for s in local.search("Rust")] == ["Hello Rust"]
+
+
+def test_refresh_copies_only_changes(
+    snapshot, local_repo, db_repo, test_session_factory, sample_snippets, monkeypatch
+):
+    monkeypatch.setattr("src.snipster.snapshot.WATERMARK_OVERLAP", timedelta(0))
+    first, second, third = (db_repo.add(SnippetCreate(**s)) for s in sample_snippets)
+    snapshot.refresh(test_session_factory)
+
+    db_repo.toggle_favorite(first.id)
+    db_repo.add_tag(first.id, "Greeting")
+    db_repo.delete(second.id)
+    added = db_repo.add(SnippetCreate(**sample_snippets[1]))
+
+    # The changed and the new row, and the newest untouched one, whose time
+    # is the watermark itself
+    assert snapshot.refresh(test_session_factory) == RefreshResult(3, 1)
+
+    local = local_repo()
+    snippets = local.list()
+    assert [s.id for s in snippets] == [first.id, third.id, added.id]
+    assert snippets[0].favorite
+    assert [s.id for s in local.list(tag="greeting")] == [first.id]
+    assert [s.id for s in local.search("Array Map")] == [added.id]
+
+
+def test_refresh_compares_ids_only_where_rows_went(
+    snapshot, local_repo, db_repo, test_session_factory, monkeypatch
+):
+    monkeypatch.setattr("src.snipster.snapshot.BATCH_SIZE", 3)
+    for n in range(9):
+        db_repo.add(SnippetCreate(title=f"Row {n}", code="print(1)", language="python"))
+    snapshot.refresh(test_session_factory)
+
+    # Ids 1-2, 3-5 and 6-8 are told apart by their counts; 3-5 loses them all
+    for snippet_id in (1, 3, 4, 5):
+        db_repo.delete(snippet_id)
+    with collect_queries("refresh") as queries:
+        assert snapshot.refresh(test_session_factory).removed == 4
+    assert any("GROUP BY" in statement for statement in queries.statements)
+    assert [s.id for s in local_repo().list()] == [2, 6, 7, 8, 9]
+
+    # Without a deletion the counts settle it, with no ids read
+    db_repo.toggle_favorite(2)
+    with collect_queries("refresh") as queries:
+        assert snapshot.refresh(test_session_factory).removed == 0
+    assert not any("GROUP BY" in statement for statement in queries.statements)
+
+
+def test_unchanged_refresh_only_checks_version(snapshot, db_repo, test_session_factory):
+    db_repo.add(SnippetCreate(title="Cached", code="print(1)", language="python"))
+    snapshot.refresh(test_session_factory)
+
+    # The version check on the primary, plus reading and saving local state
+    with query_budget(4):
+        assert snapshot.refresh(test_session_factory) == RefreshResult(0, 0)
+
+
+def test_freshness(snapshot, test_session_factory):
+    assert not snapshot.is_fresh()
+    snapshot.refresh(test_session_factory)
+    assert snapshot.is_fresh()
+
+    snapshot.mark_stale()
+    assert not snapshot.is_fresh()
+    snapshot.refresh(test_session_factory)
+    snapshot.settings.max_age = 0
+    assert not snapshot.is_fresh()
+
+
+def test_clear(snapshot, test_session_factory):
+    snapshot.refresh(test_session_factory)
+    assert snapshot.exists()
+    snapshot.clear()
+    assert not snapshot.exists()
+    # Marking a missing snapshot stale doesn't create one
+    snapshot.mark_stale()
+    assert not snapshot.exists()
+
+
+def test_outdated_schema_is_rebuilt(
+    snapshot, local_repo, db_repo, test_session_factory
+):
+    db_repo.add(SnippetCreate(title="Hashed", code="print(1)", language="python"))
+    snapshot.path.parent.mkdir(parents=True)
+    with sqlite3.connect(snapshot.path) as connection:
+        connection.execute("CREATE TABLE snippet (id INTEGER PRIMARY KEY)")
+    connection.close()
+
+    assert snapshot.refresh(test_session_factory) == RefreshResult(1, 0)
+    assert [s.title for s in local_repo().list()] == ["Hashed"]
+
+
+def test_refresh_copies_compressed_code(
+    snapshot, local_repo, db_repo, test_session_factory, monkeypatch
+):
+    monkeypatch.setattr("src.snipster.code_blobs.COMPRESS_THRESHOLD", 100)
+    monkeypatch.setattr("src.snipster.code_blobs.HEAD_LENGTH", 20)
+    code = "\n".join(f"value_{i} = {i}" for i in range(50))
+    kept = db_repo.add(SnippetCreate(title="Large", code=code, language="python"))
+    removed = db_repo.add(SnippetCreate(title="Other", code=code * 2, language="rust"))
+    snapshot.refresh(test_session_factory)
+    assert local_repo().get(kept.id).code == code
+    # Searchable past the head in the snapshot too
+    assert len(local_repo().search("value_49")) == 2
+    assert len(local_repo().search("49 = 49")) == 2
+
+    db_repo.delete(removed.id)
+    snapshot.refresh(test_session_factory)
+    local = local_repo()
+    assert [s.code for s in local.list()] == [code]
+    assert len(local.session.exec(select(CodeBlob.digest)).all()) == 1
@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+# Snippet bodies kept for revalidation; the least recently selected go first
+CODE_CACHE_SIZE = 50
 
 
 class State(rx.State):
@@ -14,6 +16,13 @@ class State(rx.State):
     search_query: str = ""
     show_add_form: bool = False
     selected_snippet_id: int = 0
+    # The list only carries previews; the full body is fetched on selection
+    selected_code: str = ""
+    # ETag of the listing in `snippets`, empty while it holds search results
+    snippets_etag: str = ""
+    # Snippet id -> (ETag, code), so reselecting revalidates instead of
+    # refetching; kept in least recently selected order
+    _code_cache: dict[int, tuple[str, str]] = {}
 
     # Form fields
     new_title: str = ""
@@ -30,7 +39,10 @@ class State(rx.State):
                         f"{API_BASE_URL}/search", params={"q": query}
                     )
                     if response.status_code == 200:
-                        self.snippets = response.json()
+                        self.snippets = [
+                            {**s, "preview": s["code"][:80]} for s in response.json()
+                        ]
+                        self.snippets_etag = ""
             else:
                 await self.load_all_snippets()
         except Exception:
@@ -38,21 +50,53 @@ class State(rx.State):
 
     async def load_all_snippets(self):
         try:
+            # A 304 means the listing already shown is current
+            headers = (
+                {"If-None-Match": self.snippets_etag} if self.snippets_etag else {}
+            )
             async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/snippets")
+                response = await client.get(
+                    f"{API_BASE_URL}/snippets",
+                    params={"view": "summary"},
+                    headers=headers,
+                )
                 if response.status_code == 200:
                     self.snippets = response.json()
+                    self.snippets_etag = response.headers.get("etag", "")
         except Exception:
             self.snippets = []
+            self.snippets_etag = ""
 
     def toggle_add_form(self):
         self.show_add_form = not self.show_add_form
 
-    def select_snippet(self, snippet_id: int):
+    async def select_snippet(self, snippet_id: int):
         if self.selected_snippet_id == snippet_id:
             self.selected_snippet_id = 0
-        else:
-            self.selected_snippet_id = snippet_id
+            self.selected_code = ""
+            return
+        self.selected_snippet_id = snippet_id
+        self.selected_code = ""
+        # Popped and put back below, which moves it to the most recent end
+        etag, code = self._code_cache.pop(snippet_id, ("", ""))
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.get(
+                    f"{API_BASE_URL}/snippets/{snippet_id}",
+                    headers={"If-None-Match": etag} if etag else {},
+                )
+                if response.status_code == 304:
+                    self.selected_code = code
+                elif response.status_code == 200:
+                    self.selected_code = response.json()["code"]
+                    etag = response.headers.get("etag", "")
+                else:
+                    return
+            self._code_cache[snippet_id] = (etag, self.selected_code)
+            while len(self._code_cache) > CODE_CACHE_SIZE:
+                del self._code_cache[next(iter(self._code_cache))]
+        except Exception:
+            pass
 
     async def add_snippet(self):
         if not self.new_title.strip() or not self.new_code.strip():
@@ -144,7 +188,7 @@ def snippet_card(snippet: dict):
                 State.selected_snippet_id == snippet.get("id"),
                 rx.vstack(
                     rx.code_block(
-                        snippet["code"],
+                        State.selected_code,
                         language=snippet.get("language", "text"),
                         show_line_numbers=True,
                     ),
@@ -160,7 +204,7 @@ def snippet_card(snippet: dict):
                     width="100%",
                     spacing="2",
                 ),
-                rx.text(snippet["code"], size="2", color="gray"),
+                rx.text(snippet["preview"], size="2", color="gray"),
             ),
             spacing="2",
             width="100%",